@@ -0,0 +1,122 @@
+# benchmarks/bench_candidates.py
+"""
+Two-stage matching (CANDIDATES / EARLY_EXIT in src/dsp.py) vs aligning every song.
+
+    python benchmarks/bench_candidates.py
+    python benchmarks/bench_candidates.py --distractors 0 20000 --top-n 10 50 --early-exit 1 0.5 --json cand.json
+
+1. Fingerprints a seeded synthetic catalog (synth.py) and fingerprints
+   --queries noisy clips per SNR once.
+2. Grows the index with --distractors fake songs. Each one is a random
+   sample of hashes from a few real songs at random times: it shares
+   landmarks with the catalog (so it collects votes) but never lines up,
+   which is what most of a large catalog looks like to a query.
+3. For every index size gathers each clip's votes once, then times voting
+   with song_alignments (every song) and with candidate_alignments for each
+   (--top-n, --early-exit) pair. Reports top-1 accuracy, answers that differ
+   from the exhaustive ones, songs and votes put through the offset
+   histograms, and voting ms p50/p95.
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, HOP, MIN_MATCHES, gather_postings, song_alignments, candidate_alignments, pick_best
+from benchmarks.synth import make_catalog, catalog_inv, fingerprint, query_rng, add_noise
+
+
+def add_distractors(inv, n, n_songs, song_seconds, seed, mix=3, frac=0.2):
+    """Add n fake songs (IDs from n_songs up) built from hashes of `mix` real songs at random times."""
+    rng = np.random.default_rng([seed, 7])
+    by_song = {}
+    for h, entries in inv.items():
+        for sid, _ in entries:
+            by_song.setdefault(int(sid), []).append(h)
+    real = sorted(by_song)
+    out = {h: list(v) for h, v in inv.items()}
+    for k in range(n):
+        sid = n_songs + k
+        for src in rng.choice(real, mix, replace=False):
+            hs = by_song[src]
+            for i in rng.choice(len(hs), int(len(hs) * frac), replace=False):
+                t = rng.integers(0, int(song_seconds * SR / HOP)) * HOP / SR
+                out[hs[i]].append([sid, t])
+    return out
+
+
+def run_config(votes, top_n, early_exit):
+    rows = []
+    for _, _, sids, offs in votes:
+        t0 = time.perf_counter()
+        if top_n is None and early_exit is None:
+            songs, align, total = song_alignments(sids, offs)
+        else:
+            songs, align, total = candidate_alignments(sids, offs, top_n=top_n or 0, early_exit=early_exit or 0)
+        best, best_align, _ = pick_best(songs, align, total)
+        ms = (time.perf_counter() - t0) * 1000
+        aligned_votes = int(np.isin(sids, songs).sum())
+        rows.append((best if best_align >= MIN_MATCHES else None, ms, len(songs), aligned_votes))
+    return rows
+
+
+def run(args):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed, common=args.common)
+    inv, _ = catalog_inv(catalog)
+    rng = query_rng(args.seed)
+    queries = []
+    for snr in args.snr:
+        for _ in range(args.queries):
+            sid, audio = catalog[rng.integers(len(catalog))]
+            start = rng.integers(0, len(audio) - int(args.clip_seconds * SR))
+            queries.append((snr, sid, fingerprint(add_noise(audio[start:start + int(args.clip_seconds * SR)], snr, rng))))
+
+    configs = [(None, None)] + [(n, e) for n in args.top_n for e in args.early_exit]
+    results = []
+    for n_dis in args.distractors:
+        big = add_distractors(inv, n_dis, args.songs, args.song_seconds, args.seed) if n_dis else inv
+        votes = [(snr, sid, *gather_postings(big, q, budget=0)) for snr, sid, q in queries]
+        print(f"\n{args.songs + n_dis:,} songs: {np.mean([len(v[2]) for v in votes]):,.0f} votes, "
+              f"{np.mean([len(np.unique(v[2])) for v in votes]):,.0f} songs hit per query (mean)")
+        print(f"   {'top-n':>6} {'exit':>5}  {'top-1':>6}  {'differ':>6}  {'songs aligned':>13}  {'votes aligned':>13}  {'ms p50':>7}  {'ms p95':>7}")
+        ref = None
+        for top_n, early_exit in configs:
+            run_config(votes[:3], top_n, early_exit)                # warm-up
+            rows = run_config(votes, top_n, early_exit)
+            preds = [r[0] for r in rows]
+            ref = preds if ref is None else ref
+            ms = np.array([r[1] for r in rows])
+            r = {"songs": args.songs + n_dis, "top_n": top_n, "early_exit": early_exit,
+                 "top1": round(float(np.mean([p == v[1] for p, v in zip(preds, votes)])), 4),
+                 "differ_from_all": int(sum(p != q for p, q in zip(preds, ref))),
+                 "songs_aligned": round(float(np.mean([r[2] for r in rows])), 1),
+                 "votes_aligned": round(float(np.mean([r[3] for r in rows])), 1),
+                 "ms_p50": round(float(np.percentile(ms, 50)), 3), "ms_p95": round(float(np.percentile(ms, 95)), 3)}
+            results.append(r)
+            label = ("all", "-") if top_n is None and early_exit is None else (str(top_n or "-"), str(early_exit or "-"))
+            print(f"   {label[0]:>6} {label[1]:>5}  {r['top1']:6.1%}  {r['differ_from_all']:6d}  {r['songs_aligned']:13,.1f}  "
+                  f"{r['votes_aligned']:13,.0f}  {r['ms_p50']:7.2f}  {r['ms_p95']:7.2f}", flush=True)
+    return {"args": vars(args), "grid": results}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Two-stage candidate matching vs aligning every song")
+    ap.add_argument("--songs", type=int, default=100)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--common", type=float, default=0.0, help="level of the motif shared by all songs (0 = none)")
+    ap.add_argument("--distractors", type=int, nargs="+", default=[0, 5000])
+    ap.add_argument("--queries", type=int, default=30, help="clips per SNR")
+    ap.add_argument("--clip-seconds", type=float, default=5.0)
+    ap.add_argument("--snr", type=float, nargs="+", default=[10, 0])
+    ap.add_argument("--top-n", type=int, nargs="+", default=[0, 50, 10], help="0 = no cap")
+    ap.add_argument("--early-exit", type=float, nargs="+", default=[1.0, 0.0], help="0 = off")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
@@ -0,0 +1,95 @@
+# benchmarks/bench_decode.py
+"""
+Per-request decode overhead: old temp-file + ffmpeg round trip vs in-memory decode.
+
+    python benchmarks/bench_decode.py --runs 50
+
+Old path: write upload to tmp_uploads/, ffmpeg -> 44.1 kHz WAV file, torchaudio.load,
+delete both files, resample to SR. New path: src.server.decode.decode_bytes on the
+bytes. Both end with mono float samples at SR. A webm/opus clip is included when
+ffmpeg is available to create one; for it, the two fallback decoders are also timed
+on their own: an ffmpeg subprocess per upload vs in-process PyAV (SONAR_DECODER).
+"""
+import os, sys, io, time, uuid, shutil, tempfile, argparse, subprocess, importlib.util
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+from scipy.io.wavfile import write
+
+from src.dsp import SR
+from src.server import decode
+from src.server.decode import decode_bytes
+
+
+def make_clips(seconds=7, sr=44100):
+    t = np.arange(int(seconds * sr)) / sr
+    x = (0.3 * np.sin(2 * np.pi * 440 * t) + 0.05 * np.random.default_rng(0).standard_normal(len(t)))
+    buf = io.BytesIO()
+    write(buf, sr, x.astype(np.float32))
+    clips = {"wav": buf.getvalue()}
+    if shutil.which("ffmpeg"):
+        proc = subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                               "-c:a", "libopus", "-f", "webm", "pipe:1"],
+                              input=clips["wav"], capture_output=True)
+        if proc.returncode == 0:
+            clips["webm"] = proc.stdout
+    return clips
+
+
+def old_path(data, ext, tmp_dir):
+    temp_raw = os.path.join(tmp_dir, f"{uuid.uuid4()}.{ext}")
+    temp_wav = os.path.join(tmp_dir, f"{uuid.uuid4()}.wav")
+    with open(temp_raw, "wb") as f:
+        f.write(data)
+    subprocess.run(["ffmpeg", "-y", "-i", temp_raw, "-ar", "44100", "-ac", "1", temp_wav],
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    import torchaudio
+    try:
+        wav, sr = torchaudio.load(temp_wav)
+        return torchaudio.functional.resample(wav, sr, SR)
+    finally:
+        os.remove(temp_raw)
+        os.remove(temp_wav)
+
+
+def timed(fn, runs):
+    fn()   # warm-up
+    ts = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        ts.append((time.perf_counter() - t0) * 1000)
+    return np.median(ts), np.percentile(ts, 95)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=30)
+    args = ap.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for ext, data in make_clips().items():
+            print(f"📦 {ext}: {len(data) / 1024:.0f} KiB")
+            if shutil.which("ffmpeg") and importlib.util.find_spec("torchaudio"):
+                p50, p95 = timed(lambda: old_path(data, ext, tmp_dir), args.runs)
+                print(f"   old (temp files + ffmpeg) : p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+            else:
+                print("   old (temp files + ffmpeg) : skipped, needs ffmpeg and torchaudio")
+            p50, p95 = timed(lambda: decode_bytes(data), args.runs)
+            print(f"   {'new (in-memory, ' + decode.DECODER + ')':<26}: p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+            if ext == "wav":
+                continue
+            p50, p95 = timed(lambda: decode._decode_ffmpeg(data), args.runs)
+            print(f"   ffmpeg subprocess         : p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+            if decode.av is not None:
+                p50, p95 = timed(lambda: decode._decode_av(data), args.runs)
+                print(f"   PyAV in-process           : p50 {p50:7.1f} ms   p95 {p95:7.1f} ms")
+            else:
+                print("   PyAV in-process           : skipped, pip install av")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
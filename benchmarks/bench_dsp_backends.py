@@ -0,0 +1,154 @@
+# benchmarks/bench_dsp_backends.py
+"""
+Parity + cost of the DSP backends (DSP_BACKEND = "torch" vs "numpy").
+
+    python benchmarks/bench_dsp_backends.py
+    python benchmarks/bench_dsp_backends.py --songs 30 --json backends.json
+
+1. Parity: seeded noisy clips at several input sample rates go through both
+   backends; reports the largest dB difference on audible pixels and the
+   Jaccard overlap of peaks and hashes (must reach --min-jaccard).
+2. Matching: a synthetic catalog is indexed with the torch backend; queries
+   are fingerprinted with each backend and must give the same song and
+   aligned-hash count against that index.
+3. Cost: for each backend a fresh process imports src.dsp, warms up and
+   fingerprints --repeat clips; reports import + warm-up time, peak RSS and
+   ms per clip.
+
+Exits with 1 if the backends disagree, so it can gate a CI job.
+"""
+import os, sys, json, time, argparse, subprocess
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+import src.dsp as dsp
+from src.dsp import SR, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks, gather_postings, best_alignment
+from benchmarks.synth import make_song, make_catalog, query_rng, add_noise, build_catalog_index
+
+BACKENDS = ["torch", "numpy"]
+
+COST_SNIPPET = """
+import sys, time
+t0 = time.perf_counter()
+import numpy as np
+from src.dsp import warm_up, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks
+warm_up()
+ready = time.perf_counter() - t0
+rng = np.random.default_rng(0)
+clips = [rng.standard_normal(int(44100 * {seconds})).astype(np.float32)[None, :] for _ in range({repeat})]
+t1 = time.perf_counter()
+for c in clips:
+    hashes_from_peaks(peak_coords(spectrogram_db_from_tensor(c, 44100)))
+per_clip = (time.perf_counter() - t1) / len(clips)
+hwm_kb = [l.split()[1] for l in open("/proc/self/status") if l.startswith("VmHWM")][0]
+print(ready, per_clip, hwm_kb, "torch" in sys.modules)
+"""
+
+
+def fingerprint(backend, audio, sr):
+    dsp.DSP_BACKEND = backend
+    S_db = spectrogram_db_from_tensor(audio[None, :], sr)
+    peaks = peak_coords(S_db)
+    return S_db, peaks, hashes_from_peaks(peaks)
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / max(1, len(a | b))
+
+
+def parity(args):
+    from scipy.signal import resample_poly
+    rng = query_rng(args.seed)
+    rows = []
+    for sr in args.rates:
+        for i in range(args.clips):
+            audio = add_noise(make_song(args.seconds, [args.seed, 2, i]), args.snr, rng)
+            if sr != SR:      # pretend the clip was recorded at sr
+                audio = resample_poly(audio, sr, SR).astype(np.float32)
+            S0, p0, h0 = fingerprint("torch", audio, sr)
+            S1, p1, h1 = fingerprint("numpy", audio, sr)
+            audible = S0 > dsp.AMP_DB_MIN - 10
+            rows.append({"sr": sr, "clip": i, "shape_ok": S0.shape == S1.shape,
+                         "max_db_diff": round(float(np.abs(S0 - S1)[audible].max()), 4) if S0.shape == S1.shape else None,
+                         "peaks_jaccard": round(jaccard(map(tuple, p0), map(tuple, p1)), 4),
+                         "hashes_jaccard": round(jaccard([h for h, _ in h0], [h for h, _ in h1]), 4)})
+        r = [x for x in rows if x["sr"] == sr]
+        print(f"   {sr:>6} Hz: max |ΔdB| {max(x['max_db_diff'] or 0 for x in r):.4f}  "
+              f"peaks J {min(x['peaks_jaccard'] for x in r):.4f}  hashes J {min(x['hashes_jaccard'] for x in r):.4f}", flush=True)
+    return rows
+
+
+def matching(args, tmp):
+    from src.flat_index import load_flat_index
+    dsp.DSP_BACKEND = "torch"
+    catalog = make_catalog(args.songs, 30.0, seed=args.seed)
+    build_catalog_index(os.path.join(tmp, "flat"), catalog)
+    inv, _ = load_flat_index(os.path.join(tmp, "flat"))
+    rng = query_rng(args.seed)
+    rows = []
+    for _ in range(args.queries):
+        sid, audio = catalog[rng.integers(len(catalog))]
+        start = rng.integers(0, len(audio) - 5 * SR)
+        clip = add_noise(audio[start:start + 5 * SR], args.snr, rng)
+        res = {}
+        for b in BACKENDS:
+            _, _, qh = fingerprint(b, clip, SR)
+            res[b] = best_alignment(*gather_postings(inv, qh))[:2]
+        rows.append({"sid": sid, **{b: list(v) for b, v in res.items()}, "same": res["torch"] == res["numpy"]})
+    same = sum(r["same"] for r in rows)
+    print(f"   {same}/{len(rows)} queries give the same (song, aligned hashes) with both backends")
+    return rows
+
+
+def cost(backend, args):
+    env = {**os.environ, "SONAR_DSP_BACKEND": backend, "SONAR_PEAK_ENGINE": "scipy"}
+    t0 = time.time()
+    out = subprocess.run([sys.executable, "-c", COST_SNIPPET.format(seconds=args.seconds, repeat=args.repeat)],
+                         capture_output=True, text=True, env=env, cwd=os.path.abspath("."))
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    ready, per_clip, hwm_kb, torch_loaded = out.stdout.split()
+    return {"backend": backend, "process_s": round(time.time() - t0, 2), "ready_s": round(float(ready), 3),
+            "ms_per_clip": round(float(per_clip) * 1000, 2), "peak_rss_mib": round(int(hwm_kb) / 1024, 1),
+            "torch_imported": torch_loaded == "True"}
+
+
+if __name__ == "__main__":
+    import tempfile, shutil
+    ap = argparse.ArgumentParser(description="torch vs numpy DSP backend: parity and cost")
+    ap.add_argument("--rates", type=int, nargs="+", default=[22050, 44100, 48000, 16000], help="input sample rates")
+    ap.add_argument("--clips", type=int, default=5, help="parity clips per sample rate")
+    ap.add_argument("--seconds", type=float, default=7.0)
+    ap.add_argument("--snr", type=float, default=10.0)
+    ap.add_argument("--songs", type=int, default=20)
+    ap.add_argument("--queries", type=int, default=20)
+    ap.add_argument("--repeat", type=int, default=20, help="clips per backend in the cost run")
+    ap.add_argument("--min-jaccard", type=float, default=0.999)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    print("🔍 Parity (torch vs numpy):")
+    report = {"parity": parity(args)}
+    print("🎯 Matching against a torch-built index:")
+    tmp = tempfile.mkdtemp(prefix="sonar_backends_")
+    try:
+        report["matching"] = matching(args, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    print(f"⏱️ Cost per fresh process ({args.seconds:.0f} s clips at 44.1 kHz):")
+    report["cost"] = [cost(b, args) for b in BACKENDS]
+    for c in report["cost"]:
+        print(f"   {c['backend']:<6} ready in {c['ready_s']:.2f}s, {c['ms_per_clip']:.1f} ms/clip, "
+              f"peak RSS {c['peak_rss_mib']:.0f} MiB, torch imported: {c['torch_imported']}")
+
+    ok = (all(r["shape_ok"] and r["peaks_jaccard"] >= args.min_jaccard and r["hashes_jaccard"] >= args.min_jaccard
+              for r in report["parity"]) and all(r["same"] for r in report["matching"]))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
+    print("✅ Backends agree" if ok else "❌ Backends disagree")
+    sys.exit(0 if ok else 1)
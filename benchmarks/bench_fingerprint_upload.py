@@ -0,0 +1,100 @@
+# benchmarks/bench_fingerprint_upload.py
+"""
+Fingerprint uploads (src/wire.py) vs audio uploads: payload size and server work.
+
+    python benchmarks/bench_fingerprint_upload.py
+    python benchmarks/bench_fingerprint_upload.py --songs 100 --queries 50 --clip-seconds 7 --json wire.json
+
+1. Fingerprints a seeded synthetic catalog (synth.py) into an in-memory index.
+2. Cuts --queries noisy clips and encodes each one as 44.1 kHz WAV, as
+   webm/opus when ffmpeg is available, and as wire fingerprints (raw and deflated).
+3. Times the server side of each: decode_bytes + STFT + peaks + hashing +
+   lookup + voting for audio, decode_qhashes + lookup + voting for fingerprints.
+   Checks that both give the same answer.
+"""
+import os, sys, json, time, shutil, argparse, subprocess
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks, gather_postings, best_alignment
+from src.server.decode import decode_bytes
+from src.wire import encode_audio, decode_qhashes
+from benchmarks.synth import make_catalog, catalog_inv, query_rng, add_noise, wav_bytes
+
+
+def to_webm(wav):
+    proc = subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                           "-c:a", "libopus", "-f", "webm", "pipe:1"], input=wav, capture_output=True)
+    return proc.stdout if proc.returncode == 0 else None
+
+
+def serve_audio(inv, data):
+    wav, sr = decode_bytes(data)
+    qhashes = hashes_from_peaks(peak_coords(spectrogram_db_from_tensor(wav, sr)))
+    return best_alignment(*gather_postings(inv, qhashes))[:2]
+
+
+def serve_fingerprint(inv, data):
+    return best_alignment(*gather_postings(inv, decode_qhashes(data)))[:2]
+
+
+def run(args):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed)
+    inv, _ = catalog_inv(catalog)
+    rng = query_rng(args.seed)
+    n = int(args.clip_seconds * SR)
+    payloads = {"wav_44k": [], "webm": [], "fp_raw": [], "fp_zlib": []}
+    for _ in range(args.queries):
+        _, audio = catalog[rng.integers(len(catalog))]
+        a = rng.integers(0, len(audio) - n)
+        clip = add_noise(audio[a:a + n], args.snr, rng)
+        clip44 = np.interp(np.arange(int(len(clip) * 44100 / SR)) * SR / 44100, np.arange(len(clip)), clip)
+        payloads["wav_44k"].append(wav_bytes(clip44.astype(np.float32), 44100))
+        if shutil.which("ffmpeg"):
+            webm = to_webm(payloads["wav_44k"][-1])
+            if webm:
+                payloads["webm"].append(webm)
+        payloads["fp_raw"].append(encode_audio(clip[None, :], SR, compress=False))
+        payloads["fp_zlib"].append(encode_audio(clip[None, :], SR))
+    payloads = {k: v for k, v in payloads.items() if v}
+
+    results, answers = {}, {}
+    for kind, blobs in payloads.items():
+        serve = serve_fingerprint if kind.startswith("fp") else serve_audio
+        serve(inv, blobs[0])                                     # warm-up
+        ms, out = [], []
+        for data in blobs:
+            t0 = time.perf_counter()
+            out.append(serve(inv, data))
+            ms.append((time.perf_counter() - t0) * 1000)
+        answers[kind] = out
+        results[kind] = {"bytes_p50": int(np.median([len(b) for b in blobs])),
+                         "server_ms_p50": round(float(np.percentile(ms, 50)), 2),
+                         "server_ms_p95": round(float(np.percentile(ms, 95)), 2)}
+    ref = answers["wav_44k"]
+    print(f"\n   {'payload':>8}  {'bytes p50':>10}  {'vs wav':>7}  {'server ms p50':>13}  {'p95':>7}  same answer")
+    for kind, r in results.items():
+        r["same_answer"] = round(float(np.mean([a[0] == b[0] for a, b in zip(answers[kind], ref)])), 4)
+        print(f"   {kind:>8}  {r['bytes_p50']:>10,}  {results['wav_44k']['bytes_p50'] / r['bytes_p50']:6.0f}×  "
+              f"{r['server_ms_p50']:13.2f}  {r['server_ms_p95']:7.2f}  {r['same_answer']:.0%}")
+    return {"args": vars(args), "results": results}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fingerprint uploads vs audio uploads")
+    ap.add_argument("--songs", type=int, default=50)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--queries", type=int, default=30)
+    ap.add_argument("--clip-seconds", type=float, default=7.0)
+    ap.add_argument("--snr", type=float, default=10.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
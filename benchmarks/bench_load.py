@@ -0,0 +1,321 @@
+# benchmarks/bench_load.py
+"""
+Load test for the recognition server, fully offline on one box.
+
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --mode closed --levels 1,4,16,64 --duration 20
+    python benchmarks/bench_load.py --mode open --levels 5,10,20,40 --workers 2 --env SONAR_EXECUTOR=process
+    python benchmarks/bench_load.py --endpoint fingerprint --json after.json --compare before.json
+
+1. Writes a seeded synthetic catalog (synth.py) as a flat index in a temp dir
+   and cuts --clips noisy clips from it, as WAV uploads or wire fingerprints.
+2. Starts `uvicorn src.server.api:app` on that index with metadata lookups off
+   (and --workers / --env for the configuration under test), then sends
+   --warmup requests that are not counted.
+3. Runs each load level for --duration seconds:
+     closed   N clients, each sends its next clip as soon as the last answer
+              arrives (level = concurrency). Measures capacity.
+     open     Poisson arrivals at R requests/s, whether or not earlier ones
+              have been answered (level = rate). Latency counts from the
+              scheduled send time, so a stalled server is not hidden by
+              clients backing off.
+4. For each level, prints throughput, p50/p95/p99 latency of answered requests,
+   accuracy, the shed rate (503 overloaded / timeout) and the error rate. It
+   also prints the peak RSS and PSS of the uvicorn process and of each child
+   (workers, process-pool members), sampled from /proc (Linux only).
+
+Clips repeat byte for byte once --clips are used up, so the server runs with
+SONAR_RESULT_CACHE=0 unless --env SONAR_RESULT_CACHE=1 asks for the cache.
+"""
+import os, sys, json, time, random, shutil, asyncio, tempfile, argparse, threading, subprocess
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+import httpx
+
+from src.dsp import SR
+from src.wire import encode_audio
+from src.server.meta_cache import clean_title
+from benchmarks.synth import make_catalog, build_catalog_index, query_rng, add_noise, wav_bytes
+from benchmarks.bench_startup import free_port
+
+
+# ---- server ----
+def start_server(index_dir, tmp, port, workers, extra_env, timeout=120):
+    env = {**os.environ, "SONAR_FLAT_INDEX": index_dir,
+           "SONAR_SEGMENTS": os.path.join(tmp, "none"), "SONAR_SHARDS": os.path.join(tmp, "none"),
+           "SONAR_CACHE_FILE": os.path.join(tmp, "none.pkl"), "SONAR_SPOTIFY_META": "0",
+           "SONAR_META_DB": os.path.join(tmp, "meta.sqlite"), "SONAR_RESULT_CACHE": "0", **extra_env}
+    cmd = [sys.executable, "-m", "uvicorn", "src.server.api:app", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    server = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t0 = time.time()
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        if time.time() - t0 > timeout:
+            server.terminate()
+            raise TimeoutError("server did not come up")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/stats", timeout=1).status_code == 200:
+                return server, time.time() - t0
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+
+def descendants(pid):
+    """pid and every process below it, from /proc/*/stat."""
+    parent = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # "<pid> (<comm>) <state> <ppid> ..."; comm may contain spaces
+                    parent[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    out, todo = [pid], [pid]
+    while todo:
+        p = todo.pop()
+        kids = [c for c, pp in parent.items() if pp == p]
+        out += kids
+        todo += kids
+    return out
+
+
+def memory_mib(pid):
+    """(Rss, Pss) in MiB from /proc/<pid>/smaps_rollup, or None if the process is gone."""
+    out = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    out[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return out.get("Rss", 0.0), out.get("Pss", 0.0)
+
+
+class MemorySampler(threading.Thread):
+    """Peak RSS / PSS per server process, sampled every interval seconds."""
+
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak = {}                          # pid -> [rss, pss]
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            self.sample()
+            self.stop.wait(self.interval)
+
+    def sample(self):
+        for p in descendants(self.pid):
+            m = memory_mib(p)
+            if m is not None:
+                peak = self.peak.setdefault(p, [0.0, 0.0])
+                peak[0], peak[1] = max(peak[0], m[0]), max(peak[1], m[1])
+
+    def take(self):
+        """Peaks since the last take(), uvicorn first -> [{"pid", "role", "rss_mib", "pss_mib"}]."""
+        self.sample()
+        rows = [{"pid": p, "role": "uvicorn" if p == self.pid else "child",
+                 "rss_mib": round(r, 1), "pss_mib": round(s, 1)} for p, (r, s) in self.peak.items()]
+        self.peak = {}
+        return sorted(rows, key=lambda r: (r["role"] != "uvicorn", r["pid"]))
+
+
+# ---- clients ----
+def make_clips(args):
+    """-> (catalog, [(expected title, payload bytes)]), clips cut from the catalog with noise."""
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed)
+    rng = query_rng(args.seed)
+    n = int(args.clip_seconds * SR)
+    clips = []
+    for _ in range(args.clips):
+        sid, audio = catalog[rng.integers(len(catalog))]
+        a = rng.integers(0, len(audio) - n)
+        clip = add_noise(audio[a:a + n], args.snr, rng)
+        data = encode_audio(clip[None, :], SR) if args.endpoint == "fingerprint" else wav_bytes(clip)
+        clips.append((clean_title(f"song_{sid:05d}.wav"), data))
+    return catalog, clips
+
+
+async def send(client, url, endpoint, clip):
+    """One request -> (outcome, latency_s); outcome is ok / wrong / no_match / shed / error."""
+    title, data = clip
+    t0 = time.perf_counter()
+    try:
+        if endpoint == "fingerprint":
+            r = await client.post(f"{url}/recognize/fingerprint", content=data,
+                                  headers={"Content-Type": "application/octet-stream"})
+        else:
+            r = await client.post(f"{url}/recognize", files={"audio": ("clip.wav", data, "audio/wav")})
+    except httpx.HTTPError:
+        return "error", time.perf_counter() - t0
+    latency = time.perf_counter() - t0
+    if r.status_code == 503:
+        return "shed", latency
+    if r.status_code != 200:
+        return "error", latency
+    body = r.json()
+    if not body.get("success"):
+        return ("no_match" if body.get("message") == "no_match" else "error"), latency
+    return ("ok" if body.get("title") == title else "wrong"), latency
+
+
+async def closed_loop(url, endpoint, clips, concurrency, duration, timeout):
+    results, nxt = [], iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def user():
+            while time.perf_counter() < deadline:
+                results.append(await send(client, url, endpoint, clips[next(nxt) % len(clips)]))
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return results, []
+
+
+async def open_loop(url, endpoint, clips, rate, duration, timeout, seed=0):
+    results, lags, tasks = [], [], []
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def one(scheduled, clip):
+            lags.append(time.perf_counter() - scheduled)
+            outcome, _ = await send(client, url, endpoint, clip)
+            results.append((outcome, time.perf_counter() - scheduled))
+
+        start = time.perf_counter()
+        at, i = start, 0
+        while True:
+            at += rng.expovariate(rate)
+            if at - start >= duration:
+                break
+            await asyncio.sleep(max(0.0, at - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(at, clips[i % len(clips)])))
+            i += 1
+        await asyncio.gather(*tasks)
+    return results, lags
+
+
+def summarize(level, results, lags, wall):
+    outcomes = [o for o, _ in results]
+    answered = [lat for o, lat in results if o in ("ok", "wrong", "no_match")]
+    n = max(1, len(results))
+
+    def pct(q):
+        return round(float(np.percentile(answered, q)) * 1000, 1) if answered else None
+    return {
+        "level": level, "requests": len(results),
+        "throughput_rps": round(len(answered) / wall, 2),
+        "goodput_rps": round(outcomes.count("ok") / wall, 2),
+        "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+        "accuracy": round(outcomes.count("ok") / max(1, len(answered)), 4),
+        "shed_rate": round(outcomes.count("shed") / n, 4),
+        "error_rate": round(outcomes.count("error") / n, 4),
+        "client_lag_p99_ms": round(float(np.percentile(lags, 99)) * 1000, 1) if lags else None,
+    }
+
+
+def print_compare(report, before_path):
+    with open(before_path, encoding="utf-8") as f:
+        before = {r["level"]: r for r in json.load(f)["levels"]}
+    print(f"\n   vs {before_path}")
+    print(f"   {'level':>7}  {'rps':>16}  {'p99 ms':>18}  {'shed':>14}")
+    for r in report["levels"]:
+        b = before.get(r["level"])
+        if b is None:
+            continue
+        print(f"   {r['level']:>7g}  {b['throughput_rps']:7.1f} → {r['throughput_rps']:<6.1f}  "
+              f"{b['p99_ms'] or 0:8.1f} → {r['p99_ms'] or 0:<7.1f}  {b['shed_rate']:5.1%} → {r['shed_rate']:<5.1%}")
+
+
+def run(args):
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    tmp = tempfile.mkdtemp(prefix="sonar_load_")
+    try:
+        print(f"🔧 Indexing {args.songs} synthetic songs, cutting {args.clips} clips...", flush=True)
+        catalog, clips = make_clips(args)
+        n_post = build_catalog_index(os.path.join(tmp, "flat"), catalog)
+
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server, ready_s = start_server(os.path.join(tmp, "flat"), tmp, port, args.workers, extra_env)
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+        try:
+            print(f"🚀 Server up in {ready_s:.1f}s ({n_post:,} postings, {args.workers} uvicorn worker(s)"
+                  f"{', ' + ' '.join(args.env) if args.env else ''})", flush=True)
+            for _ in range(args.warmup):
+                httpx.post(f"{url}/recognize", files={"audio": ("w.wav", wav_bytes(catalog[0][1][:5 * SR]), "audio/wav")},
+                           timeout=args.timeout)
+            sampler.take()
+
+            levels = []
+            unit = "clients" if args.mode == "closed" else "req/s"
+            print(f"\n   {unit:>7}  {'rps':>7}  {'good':>7}  {'p50':>7}  {'p95':>7}  {'p99 ms':>7}  "
+                  f"{'acc':>5}  {'shed':>6}  {'err':>6}  {'peak RSS MiB per process'}")
+            for level in args.levels:
+                t0 = time.perf_counter()
+                if args.mode == "closed":
+                    results, lags = asyncio.run(closed_loop(url, args.endpoint, clips, int(level),
+                                                            args.duration, args.timeout))
+                else:
+                    results, lags = asyncio.run(open_loop(url, args.endpoint, clips, level,
+                                                          args.duration, args.timeout, args.seed))
+                row = summarize(level, results, lags, time.perf_counter() - t0)
+                row["memory"] = sampler.take()
+                row["server_stats"] = httpx.get(f"{url}/stats", timeout=5).json()
+                levels.append(row)
+                rss = " ".join(f"{m['rss_mib']:.0f}" for m in row["memory"])
+                print(f"   {level:>7g}  {row['throughput_rps']:7.1f}  {row['goodput_rps']:7.1f}  "
+                      f"{row['p50_ms'] or 0:7.1f}  {row['p95_ms'] or 0:7.1f}  {row['p99_ms'] or 0:7.1f}  "
+                      f"{row['accuracy']:5.0%}  {row['shed_rate']:6.1%}  {row['error_rate']:6.1%}  {rss}", flush=True)
+                if row["client_lag_p99_ms"] is not None and row["client_lag_p99_ms"] > 50:
+                    print(f"      ⚠️ load generator fell behind (send lag p99 {row['client_lag_p99_ms']:.0f} ms); "
+                          f"latencies at this level are pessimistic")
+        finally:
+            sampler.stop.set()
+            server.terminate()
+            server.wait()
+        return {"args": vars(args), "postings": n_post, "ready_s": round(ready_s, 2), "levels": levels}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Offline load test of the recognition server")
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--levels", type=lambda s: [float(x) for x in s.split(",")], default=[1, 2, 4, 8, 16],
+                    help="comma-separated concurrencies (closed) or request rates per second (open)")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    ap.add_argument("--endpoint", choices=["audio", "fingerprint"], default="audio",
+                    help="WAV uploads to /recognize or wire fingerprints to /recognize/fingerprint")
+    ap.add_argument("--workers", type=int, default=1, help="uvicorn --workers")
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                    help="extra server environment, e.g. SONAR_WORKERS=4 (repeatable)")
+    ap.add_argument("--songs", type=int, default=50)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--clips", type=int, default=200)
+    ap.add_argument("--clip-seconds", type=float, default=7.0)
+    ap.add_argument("--snr", type=float, default=10.0)
+    ap.add_argument("--warmup", type=int, default=5, help="uncounted requests before the first level")
+    ap.add_argument("--timeout", type=float, default=30.0, help="client timeout per request (s)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    ap.add_argument("--compare", help="earlier --json output to compare against")
+    args = ap.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("❌ needs Linux /proc/<pid>/smaps_rollup")
+
+    report = run(args)
+    if args.compare:
+        print_compare(report, args.compare)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
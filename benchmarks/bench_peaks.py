@@ -0,0 +1,92 @@
+# benchmarks/bench_peaks.py
+"""
+Peak-picking engines: scipy maximum_filter vs separable torch max on the STFT device.
+
+    python benchmarks/bench_peaks.py
+    python benchmarks/bench_peaks.py --seconds 3 10 60 --threads 1 4 --caps 2 3 5 --json peaks.json
+
+For each clip length, a seeded synthetic clip (see synth.py) is mixed with
+noise and turned into a dB spectrogram once; every engine then picks peaks
+from it --repeat times. Reports ms per call (p50), peaks found, and checks
+that both engines return identical peaks. --caps shows how many peaks and
+hashes a PEAKS_PER_FRAME cap keeps on noisy clips; for what a cap does to
+accuracy, run bench_stages.py --peaks-per-frame K.
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+import torch
+
+import src.dsp as dsp
+from src.dsp import SR, HOP, spectrogram_db_from_tensor, peak_coords, hash_arrays_from_peaks
+from benchmarks.synth import make_song, query_rng, add_noise
+
+ENGINES = ["scipy", "torch"]
+
+
+def time_engine(engine, S_db, repeat, cap=None):
+    dsp.PEAK_ENGINE, dsp.PEAKS_PER_FRAME = engine, cap
+    peaks = peak_coords(S_db)                      # warm-up (scipy import, torch kernels)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        peak_coords(S_db)
+        times.append((time.perf_counter() - t0) * 1000)
+    return peaks, float(np.percentile(times, 50))
+
+
+def run(args):
+    rng = query_rng(args.seed)
+    rows = []
+    for seconds in args.seconds:
+        clip = add_noise(make_song(seconds, [args.seed, 0, 0]), args.snr, rng)
+        S_db = spectrogram_db_from_tensor(torch.from_numpy(clip).unsqueeze(0), SR, keep_on_device=True)
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            ref, ref_ms = time_engine("scipy", S_db, args.repeat)
+            peaks, ms = time_engine("torch", S_db, args.repeat)
+            row = {"seconds": seconds, "frames": int(S_db.shape[1]), "threads": threads,
+                   "scipy_ms": round(ref_ms, 3), "torch_ms": round(ms, 3),
+                   "speedup": round(ref_ms / ms, 2), "peaks": len(ref),
+                   "identical": bool(np.array_equal(ref, peaks))}
+            rows.append(row)
+            print(f"   {seconds:>5.0f}s ({row['frames']} frames) threads={threads}: scipy {ref_ms:7.2f} ms  "
+                  f"torch {ms:7.2f} ms  ({row['speedup']:.2f}x)  {len(ref)} peaks  "
+                  f"{'identical' if row['identical'] else '❌ DIFFERENT'}", flush=True)
+
+    caps = []
+    if args.caps:
+        clip = add_noise(make_song(10, [args.seed, 0, 1]), args.snr, rng)
+        S_db = spectrogram_db_from_tensor(torch.from_numpy(clip).unsqueeze(0), SR, keep_on_device=True)
+        print(f"\n🔧 PEAKS_PER_FRAME on a 10 s clip at {args.snr} dB SNR:")
+        for cap in [None] + args.caps:
+            dsp.PEAK_ENGINE, dsp.PEAKS_PER_FRAME = "torch", cap
+            peaks = peak_coords(S_db)
+            n_hashes = len(hash_arrays_from_peaks(peaks)[0])
+            caps.append({"cap": cap, "peaks": len(peaks), "hashes": n_hashes,
+                         "peaks_per_sec": round(len(peaks) / (S_db.shape[1] * HOP / SR), 1)})
+            print(f"   cap {str(cap):>4}: {len(peaks):6d} peaks  {n_hashes:7d} hashes")
+    return {"threads_default": torch.get_num_threads(), "engines": rows, "caps": caps}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="scipy vs torch peak picking")
+    ap.add_argument("--seconds", type=float, nargs="+", default=[3, 10, 30, 180])
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, torch.get_num_threads()])
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--snr", type=float, default=5.0, help="dB of white noise added to each clip")
+    ap.add_argument("--caps", type=int, nargs="*", default=[1, 2, 3, 5])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+    args.threads = sorted(set(args.threads))
+
+    print("🚀 Peak picking: scipy.ndimage.maximum_filter vs separable torch max")
+    report = run(args)
+    if not all(r["identical"] for r in report["engines"]):
+        print("❌ engines disagree")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
@@ -0,0 +1,132 @@
+# benchmarks/bench_postings.py
+"""
+Flat index v1 (float32 [song_id, t_sec] postings) vs v2 (integer song/frame,
+delta + bit-packed): size, lookup speed and identical votes.
+
+    python benchmarks/bench_postings.py
+    python benchmarks/bench_postings.py --songs 300 --common 0.5 --json postings.json
+
+1. Fingerprints a seeded synthetic catalog (synth.py) and writes it in both
+   formats; reports bytes on disk (= resident size once mapped) per file and
+   per posting.
+2. Runs --queries noisy clips through gather_postings + best_alignment on
+   both; every clip must give the same votes and the same (song, aligned)
+   answer. Reports lookup+voting ms p50/p95.
+3. Checks that song IDs past 2^24 survive v2 (float32 v1 rounds them).
+
+Exits with 1 if the formats disagree.
+"""
+import os, sys, json, time, shutil, tempfile, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, gather_postings, best_alignment
+from src.flat_index import FlatIndex, write_flat_index
+from benchmarks.synth import make_catalog, catalog_inv, fingerprint, query_rng, add_noise
+
+
+def write_v1(out_dir, inv):
+    """The version 1 layout, for comparison: keys / offsets int64 / postings float32 [N, 2]."""
+    os.makedirs(out_dir, exist_ok=True)
+    items = sorted(inv.items(), key=lambda kv: kv[0])
+    keys = np.array([k for k, _ in items], dtype=np.uint32)
+    buckets = [np.asarray(v, dtype=np.float32).reshape(-1, 2) for _, v in items]
+    offsets = np.zeros(len(buckets) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in buckets], out=offsets[1:])
+    np.save(os.path.join(out_dir, "keys.npy"), keys)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+    np.save(os.path.join(out_dir, "postings.npy"), np.concatenate(buckets))
+    with open(os.path.join(out_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "key_type": "int", "buckets": len(keys), "postings": int(offsets[-1])}, f)
+
+
+def sizes(out_dir):
+    return {f: os.path.getsize(os.path.join(out_dir, f)) for f in sorted(os.listdir(out_dir)) if f.endswith(".npy")}
+
+
+def time_queries(inv, queries):
+    ms, answers = [], []
+    for _, qhashes in queries:
+        t0 = time.perf_counter()
+        sids, offs = gather_postings(inv, qhashes, budget=0)
+        pred, align, _ = best_alignment(sids, offs)
+        ms.append((time.perf_counter() - t0) * 1000)
+        order = np.lexsort((offs, sids))
+        answers.append(((pred, align), sids[order], offs[order]))
+    return np.array(ms), answers
+
+
+def big_ids(tmp):
+    """v2 keeps song IDs exact past float32's 2^24 limit."""
+    sid = 2 ** 24 + 1
+    write_flat_index(os.path.join(tmp, "big"), {7: [[sid, 1.0], [sid + 2, 2.0]]}, {})
+    got = FlatIndex(os.path.join(tmp, "big")).lookup_frames([7])[0].tolist()
+    return {"song_ids": [sid, sid + 2], "v2": got, "float32": np.float32([sid, sid + 2]).astype(np.int64).tolist()}
+
+
+def run(args, tmp):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed, common=args.common)
+    inv, meta = catalog_inv(catalog)
+    rng = query_rng(args.seed)
+    queries = []
+    for _ in range(args.queries):
+        sid, audio = catalog[rng.integers(len(catalog))]
+        start = rng.integers(0, len(audio) - int(args.clip_seconds * SR))
+        queries.append((sid, fingerprint(add_noise(audio[start:start + int(args.clip_seconds * SR)], args.snr, rng))))
+
+    write_v1(os.path.join(tmp, "v1"), inv)
+    t0 = time.perf_counter()
+    write_flat_index(os.path.join(tmp, "v2"), inv, meta)
+    write_s = time.perf_counter() - t0
+    n = sum(len(v) for v in inv.values())
+
+    report = {"args": vars(args), "postings": n, "buckets": len(inv), "v2_write_s": round(write_s, 3), "formats": {}}
+    answers = {}
+    for fmt in ("v1", "v2"):
+        fi = FlatIndex(os.path.join(tmp, fmt))
+        gather_postings(fi, queries[0][1], budget=0)            # warm-up
+        ms, answers[fmt] = time_queries(fi, queries)
+        files = sizes(os.path.join(tmp, fmt))
+        total = sum(files.values())
+        report["formats"][fmt] = {"files": files, "bytes": total, "bytes_per_posting": round(total / n, 2),
+                                  "ms_p50": round(float(np.percentile(ms, 50)), 3),
+                                  "ms_p95": round(float(np.percentile(ms, 95)), 3)}
+        print(f"   {fmt}: {total / 2 ** 20:7.2f} MiB ({total / n:5.2f} B/posting)  "
+              f"lookup+vote p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms  "
+              + "  ".join(f"{k} {v / 2 ** 20:.2f}" for k, v in files.items()), flush=True)
+
+    same = [a[0] == b[0] and np.array_equal(a[1], b[1]) and np.array_equal(a[2], b[2])
+            for a, b in zip(answers["v1"], answers["v2"])]
+    report["identical_votes"] = int(sum(same))
+    report["size_ratio"] = round(report["formats"]["v2"]["bytes"] / report["formats"]["v1"]["bytes"], 3)
+    report["big_ids"] = big_ids(tmp)
+    print(f"   v2 / v1 size: {report['size_ratio']:.2f}; identical votes on {sum(same)}/{len(same)} queries")
+    print(f"   song IDs {report['big_ids']['song_ids']}: v2 {report['big_ids']['v2']}, float32 {report['big_ids']['float32']}")
+    return report, all(same) and report["big_ids"]["v2"] == report["big_ids"]["song_ids"]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Flat index v1 vs v2 postings: size, speed, identical votes")
+    ap.add_argument("--songs", type=int, default=100)
+    ap.add_argument("--song-seconds", type=float, default=60.0)
+    ap.add_argument("--common", type=float, default=0.0, help="level of the motif shared by all songs (0 = none)")
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--clip-seconds", type=float, default=5.0)
+    ap.add_argument("--snr", type=float, default=5.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="sonar_postings_")
+    try:
+        report, ok = run(args, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
+    print("✅ Formats agree" if ok else "❌ Formats disagree")
+    sys.exit(0 if ok else 1)
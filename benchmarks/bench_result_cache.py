@@ -0,0 +1,112 @@
+# benchmarks/bench_result_cache.py
+"""
+Repeated-upload result cache (src/server/result_cache.py): hit rate, cost of a
+miss and server time saved.
+
+    python benchmarks/bench_result_cache.py
+    python benchmarks/bench_result_cache.py --uploads 500 --repeat 0.3 --json cache.json
+
+1. Fingerprints a seeded synthetic catalog (synth.py) into an in-memory index.
+2. Makes a stream of --uploads WAV uploads. Each one is a byte-identical repeat
+   of an earlier upload with probability --repeat (a client retry, a forwarded
+   recording), otherwise a fresh noisy clip.
+3. Serves the stream like the server does (decode_bytes + STFT + peaks +
+   hashing + lookup + voting), without and with the cache in front. Reports
+   the hit rate, digest + bookkeeping cost per miss, ms per upload, the net
+   time saved and whether any answer changed.
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks, gather_postings, best_alignment
+from src.server.decode import decode_bytes
+from src.server.result_cache import ResultCache
+from benchmarks.synth import make_catalog, catalog_inv, query_rng, add_noise, wav_bytes
+
+
+def serve(inv, data):
+    wav, sr = decode_bytes(data)
+    qhashes = hashes_from_peaks(peak_coords(spectrogram_db_from_tensor(wav, sr)))
+    return best_alignment(*gather_postings(inv, qhashes))[:2]
+
+
+def serve_cached(inv, cache, data, miss_us):
+    t0 = time.perf_counter()
+    key, hit = cache.lookup("recognize", data)
+    if hit is not None:
+        return hit
+    miss_us.append((time.perf_counter() - t0) * 1e6)
+    t1 = time.perf_counter()
+    result = serve(inv, data)
+    cache.put(key, result, (time.perf_counter() - t1) * 1000)
+    return result
+
+
+def timed(fn, uploads):
+    out, ms = [], []
+    for data in uploads:
+        t0 = time.perf_counter()
+        out.append(fn(data))
+        ms.append((time.perf_counter() - t0) * 1000)
+    return out, ms
+
+
+def run(args):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed)
+    inv, _ = catalog_inv(catalog)
+    rng = query_rng(args.seed)
+    n = int(args.clip_seconds * SR)
+    uploads = []
+    for _ in range(args.uploads):
+        if uploads and rng.random() < args.repeat:
+            uploads.append(uploads[rng.integers(len(uploads))])
+            continue
+        _, audio = catalog[rng.integers(len(catalog))]
+        a = rng.integers(0, len(audio) - n)
+        uploads.append(wav_bytes(add_noise(audio[a:a + n], args.snr, rng)))
+    serve(inv, uploads[0])                                       # warm-up
+
+    plain, plain_ms = timed(lambda d: serve(inv, d), uploads)
+    cache, miss_us = ResultCache(entries=args.entries, ttl=args.ttl), []
+    cached, cached_ms = timed(lambda d: serve_cached(inv, cache, d, miss_us), uploads)
+    stats = cache.stats()
+    report = {
+        "hit_rate": stats["hit_rate"],
+        "differ_from_uncached": int(sum(p[0] != c[0] for p, c in zip(plain, cached))),
+        "miss_overhead_us_p50": round(float(np.percentile(miss_us, 50)), 1),
+        "ms_p50_uncached": round(float(np.percentile(plain_ms, 50)), 3),
+        "ms_p50_cached": round(float(np.percentile(cached_ms, 50)), 3),
+        "ms_mean_uncached": round(float(np.mean(plain_ms)), 3),
+        "ms_mean_cached": round(float(np.mean(cached_ms)), 3),
+        "saved_ms": stats["saved_ms"],
+    }
+    print(f"   hit rate {report['hit_rate']:.1%}, {report['differ_from_uncached']} answers differ from uncached")
+    print(f"   miss overhead p50 {report['miss_overhead_us_p50']:.0f} µs")
+    print(f"   ms per upload p50 {report['ms_p50_uncached']:.2f} → {report['ms_p50_cached']:.2f}, "
+          f"mean {report['ms_mean_uncached']:.2f} → {report['ms_mean_cached']:.2f}; "
+          f"net saved {report['saved_ms']:.0f} ms")
+    return {"args": vars(args), **report}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Repeated-upload result cache")
+    ap.add_argument("--songs", type=int, default=50)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--uploads", type=int, default=200)
+    ap.add_argument("--repeat", type=float, default=0.2, help="probability an upload repeats an earlier one")
+    ap.add_argument("--clip-seconds", type=float, default=7.0)
+    ap.add_argument("--snr", type=float, default=10.0)
+    ap.add_argument("--entries", type=int, default=1024)
+    ap.add_argument("--ttl", type=float, default=120.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
@@ -0,0 +1,127 @@
+# benchmarks/bench_scan.py
+"""
+Scan mode (src/scan.py) vs chopping a long recording into overlapping clips.
+
+    python benchmarks/bench_scan.py
+    python benchmarks/bench_scan.py --songs 200 --minutes 30 --window 10 --hop 5 --json scan.json
+
+1. Fingerprints a seeded synthetic catalog (synth.py) into an in-memory index.
+2. Builds a --minutes "broadcast": random excerpts of catalog songs back to
+   back, with short silences between some of them, plus white noise at --snr.
+3. Scans it with TimelineScanner in --block second reads, and separately runs
+   every (window, hop) clip through the full spectrogram -> peaks -> hashing
+   -> lookup -> voting path the way a chopped-up batch job would.
+4. Reports × real-time, hashes computed and the share of broadcast seconds
+   labelled with the right song (silences count as right when unlabelled).
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, MIN_MATCHES, gather_postings, best_alignment
+from src.scan import TimelineScanner
+from benchmarks.synth import make_catalog, catalog_inv, fingerprint, query_rng, add_noise
+
+
+def make_broadcast(catalog, minutes, snr, rng, min_s=20.0, max_s=60.0):
+    """-> (audio, [(start, end, song_id or None)]) ground truth."""
+    parts, truth, t = [], [], 0.0
+    while t < minutes * 60:
+        if truth and rng.random() < 0.3:
+            gap = rng.uniform(1.0, 4.0)
+            parts.append(np.zeros(int(gap * SR), dtype=np.float32))
+            truth.append((t, t + gap, None))
+            t += gap
+        sid, audio = catalog[rng.integers(len(catalog))]
+        n = min(len(audio), int(rng.uniform(min_s, max_s) * SR))
+        a = rng.integers(0, len(audio) - n + 1)
+        parts.append(audio[a:a + n])
+        truth.append((t, t + n / SR, sid))
+        t += n / SR
+    audio = np.concatenate(parts)
+    return add_noise(audio, snr, rng), truth
+
+
+def labelled_accuracy(truth, segments, duration, step=0.1):
+    """Share of time points (every step seconds) whose predicted song matches the truth."""
+    grid = np.arange(0, duration, step)
+
+    def label(spans):
+        out = np.full(len(grid), -1, dtype=np.int64)
+        for start, end, sid in spans:
+            if sid is not None:
+                out[(grid >= start) & (grid < end)] = sid
+        return out
+
+    return float(np.mean(label(truth) == label(segments)))
+
+
+def run_scan(inv, audio, args):
+    t0 = time.perf_counter()
+    scanner, segments = TimelineScanner(inv, SR, args.window, args.hop), []
+    block = int(args.block * SR)
+    for a in range(0, len(audio), block):
+        segments += scanner.push(audio[a:a + block])
+    segments += scanner.flush()
+    return segments, time.perf_counter() - t0, scanner.hashes
+
+
+def run_chopped(inv, audio, args):
+    """Every window fingerprinted and matched from scratch; consecutive same-song windows merged."""
+    t0 = time.perf_counter()
+    win, hop = int(args.window * SR), int(args.hop * SR)
+    segments, hashes = [], 0
+    for a in range(0, max(1, len(audio) - win + hop), hop):
+        q = fingerprint(audio[a:a + win])
+        hashes += len(q)
+        sid, align, _ = best_alignment(*gather_postings(inv, [(h, t + a / SR) for h, t in q]))
+        sid = sid if align >= MIN_MATCHES else None
+        lo, hi = a / SR + (args.window - args.hop) / 2, a / SR + (args.window + args.hop) / 2
+        if segments and segments[-1][2] == sid:
+            segments[-1][1] = hi
+        else:
+            segments.append([0.0 if not segments else lo, hi, sid])
+    return [tuple(s) for s in segments], time.perf_counter() - t0, hashes
+
+
+def run(args):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed)
+    inv, _ = catalog_inv(catalog)
+    audio, truth = make_broadcast(catalog, args.minutes, args.snr, query_rng(args.seed))
+    duration = len(audio) / SR
+    print(f"📻 {duration / 60:.1f} min broadcast, {sum(s is not None for *_, s in truth)} song excerpts")
+
+    results = {}
+    for name, fn in (("scan", run_scan), ("chopped", run_chopped)):
+        segments, elapsed, hashes = fn(inv, audio, args)
+        results[name] = {
+            "realtime_x": round(duration / elapsed, 1), "seconds": round(elapsed, 2), "hashes": int(hashes),
+            "segments": len([s for s in segments if s[2] is not None]),
+            "labelled_accuracy": round(labelled_accuracy(truth, segments, duration), 4),
+        }
+        r = results[name]
+        print(f"   {name:>8}: {r['realtime_x']:7.1f}× real-time  {r['hashes']:>10,} hashes  "
+              f"{r['segments']:4d} segments  {r['labelled_accuracy']:6.1%} of seconds labelled right", flush=True)
+    return {"args": vars(args), "duration_s": round(duration, 1), "results": results}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Long-recording scan mode vs overlapping clips")
+    ap.add_argument("--songs", type=int, default=50)
+    ap.add_argument("--song-seconds", type=float, default=60.0)
+    ap.add_argument("--minutes", type=float, default=10.0, help="length of the synthetic broadcast")
+    ap.add_argument("--snr", type=float, default=10.0)
+    ap.add_argument("--window", type=float, default=10.0)
+    ap.add_argument("--hop", type=float, default=5.0)
+    ap.add_argument("--block", type=float, default=30.0, help="seconds per read in scan mode")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
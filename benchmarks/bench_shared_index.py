@@ -0,0 +1,160 @@
+# benchmarks/bench_shared_index.py
+"""
+Per-worker memory of the index: pickle cache (every worker unpickles its own
+copy) vs flat mmap index (every worker maps the same read-only pages).
+
+    python benchmarks/bench_shared_index.py --workers 4 --postings 5000000
+
+Builds a synthetic pickle cache in a temp dir and lets --workers processes race
+on ensure_flat_index (exactly one may convert), then spawns --workers fresh
+processes per mode. Each one loads the index, touches every posting and a few
+thousand lookups, and reports Rss / Pss / Private / Shared from
+/proc/self/smaps_rollup (Linux only). Exits non-zero if a flat-mode worker holds
+more than --max-private of the index privately.
+"""
+import os, sys, time, gzip, pickle, shutil, tempfile, argparse
+import multiprocessing as mp
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.flat_index import load_flat_index, load_pickle_cache, ensure_flat_index
+
+
+def make_pickle(path, n_postings, n_songs=2000, n_hashes=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_hashes = n_hashes or n_postings // 8
+    keys = rng.choice(2 ** 30, size=n_hashes, replace=False).astype(np.int64)
+    bucket = rng.integers(0, n_hashes, size=n_postings)
+    sids = rng.integers(0, n_songs, size=n_postings)
+    ts = np.round(rng.random(n_postings) * 240.0, 3)
+    order = np.argsort(bucket, kind="stable")
+    bounds = np.searchsorted(bucket[order], np.arange(n_hashes + 1))
+    sids, ts = sids[order].tolist(), ts[order].tolist()
+    inv = {}
+    for i, k in enumerate(keys.tolist()):
+        a, b = bounds[i], bounds[i + 1]
+        if b > a:
+            inv[k] = [[sids[j], ts[j]] for j in range(a, b)]
+    meta_by_id = {i: {"id": i, "title": f"song_{i}.wav", "artist": "synthetic"} for i in range(n_songs)}
+    with gzip.open(path, "wb", compresslevel=1) as f:
+        pickle.dump({"inv": inv, "meta_by_id": meta_by_id}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return keys
+
+
+def smaps_rollup():
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                out[parts[0].rstrip(":")] = int(parts[1]) / 1024        # MiB
+    return out
+
+
+def convert(cache_file, flat_dir, barrier, q):
+    barrier.wait()                                          # start together
+    q.put(ensure_flat_index(cache_file, flat_dir))
+
+
+def worker(mode, cache_file, flat_dir, probe, barrier, q):
+    try:
+        measure(mode, cache_file, flat_dir, probe, barrier, q)
+    except Exception as e:
+        barrier.abort()                                     # don't leave the others (or the parent) waiting
+        q.put({"mode": mode, "pid": os.getpid(), "error": repr(e)})
+
+
+def measure(mode, cache_file, flat_dir, probe, barrier, q):
+    t0 = time.time()
+    before = smaps_rollup()
+    if mode == "flat":
+        inv, meta = load_flat_index(flat_dir)
+        _ = int(inv.packed.sum())                           # touch every posting page
+        hits = len(inv.lookup(probe)[0])
+    else:
+        inv, meta = load_pickle_cache(cache_file)
+        _ = sum(len(v) for v in inv.values())
+        hits = sum(len(inv.get(k, ())) for k in probe)
+    load_s = time.time() - t0
+    barrier.wait()                                          # everyone mapped -> Pss split fairly
+    m = smaps_rollup()
+    q.put({
+        "mode": mode, "pid": os.getpid(), "load_s": load_s, "hits": hits,
+        "rss": m["Rss"] - before["Rss"],
+        "pss": m["Pss"] - before["Pss"],
+        "private": (m["Private_Clean"] + m["Private_Dirty"]) - (before["Private_Clean"] + before["Private_Dirty"]),
+        "shared": (m["Shared_Clean"] + m["Shared_Dirty"]) - (before["Shared_Clean"] + before["Shared_Dirty"]),
+    })
+    barrier.wait()
+
+
+def run_mode(ctx, mode, n, cache_file, flat_dir, probe):
+    barrier, q = ctx.Barrier(n), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, cache_file, flat_dir, probe, barrier, q)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    rows = [q.get() for _ in procs]
+    for p in procs:
+        p.join()
+    errors = [r for r in rows if "error" in r]
+    if errors:
+        sys.exit(f"❌ {mode} worker {errors[0]['pid']} failed: {errors[0]['error']}")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pickle vs shared flat index memory per worker")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--postings", type=int, default=5_000_000)
+    ap.add_argument("--max-private", type=float, default=0.10, help="allowed private fraction of flat index size")
+    ap.add_argument("--skip-pickle", action="store_true", help="only measure flat mode")
+    args = ap.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("❌ needs Linux /proc/self/smaps_rollup")
+
+    tmp = tempfile.mkdtemp(prefix="sonar_shared_")
+    try:
+        cache_file, flat_dir = os.path.join(tmp, "cache.pkl.gz"), os.path.join(tmp, "flat_index")
+        print(f"🔧 Building synthetic index ({args.postings:,} postings)...")
+        keys = make_pickle(cache_file, args.postings)
+        probe = keys[:: max(1, len(keys) // 5000)].tolist()
+
+        ctx = mp.get_context("spawn")
+        barrier, q = ctx.Barrier(args.workers), ctx.Queue()
+        procs = [ctx.Process(target=convert, args=(cache_file, flat_dir, barrier, q)) for _ in range(args.workers)]
+        for p in procs:
+            p.start()
+        converted = sum(q.get() for _ in procs)
+        for p in procs:
+            p.join()
+        if converted != 1:
+            sys.exit(f"❌ {converted} of {args.workers} racing workers converted the cache (expected 1)")
+        print(f"✅ {args.workers} workers raced for the conversion; one converted, the rest attached")
+
+        results = {"flat": run_mode(ctx, "flat", args.workers, cache_file, flat_dir, probe)}
+        if not args.skip_pickle:
+            results["pickle"] = run_mode(ctx, "pickle", args.workers, cache_file, flat_dir, probe)
+
+        index_mb = sum(os.path.getsize(os.path.join(flat_dir, f)) for f in os.listdir(flat_dir)) / 2 ** 20
+        print(f"\nFlat index on disk: {index_mb:.1f} MiB, {args.workers} workers")
+        print(f"{'mode':<7}{'load s':>8}{'RSS MiB':>10}{'PSS MiB':>10}{'private':>10}{'shared':>10}")
+        for mode, rows in results.items():
+            for r in rows:
+                print(f"{mode:<7}{r['load_s']:>8.2f}{r['rss']:>10.1f}{r['pss']:>10.1f}{r['private']:>10.1f}{r['shared']:>10.1f}")
+            total = sum(r["pss"] for r in rows)
+            print(f"{mode:<7} total PSS {total:.1f} MiB")
+
+        assert len({r["hits"] for rows in results.values() for r in rows}) == 1, "workers disagree on lookups"
+        worst = max(r["private"] for r in results["flat"])
+        limit = args.max_private * index_mb
+        if worst > limit:
+            print(f"❌ flat worker holds {worst:.1f} MiB privately (limit {limit:.1f} MiB)")
+            sys.exit(1)
+        print(f"✅ flat workers share the index: worst private {worst:.1f} MiB ≤ {limit:.1f} MiB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
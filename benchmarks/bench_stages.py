@@ -0,0 +1,222 @@
+# benchmarks/bench_stages.py
+"""
+Stage-level benchmark + accuracy tracking on a synthetic, seeded catalog.
+
+    python benchmarks/bench_stages.py --json bench.json
+    python benchmarks/bench_stages.py --json new.json --compare bench.json
+
+1. Generates --songs synthetic songs (tone bursts, chirps, noise; see synth.py),
+   writes them as dataset/<artist>/<title>.wav and builds the index with
+   src/index_constellation.build_index (streamed straight into a flat index).
+2. For every (SNR, clip length) cell, cuts --queries random clips, adds white
+   noise, encodes them as WAV bytes and runs them through the pipeline stage
+   by stage: decode, STFT, peak picking, hashing, postings lookup, voting.
+3. Reports per-stage latency (mean / p50 / p95 ms), work counts (peaks,
+   hashes, postings touched, candidate songs) and top-1 accuracy per cell,
+   and writes everything as JSON. --compare prints the deltas against an
+   earlier run; --fail-on-regression turns them into an exit code.
+
+Everything is seeded, so two runs at the same commit see identical clips.
+"""
+import os, sys, json, time, shutil, platform, tempfile, argparse, subprocess, contextlib
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+import src.dsp as dsp
+from src.dsp import (
+    SR, MIN_MATCHES, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks,
+    gather_postings, song_alignments, best_alignment,
+)
+from src.flat_index import load_flat_index
+from src.index_constellation import build_index
+from src.server.decode import decode_bytes
+from benchmarks.synth import make_catalog, query_rng, add_noise, write_dataset, wav_bytes
+
+STAGES = ["decode", "stft", "peaks", "hashing", "lookup", "voting"]
+COUNTS = ["peaks", "hashes", "postings", "candidates"]
+
+
+def build(tmp, catalog, workers):
+    dataset, out = os.path.join(tmp, "dataset"), os.path.join(tmp, "flat")
+    write_dataset(dataset, catalog)
+    t0 = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        build_index(dataset, out, workers=workers)
+    build_s = time.perf_counter() - t0
+    flat, _ = load_flat_index(out)
+    return flat, {
+        "songs": len(catalog),
+        "build_index_s": round(build_s, 3),
+        "songs_per_sec": round(len(catalog) / build_s, 2),
+        "buckets": len(flat),
+        "postings": flat.n_postings,
+    }
+
+
+def run_query(inv, data):
+    """One clip through every stage -> (predicted sid, align, {stage: ms}, {count: n})."""
+    T, t = {}, time.perf_counter()
+
+    def lap(stage):
+        nonlocal t
+        now = time.perf_counter()
+        T[stage] = (now - t) * 1000
+        t = now
+
+    wav, sr = decode_bytes(data);               lap("decode")
+    S_db = spectrogram_db_from_tensor(wav, sr); lap("stft")
+    peaks = peak_coords(S_db);                  lap("peaks")
+    qhashes = hashes_from_peaks(peaks);         lap("hashing")
+    sids, offs = gather_postings(inv, qhashes); lap("lookup")
+    sid, align, _ = best_alignment(sids, offs); lap("voting")
+    counts = {"peaks": len(peaks), "hashes": len(qhashes), "postings": len(sids),
+              "candidates": len(song_alignments(sids, offs)[0])}
+    return sid, align, T, counts
+
+
+def summarize(values):
+    a = np.asarray(values, dtype=np.float64)
+    return {"mean": round(float(a.mean()), 3), "p50": round(float(np.percentile(a, 50)), 3),
+            "p95": round(float(np.percentile(a, 95)), 3)}
+
+
+def run(args):
+    # index and queries share the peak settings, like indexer and server do (env: for --workers processes)
+    dsp.PEAK_ENGINE, dsp.PEAKS_PER_FRAME = args.peak_engine, args.peaks_per_frame
+    os.environ["SONAR_PEAK_ENGINE"] = args.peak_engine
+    os.environ["SONAR_PEAKS_PER_FRAME"] = str(args.peaks_per_frame or 0)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed)
+    tmp = tempfile.mkdtemp(prefix="sonar_stages_")
+    try:
+        print(f"🔧 Building index for {args.songs} synthetic songs...", flush=True)
+        inv, build_info = build(tmp, catalog, args.workers)
+        print(f"✅ {build_info['songs']} songs in {build_info['build_index_s']:.1f}s "
+              f"({build_info['songs_per_sec']:.1f} songs/sec), {build_info['postings']:,} postings")
+
+        # warm-up: first STFT / resample call pays one-off setup costs
+        run_query(inv, wav_bytes(catalog[0][1][:int(SR * 3)]))
+
+        rng = query_rng(args.seed)
+        rows, cells = [], []
+        for clip_s in args.clip_seconds:
+            for snr in args.snr:
+                hits, aligns = 0, []
+                for _ in range(args.queries):
+                    sid, audio = catalog[rng.integers(len(catalog))]
+                    start = rng.integers(0, len(audio) - int(clip_s * SR))
+                    clip = add_noise(audio[start:start + int(clip_s * SR)], snr, rng)
+                    pred, align, T, counts = run_query(inv, wav_bytes(clip))
+                    ok = pred == sid and align >= MIN_MATCHES
+                    hits += ok
+                    aligns.append(align)
+                    rows.append({"clip_s": clip_s, "snr_db": snr, **T, **{f"n_{k}": v for k, v in counts.items()}})
+                cells.append({"clip_s": clip_s, "snr_db": snr, "queries": args.queries,
+                              "top1": round(hits / args.queries, 4), "mean_align": round(float(np.mean(aligns)), 1)})
+                print(f"   clip {clip_s:>4.1f}s  SNR {snr:>5.1f} dB  top-1 {hits / args.queries:6.1%}  "
+                      f"align {np.mean(aligns):7.1f}", flush=True)
+
+        stages = {s: summarize([r[s] for r in rows]) for s in STAGES}
+        stages["total"] = summarize([sum(r[s] for s in STAGES) for r in rows])
+        by_clip = {str(c): {s: summarize([r[s] for r in rows if r["clip_s"] == c]) for s in STAGES}
+                   for c in args.clip_seconds}
+        counts = {k: summarize([r[f"n_{k}"] for r in rows]) for k in COUNTS}
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            **torch_info(),
+            "args": vars(args),
+        },
+        "build": build_info,
+        "stages_ms": stages,
+        "stages_ms_by_clip": by_clip,
+        "counts": counts,
+        "accuracy": cells,
+        "top1_overall": round(float(np.mean([c["top1"] for c in cells])), 4),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def torch_info():
+    """torch version and threads, imported only when the torch backend runs (numpy needs no torch)."""
+    if dsp.DSP_BACKEND != "torch":
+        return {"dsp_backend": dsp.DSP_BACKEND}
+    import torch
+    return {"dsp_backend": "torch", "torch": torch.__version__, "threads": torch.get_num_threads()}
+
+
+def print_report(r):
+    print(f"\n{'stage':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for s, v in r["stages_ms"].items():
+        print(f"{s:<10}{v['mean']:>10.2f}{v['p50']:>10.2f}{v['p95']:>10.2f}")
+    print("   " + ", ".join(f"{k} p50 {v['p50']:.0f}" for k, v in r["counts"].items()))
+    print(f"   top-1 over all cells: {r['top1_overall']:.1%}")
+
+
+def compare(new, old, tolerance, acc_drop):
+    """Print deltas vs an older run -> True if anything regressed past the thresholds."""
+    print(f"\n📊 vs {old['meta'].get('commit')} ({old['meta'].get('date')})")
+    regressed = False
+    for s, v in new["stages_ms"].items():
+        if s not in old["stages_ms"]:
+            continue
+        o = old["stages_ms"][s]["p50"]
+        ratio = v["p50"] / o if o else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance and v["p50"] - o > 0.1:      # ignore sub-0.1 ms jitter
+            flag, regressed = "  ⚠️ slower", True
+        print(f"   {s:<10} p50 {o:8.2f} → {v['p50']:8.2f} ms  ({ratio:5.2f}x){flag}")
+    old_cells = {(c["clip_s"], c["snr_db"]): c for c in old["accuracy"]}
+    for c in new["accuracy"]:
+        o = old_cells.get((c["clip_s"], c["snr_db"]))
+        if o is None:
+            continue
+        d = c["top1"] - o["top1"]
+        flag = ""
+        if d < -acc_drop:
+            flag, regressed = "  ⚠️ less accurate", True
+        if d or flag:
+            print(f"   clip {c['clip_s']}s SNR {c['snr_db']} dB: top-1 {o['top1']:.1%} → {c['top1']:.1%}{flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Per-stage timings and accuracy on a synthetic catalog")
+    ap.add_argument("--songs", type=int, default=40)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--queries", type=int, default=20, help="clips per (SNR, clip length) cell")
+    ap.add_argument("--snr", type=float, nargs="+", default=[20, 10, 5, 0, -5], help="dB")
+    ap.add_argument("--clip-seconds", type=float, nargs="+", default=[3, 5, 10])
+    ap.add_argument("--workers", type=int, default=1, help="build_index worker processes")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--peak-engine", choices=["scipy", "torch"], default=dsp.PEAK_ENGINE)
+    ap.add_argument("--peaks-per-frame", type=int, default=dsp.PEAKS_PER_FRAME, help="cap peaks per frame (index + queries)")
+    ap.add_argument("--json", help="write the report here")
+    ap.add_argument("--compare", help="earlier --json report to diff against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown per stage (0.25 = 25%%)")
+    ap.add_argument("--acc-drop", type=float, default=0.05, help="allowed top-1 drop per cell")
+    ap.add_argument("--fail-on-regression", action="store_true")
+    args = ap.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressed = compare(report, json.load(f), args.tolerance, args.acc_drop)
+        if regressed and args.fail_on_regression:
+            sys.exit(1)
@@ -0,0 +1,130 @@
+# benchmarks/bench_startup.py
+"""
+Import cost and server cold start.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --songs 50 --json startup.json
+
+1. `python -X importtime -c "import <module>"` for the DSP module and the server,
+   reporting wall time, whether anything was printed, and the heaviest direct imports.
+2. Starts `uvicorn src.server.api:app` on a synthetic flat index (metadata
+   lookups off) and measures time until it answers (uvicorn only listens once
+   the lifespan startup has loaded the index and built the transforms) and the
+   latency of the first and second /recognize.
+"""
+import os, sys, json, time, socket, shutil, tempfile, argparse, subprocess
+sys.path.append(os.path.abspath("."))
+
+import httpx
+
+MODULES = ["src.dsp", "src.streaming", "src.server.api"]
+
+
+def importtime(module):
+    t0 = time.time()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, cwd=os.path.abspath("."))
+    wall = time.time() - t0
+    top, children = [], []
+    for line in proc.stderr.splitlines():
+        # "import time: <self us> | <cumulative us> | <2 spaces per level><module>"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            top.append((name.strip(), int(cum_us)))
+        elif depth == 1:
+            children.append((name.strip(), int(cum_us)))
+    children.sort(key=lambda r: -r[1])
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "wall_s": round(wall, 3),
+        "cumulative_s": round(sum(c for _, c in top) / 1e6, 3),
+        "stdout_lines": len(proc.stdout.splitlines()),     # should be 0: no banners at import
+        "heaviest": [{"module": n, "ms": round(c / 1000, 1)} for n, c in children[:8]],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cold_start(n_songs, seconds, timeout=120):
+    from benchmarks.synth import make_catalog, build_catalog_index, wav_bytes
+    tmp = tempfile.mkdtemp(prefix="sonar_startup_")
+    try:
+        catalog = make_catalog(n_songs, seconds)
+        n_post = build_catalog_index(os.path.join(tmp, "flat"), catalog)
+        clip = wav_bytes(catalog[0][1][5 * 22050:12 * 22050])
+
+        port = free_port()
+        env = {**os.environ, "SONAR_FLAT_INDEX": os.path.join(tmp, "flat"),
+               "SONAR_SEGMENTS": os.path.join(tmp, "none"), "SONAR_SHARDS": os.path.join(tmp, "none"),
+               "SONAR_CACHE_FILE": os.path.join(tmp, "none.pkl"), "SONAR_SPOTIFY_META": "0",
+               "SONAR_META_DB": os.path.join(tmp, "meta.sqlite")}
+        t0 = time.time()
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.server.api:app", "--port", str(port)],
+                                  env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        try:
+            # uvicorn binds the port only after the lifespan startup (index + transforms) finished
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError("server exited during startup")
+                if time.time() - t0 > timeout:
+                    raise TimeoutError("server did not come up")
+                try:
+                    if httpx.get(f"{url}/stats", timeout=1).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.05)
+            ready = time.time() - t0
+            t1 = time.time()
+            res = httpx.post(f"{url}/recognize", files={"audio": ("q.wav", clip, "audio/wav")}, timeout=60).json()
+            first = time.time() - t1
+            t2 = time.time()
+            httpx.post(f"{url}/recognize", files={"audio": ("q.wav", clip, "audio/wav")}, timeout=60)
+            second = time.time() - t2
+        finally:
+            server.terminate()
+            server.wait()
+        return {
+            "songs": n_songs, "postings": n_post,
+            "ready_s": round(ready, 3),
+            "first_request_ms": round(first * 1000, 1),
+            "second_request_ms": round(second * 1000, 1),
+            "time_to_first_result_s": round(ready + first, 3),
+            "first_result": res.get("title") if res.get("success") else res.get("message"),
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Import time and time-to-first-request")
+    ap.add_argument("--songs", type=int, default=20)
+    ap.add_argument("--seconds", type=float, default=30.0, help="length of each synthetic song")
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = {"imports": [importtime(m) for m in MODULES]}
+    for r in report["imports"]:
+        print(f"📦 import {r['module']:<18} {r['wall_s']:>6.2f}s wall, {r['cumulative_s']:.2f}s in imports, "
+              f"{r['stdout_lines']} lines printed{'' if r['ok'] else '  ❌ FAILED'}")
+        for h in r["heaviest"][:4]:
+            print(f"      {h['module']:<28} {h['ms']:>8.1f} ms")
+
+    print("🚀 Cold-starting uvicorn on a synthetic index...")
+    report["server"] = cold_start(args.songs, args.seconds)
+    s = report["server"]
+    print(f"✅ ready in {s['ready_s']:.2f}s; first /recognize {s['first_request_ms']:.0f} ms "
+          f"(second {s['second_request_ms']:.0f} ms) → {s['first_result']}")
+    print(f"   time to first result: {s['time_to_first_result_s']:.2f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
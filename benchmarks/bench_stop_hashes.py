@@ -0,0 +1,115 @@
+# benchmarks/bench_stop_hashes.py
+"""
+Stop-hash pruning and the query postings budget: latency vs accuracy.
+
+    python benchmarks/bench_stop_hashes.py
+    python benchmarks/bench_stop_hashes.py --songs 200 --max-bucket 1000 300 100 --budget 20000 5000 --json stop.json
+
+1. Builds a seeded synthetic catalog whose songs share a drum/bass motif
+   (synth.py, --common), so some (f1, f2, dt) landmarks land in most songs
+   the way low bass bins do in real music, and prints the bucket-size stats.
+2. Fingerprints --queries noisy clips once.
+3. For every --max-bucket threshold (drop or cap at build time) writes a
+   flat index, then for every --budget (postings read per query, rarest
+   hashes first) runs all clips through lookup + voting. Reports top-1
+   accuracy, false matches (wrong song above MIN_MATCHES), p50/p95
+   lookup+voting ms and postings touched per query.
+
+Pick the smallest threshold / budget whose accuracy matches the unpruned row.
+"""
+import os, sys, json, time, shutil, tempfile, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, MIN_MATCHES, gather_postings, best_alignment
+from src.flat_index import write_flat_index, load_flat_index, bucket_stats, print_bucket_stats, prune_buckets
+from benchmarks.synth import make_catalog, catalog_inv, fingerprint, query_rng, add_noise
+
+
+def make_queries(catalog, args):
+    rng = query_rng(args.seed)
+    queries = []
+    for snr in args.snr:
+        for _ in range(args.queries):
+            sid, audio = catalog[rng.integers(len(catalog))]
+            start = rng.integers(0, len(audio) - int(args.clip_seconds * SR))
+            clip = add_noise(audio[start:start + int(args.clip_seconds * SR)], snr, rng)
+            queries.append((snr, sid, fingerprint(clip)))
+    return queries
+
+
+def run_grid(inv, queries, budget):
+    rows = []
+    for snr, sid, qhashes in queries:
+        t0 = time.perf_counter()
+        sids, offs = gather_postings(inv, qhashes, budget=budget or 0)
+        pred, align, _ = best_alignment(sids, offs)
+        ms = (time.perf_counter() - t0) * 1000
+        rows.append((snr, pred == sid and align >= MIN_MATCHES, ms, len(sids), pred != sid and align >= MIN_MATCHES))
+    ms = np.array([r[2] for r in rows])
+    post = np.array([r[3] for r in rows])
+    return {
+        "budget": budget,
+        "top1": round(float(np.mean([r[1] for r in rows])), 4),
+        "false_match": round(float(np.mean([r[4] for r in rows])), 4),
+        "top1_by_snr": {str(s): round(float(np.mean([r[1] for r in rows if r[0] == s])), 4) for s in sorted({r[0] for r in rows})},
+        "ms_p50": round(float(np.percentile(ms, 50)), 3), "ms_p95": round(float(np.percentile(ms, 95)), 3),
+        "postings_p50": int(np.percentile(post, 50)), "postings_p95": int(np.percentile(post, 95)),
+    }
+
+
+def run(args):
+    print(f"🔧 Fingerprinting {args.songs} synthetic songs (shared motif level {args.common})...", flush=True)
+    catalog = make_catalog(args.songs, args.song_seconds, seed=args.seed, common=args.common)
+    inv, meta = catalog_inv(catalog)
+    stats = bucket_stats([len(v) for v in inv.values()])
+    print_bucket_stats(stats)
+    queries = make_queries(catalog, args)
+    gather_postings(inv, queries[0][2], budget=0)          # warm-up
+
+    results = []
+    tmp = tempfile.mkdtemp(prefix="sonar_stop_")
+    try:
+        for max_bucket in [None] + args.max_bucket:
+            pruned_inv, pruned = dict(inv), None
+            if max_bucket:
+                pruned = prune_buckets(pruned_inv, max_bucket, args.stop_mode, verbose=False)
+            out = os.path.join(tmp, f"flat_{max_bucket}")
+            write_flat_index(out, pruned_inv, meta)
+            flat, _ = load_flat_index(out)
+            label = f"max_bucket {max_bucket}" if max_bucket else "no pruning"
+            print(f"\n{label}: {flat.n_postings:,} postings"
+                  + (f" ({pruned['buckets']} buckets, {pruned['postings_removed']:,} postings {args.stop_mode}ped)" if pruned else ""))
+            print(f"   {'budget':>8}  {'top-1':>6}  {'false':>6}  {'ms p50':>7}  {'ms p95':>7}  {'postings p50':>12}  {'p95':>7}")
+            for budget in [None] + args.budget:
+                r = run_grid(flat, queries, budget)
+                r.update({"max_bucket": max_bucket, "index_postings": int(flat.n_postings)})
+                results.append(r)
+                print(f"   {str(budget or '-'):>8}  {r['top1']:6.1%}  {r['false_match']:6.1%}  {r['ms_p50']:7.2f}  {r['ms_p95']:7.2f}  "
+                      f"{r['postings_p50']:12,}  {r['postings_p95']:7,}", flush=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {"args": vars(args), "bucket_stats": stats, "grid": results}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stop-hash threshold / postings budget vs latency and accuracy")
+    ap.add_argument("--songs", type=int, default=100)
+    ap.add_argument("--song-seconds", type=float, default=30.0)
+    ap.add_argument("--common", type=float, default=0.5, help="level of the motif shared by all songs (0 = none)")
+    ap.add_argument("--queries", type=int, default=30, help="clips per SNR")
+    ap.add_argument("--clip-seconds", type=float, default=5.0)
+    ap.add_argument("--snr", type=float, nargs="+", default=[10, 0])
+    ap.add_argument("--max-bucket", type=int, nargs="*", default=[1000, 300, 100, 30])
+    ap.add_argument("--stop-mode", choices=["drop", "cap"], default="drop")
+    ap.add_argument("--budget", type=int, nargs="*", default=[20000, 5000, 2000, 1000])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    report = run(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.json}")
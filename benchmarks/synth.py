@@ -0,0 +1,108 @@
+# benchmarks/synth.py
+"""
+Seeded synthetic catalog for benchmarks: songs made of random tone bursts and
+chirps over noise, fingerprinted with the real DSP pipeline and written as a
+flat index (or as a dataset/ tree of WAVs for src/index_constellation.py).
+No network, no real music.
+"""
+import os, sys
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import SR, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks
+from src.flat_index import write_flat_index
+
+
+# a kick / bass / snare-like motif shared by every song when common > 0: its notes are more than
+# PEAK_NEIGHBORHOOD bins apart and within one fan-out span, so the same (f1, f2, dt) landmarks
+# recur across the catalog like real drum and bass patterns do
+MOTIF = [(60.0, 0.0), (350.0, 0.05), (900.0, 0.1), (2000.0, 0.15)]    # (Hz, seconds after the beat)
+BEAT_SECONDS = 0.5
+
+
+def make_song(seconds, seed, sr=SR, common=0.0):
+    """Mono float32 audio: overlapping tone bursts and chirps (random pitch / onset / decay) plus light noise.
+
+    common: level of the shared MOTIF (0 leaves the song unchanged; ~0.5 makes strong stop hashes).
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    x = 0.01 * rng.standard_normal(n)
+    t = np.arange(int(0.6 * sr)) / sr
+    for onset in rng.uniform(0, seconds - 0.6, size=int(seconds * 6)):
+        f0 = rng.uniform(80, 5000)
+        f1 = f0 if rng.random() < 0.7 else rng.uniform(80, 5000)      # 30% linear chirps
+        phase = 2 * np.pi * (f0 * t + (f1 - f0) * t ** 2 / (2 * t[-1]))
+        burst = np.sin(phase) * np.exp(-t * rng.uniform(2, 10)) * rng.uniform(0.1, 0.5)
+        a = int(onset * sr)
+        x[a:a + len(burst)] += burst
+    if common:
+        tb = np.arange(int(0.3 * sr)) / sr
+        for beat in np.flatnonzero(rng.random(int(seconds / BEAT_SECONDS) - 1) < 0.5):    # motif on ~half the beats
+            for f, dt in MOTIF:
+                a = int((beat * BEAT_SECONDS + dt) * sr)
+                x[a:a + len(tb)] += np.sin(2 * np.pi * f * tb) * np.exp(-tb * 8) * common
+    return (x / np.abs(x).max() * 0.8).astype(np.float32)
+
+
+def make_catalog(n_songs, seconds=30.0, seed=0, common=0.0):
+    """-> [(song_id, audio)]; song i is seeded with (seed, 0, i)."""
+    return [(i, make_song(seconds, [seed, 0, i], common=common)) for i in range(n_songs)]
+
+
+def query_rng(seed):
+    """RNG for picking / noising query clips, independent of every song's stream.
+
+    (Reusing a song's seed would make the added noise identical to that song's
+    noise floor, which then "matches" at offset 0.)
+    """
+    return np.random.default_rng([seed, 1])
+
+
+def add_noise(audio, snr_db, rng):
+    """White noise at the given signal-to-noise ratio (dB)."""
+    p = float(np.mean(audio ** 2))
+    noise = rng.standard_normal(len(audio)) * np.sqrt(p / 10 ** (snr_db / 10))
+    return (audio + noise).astype(np.float32)
+
+
+def write_dataset(dataset_dir, catalog, sr=SR):
+    """dataset/<artist>/<title>.wav layout expected by src/index_constellation.py.
+
+    Song IDs there follow sorted file names, which match catalog order.
+    """
+    from scipy.io.wavfile import write
+    adir = os.path.join(dataset_dir, "Synthetic")
+    os.makedirs(adir, exist_ok=True)
+    for sid, audio in catalog:
+        write(os.path.join(adir, f"song_{sid:05d}.wav"), sr, audio)
+
+
+def fingerprint(audio, sr=SR):
+    return hashes_from_peaks(peak_coords(spectrogram_db_from_tensor(audio[None], sr)))
+
+
+def catalog_inv(catalog):
+    """Fingerprint every song -> ({hash: [[sid, t_sec], ...]}, meta_by_id)."""
+    inv = {}
+    for sid, audio in catalog:
+        for h, t in fingerprint(audio):
+            inv.setdefault(h, []).append([sid, t])
+    meta = {sid: {"id": sid, "artist": "Synthetic", "title": f"song_{sid:05d}.wav"} for sid, _ in catalog}
+    return inv, meta
+
+
+def build_catalog_index(out_dir, catalog):
+    """Fingerprint every song and write a flat index -> n_postings."""
+    inv, meta = catalog_inv(catalog)
+    write_flat_index(out_dir, inv, meta)
+    return sum(len(v) for v in inv.values())
+
+
+def wav_bytes(audio, sr=SR):
+    import io
+    from scipy.io.wavfile import write
+    buf = io.BytesIO()
+    write(buf, sr, audio)
+    return buf.getvalue()
@@ -0,0 +1,487 @@
+# src/dsp.py
+"""
+Pure DSP + matching helpers shared by the indexer, the mic recognizer and the server.
+
+Importing this module does no I/O: no audio devices, no index, no CUDA, no
+banners. torch/torchaudio are imported, and the STFT transforms built, on the
+first spectrogram call, or up front with warm_up().
+
+DSP_BACKEND = "numpy" computes the same spectrogram with NumPy/SciPy
+(strided frames + rfft, polyphase resampling) and never imports torch;
+together with PEAK_ENGINE = "scipy" a CPU-only server runs without PyTorch.
+Audio arguments may be numpy arrays or torch tensors with either backend.
+"""
+import os, hashlib, threading
+import numpy as np
+
+from src.flat_index import budget_mask
+
+# ================== CONFIG (shared by indexer and recognizer) ==================
+DSP_BACKEND = os.environ.get("SONAR_DSP_BACKEND", "torch")   # "torch" | "numpy" (no PyTorch import)
+SR = 22050
+N_FFT = 2048
+HOP = 512
+PEAK_NEIGHBORHOOD = 20      # local-max window (freq x time)
+AMP_DB_MIN = -35            # ignore quiet pixels (raise to -30/-25 to be stricter)
+PEAK_ENGINE = os.environ.get("SONAR_PEAK_ENGINE", "scipy")  # "scipy" | "torch": same peaks, torch runs where the STFT ran
+PEAKS_PER_FRAME = int(os.environ.get("SONAR_PEAKS_PER_FRAME", 0)) or None  # K loudest peaks per frame; changes fingerprints -> rebuild
+FAN_VALUE = 15              # pairs per peak
+MIN_TDELTA = 1              # min time delta (frames)
+MAX_TDELTA = 200            # max time delta (frames)
+MIN_MATCHES = 20
+POSTINGS_BUDGET = int(os.environ.get("SONAR_POSTINGS_BUDGET", 0)) or None  # max postings read per query, rarest hashes first
+CANDIDATES = int(os.environ.get("SONAR_CANDIDATES", 0)) or None   # align only the N songs with most raw hash hits (None = all)
+EARLY_EXIT = float(os.environ.get("SONAR_EARLY_EXIT", 1.0))     # stop aligning when leader > this x next song's hits (0 = off)
+HASH_MODE = "int"           # "int" = packed uint32 keys, "sha1" = legacy hex-string keys
+F_BITS = 11                 # bits per frequency bin (N_FFT // 2 + 1 = 1025 bins)
+DT_BITS = 8                 # bits for the time delta (MAX_TDELTA <= 255)
+# ===============================================================================
+
+_tf = None
+_tf_lock = threading.Lock()
+
+
+def transforms():
+    """-> (device, spec_tf, amp2db_tf), built once on first use."""
+    global _tf
+    if _tf is None:
+        with _tf_lock:
+            if _tf is None:
+                import torch, torchaudio
+                device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                spec_tf = torchaudio.transforms.Spectrogram(n_fft=N_FFT, hop_length=HOP, power=None).to(device)
+                amp2db_tf = torchaudio.transforms.AmplitudeToDB(top_db=80).to(device)
+                _tf = (device, spec_tf, amp2db_tf)
+    return _tf
+
+
+def warm_up():
+    """Build the transforms and run one STFT + peak pick so the first real request doesn't pay for it.
+
+    -> the device spectrograms are computed on ("cpu (numpy)" for the numpy backend).
+    """
+    peak_coords(spectrogram_db_from_tensor(np.zeros((1, SR), dtype=np.float32), SR))
+    if DSP_BACKEND == "numpy":
+        return "cpu (numpy)"
+    return transforms()[0]
+
+
+# ---- Audio I/O (backend-aware) ----
+def load_audio(path):
+    """Audio file -> (wav [C, T] float32, sr): a tensor (torch backend) or an ndarray (numpy backend)."""
+    if DSP_BACKEND == "numpy":
+        import soundfile as sf
+        samples, sr = sf.read(path, dtype="float32", always_2d=True)    # [T, C]
+        return np.ascontiguousarray(samples.T), sr
+    import torchaudio
+    return torchaudio.load(path)
+
+def resample(wav, sr, sr_out=SR):
+    """[..., T] audio from sr to sr_out with torchaudio's resampler (or its NumPy port)."""
+    if sr == sr_out:
+        return wav
+    if DSP_BACKEND == "numpy":
+        return _resample_numpy(np.asarray(wav, dtype=np.float32), int(sr), int(sr_out))
+    import torch, torchaudio
+    return torchaudio.functional.resample(torch.as_tensor(wav), sr, sr_out)
+
+_sinc_kernels = {}
+
+def _resample_numpy(x, sr, sr_out):
+    """Polyphase port of torchaudio.functional.resample (Hann-windowed sinc, width 6, rolloff 0.99).
+
+    After dividing both rates by their gcd, output phase p of every block of
+    `new` samples is one fixed FIR over a window of the input that advances by
+    `orig` samples per block, so the whole resample is one strided matmul.
+    """
+    from math import ceil
+    kernel, width, orig, new = sinc_kernel(sr, sr_out)
+    shape, n = x.shape[:-1], x.shape[-1]
+    xp = np.pad(x.reshape(-1, n), ((0, 0), (width, width + orig)))
+    frames = np.lib.stride_tricks.sliding_window_view(xp, kernel.shape[1], axis=-1)[:, ::orig]
+    y = (frames @ kernel.T).reshape(len(xp), -1)[:, :ceil(new * n / orig)]
+    return y.reshape(*shape, -1)
+
+def sinc_kernel(sr, sr_out):
+    """-> (kernel [new, 2 * width + orig], width, orig, new): the polyphase FIR behind _resample_numpy."""
+    from math import gcd, ceil
+    g = gcd(sr, sr_out)
+    orig, new = sr // g, sr_out // g
+    if (orig, new) not in _sinc_kernels:
+        # same float32 arithmetic as torchaudio, so near-silent bins round the same way
+        base = min(orig, new) * 0.99
+        width = ceil(6 * orig / base)
+        f32 = np.float32
+        t = np.arange(0, -new, -1, dtype=f32)[:, None] / f32(new) + np.arange(-width, width + orig, dtype=f32)[None, :] / f32(orig)
+        t = np.clip(t * f32(base), -6, 6)
+        window = np.cos(t * f32(np.pi / 12)) ** 2
+        t = t * f32(np.pi)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            kernel = np.where(t == 0, f32(1), np.sin(t) / t)
+        _sinc_kernels[orig, new] = (kernel * (window * f32(base / orig)), width)     # [new, 2 * width + orig]
+    kernel, width = _sinc_kernels[orig, new]
+    return kernel, width, orig, new
+
+_hann = None
+
+def _spectrogram_db_numpy(x):
+    """Mono [B, T] float32 -> dB spectrograms [B, F, frames], numerically matching the torch transforms.
+
+    Same as Spectrogram(n_fft=N_FFT, hop_length=HOP) (periodic Hann window,
+    centre frames with reflect padding) followed by AmplitudeToDB(top_db=80)
+    on the magnitude, with top_db clamped per clip.
+    """
+    global _hann
+    from scipy.fft import rfft
+    if _hann is None:
+        _hann = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(N_FFT) / N_FFT)).astype(np.float32)
+    x = np.pad(x, ((0, 0), (N_FFT // 2, N_FFT // 2)), mode="reflect")
+    frames = np.lib.stride_tricks.sliding_window_view(x, N_FFT, axis=-1)[:, ::HOP]   # [B, frames, N_FFT] view
+    db = 10 * np.log10(np.maximum(np.abs(rfft(frames * _hann, axis=-1)), 1e-10))
+    db = np.maximum(db, db.max(axis=(1, 2), keepdims=True) - 80)
+    return np.ascontiguousarray(db.transpose(0, 2, 1), dtype=np.float32)
+
+
+# ---- DSP helpers ----
+def spectrogram_db_from_tensor(wav, sr, keep_on_device=False):
+    """[C, T] audio -> dB spectrogram [F, frames] as numpy (or the device tensor with keep_on_device)."""
+    if DSP_BACKEND == "numpy":
+        wav = resample(np.asarray(wav, dtype=np.float32), sr)
+        return _spectrogram_db_numpy(wav.mean(axis=0, keepdims=True))[0]
+    import torch
+    device, spec_tf, amp2db_tf = transforms()
+    wav = resample(torch.as_tensor(wav), sr)
+    wav = torch.mean(wav, dim=0, keepdim=True).to(device)
+    spec = spec_tf(wav)
+    mag  = torch.abs(spec).squeeze(0)
+    db   = amp2db_tf(mag)
+    if keep_on_device:
+        return db.detach()
+    return db.detach().cpu().numpy()
+
+def spectrogram_db_batch(clips):
+    """Spectrograms for many clips with one STFT call.
+
+    clips: list of ([C, T] tensor, sr). Clips are resampled, mixed to mono,
+    zero-padded to a common length and stacked, so spec_tf/amp2db_tf run once
+    per batch; each result is cropped back to that clip's own frame count.
+    """
+    if DSP_BACKEND == "numpy":
+        # no batching gain without a device to feed; framing + rfft are already vectorized per clip
+        return [spectrogram_db_from_tensor(wav, sr) for wav, sr in clips]
+    import torch
+    device, spec_tf, amp2db_tf = transforms()
+    mono = []
+    for wav, sr in clips:
+        wav = resample(torch.as_tensor(wav), sr)
+        mono.append(torch.mean(wav, dim=0))
+    n = max(w.shape[-1] for w in mono)
+    batch = torch.stack([torch.nn.functional.pad(w, (0, n - w.shape[-1])) for w in mono]).to(device)
+    mag = torch.abs(spec_tf(batch))                 # [B, F, T]
+    db = amp2db_tf(mag.unsqueeze(1)).squeeze(1)     # [B, 1, F, T]: top_db clamp per clip
+    db = db.detach().cpu().numpy()
+    return [db[i, :, :w.shape[-1] // HOP + 1] for i, w in enumerate(mono)]
+
+def peak_coords(S_db):
+    """Local maxima above AMP_DB_MIN -> int64 [N, 2] of [freq_idx, time_idx], sorted by (time, freq).
+
+    S_db may be a numpy array or a torch tensor (on any device); PEAK_ENGINE
+    picks the implementation, PEAKS_PER_FRAME optionally caps peaks per frame.
+    """
+    if PEAK_ENGINE == "torch":
+        peaks, amps = _peaks_torch(S_db)
+    else:
+        peaks, amps = _peaks_scipy(S_db)
+    if PEAKS_PER_FRAME and len(peaks):
+        peaks = top_k_per_frame(peaks, amps, PEAKS_PER_FRAME)
+    return peaks
+
+def _peaks_scipy(S_db):
+    from scipy.ndimage import maximum_filter
+    if not isinstance(S_db, np.ndarray):
+        S_db = S_db.cpu().numpy()
+    local_max = maximum_filter(S_db, size=PEAK_NEIGHBORHOOD) == S_db
+    mask = S_db > AMP_DB_MIN
+    peaks = np.argwhere(local_max & mask)
+    # sort by time index for stable pairing
+    if len(peaks): peaks = peaks[np.argsort(peaks[:, 1], kind="stable")]
+    return peaks, S_db[peaks[:, 0], peaks[:, 1]]
+
+def _sliding_max(x, k, dim):
+    """Max over every length-k window along dim (output shorter by k - 1).
+
+    Doubling: windows of 1, 2, 4, ... are built with one elementwise max each
+    and the binary digits of k are stitched together, so the cost is
+    ~2 log2(k) passes instead of k comparisons per element.
+    """
+    import torch
+    n_out = x.shape[dim] - k + 1
+    res, off, p, w = None, 0, x, 1
+    while True:
+        if k & w:
+            piece = p.narrow(dim, off, n_out)
+            res = piece if res is None else torch.maximum(res, piece)
+            off += w
+        if w * 2 > k:
+            return res
+        m = p.shape[dim] - w
+        p = torch.maximum(p.narrow(dim, 0, m), p.narrow(dim, w, m))
+        w *= 2
+
+def _peaks_torch(S_db):
+    """Same peaks as _peaks_scipy, computed on S_db's device; only the peaks are copied back.
+
+    scipy's size-20 window spans [i-10, i+9] and its default "reflect" border
+    only repeats values already inside that window, so -inf padding of 10/9
+    gives the identical maximum. The 2-D max is separable: freq pass, then time pass.
+    """
+    import torch
+    import torch.nn.functional as F
+    x = torch.as_tensor(S_db)
+    k = PEAK_NEIGHBORHOOD
+    pad = (k // 2, k - 1 - k // 2)
+    m = _sliding_max(F.pad(x.T, pad, value=-float("inf")), k, 1)                 # [T, F]
+    m = _sliding_max(F.pad(m.T.contiguous(), pad, value=-float("inf")), k, 1)    # [F, T]
+    tf = torch.nonzero(((m == x) & (x > AMP_DB_MIN)).T)                        # row-major: time, then freq
+    amps = x[tf[:, 1], tf[:, 0]]
+    return tf.flip(1).cpu().numpy(), amps.cpu().numpy()
+
+def top_k_per_frame(peaks, amps, k):
+    """Keep the k loudest peaks of each frame; (time, freq) order is preserved."""
+    order = np.lexsort((-amps, peaks[:, 1]))                    # by frame, loudest first
+    t = peaks[order, 1]
+    starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+    rank = np.arange(len(t)) - np.repeat(starts, np.diff(np.r_[starts, len(t)]))
+    return peaks[np.sort(order[rank < k])]
+
+def hash_arrays_from_peaks(peaks, n_anchors=None):
+    """Vectorized fan-out pairing.
+
+    Packs every (f1, f2, dt) landmark into a uint32 key
+    (f1 << 19 | f2 << 8 | dt) and returns (hashes, anchor_frames), in the
+    same order as the legacy nested loop. n_anchors limits pairing to the
+    first n peaks as anchors (later peaks still serve as partners).
+    """
+    L = len(peaks)
+    n = L if n_anchors is None else min(n_anchors, L)
+    if L < 2 or n < 1:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.int64)
+    f = peaks[:, 0].astype(np.uint32)
+    t = peaks[:, 1].astype(np.int64)
+    i = np.arange(n)[:, None]
+    j = i + np.arange(1, FAN_VALUE)[None, :]          # [L, FAN_VALUE-1] partner indices
+    ok = j < L
+    j = np.minimum(j, L - 1)
+    dt = t[j] - t[i]
+    ok &= (dt >= MIN_TDELTA) & (dt <= MAX_TDELTA)
+    a, b = np.broadcast_to(i, j.shape)[ok], j[ok]
+    h = (f[a] << np.uint32(F_BITS + DT_BITS)) | (f[b] << np.uint32(DT_BITS)) | dt[ok].astype(np.uint32)
+    return h, t[a]
+
+def hashes_from_peaks(peaks):
+    hop_sec = HOP / SR
+    if HASH_MODE == "int":
+        h, t1 = hash_arrays_from_peaks(peaks)
+        return list(zip(h.tolist(), (t1 * hop_sec).tolist()))  # time in seconds
+
+    H = []
+    L = len(peaks)
+    for i in range(L):
+        f1, t1 = peaks[i]
+        for j in range(1, FAN_VALUE):
+            if i+j >= L: break
+            f2, t2 = peaks[i+j]
+            dt = t2 - t1
+            if MIN_TDELTA <= dt <= MAX_TDELTA:
+                raw = f"{int(f1)}|{int(f2)}|{int(dt)}"
+                h = hashlib.sha1(raw.encode()).hexdigest()[:20]
+                H.append((h, t1 * hop_sec))
+    return H
+
+
+
+def check_key_type(key_type, where):
+    """Fail fast on an index built under the other HASH_MODE: none of its keys would ever match."""
+    if key_type != HASH_MODE:
+        raise ValueError(f'{where} has {key_type} hash keys but HASH_MODE = "{HASH_MODE}": rebuild it '
+                         f'(python src/index_constellation.py) or set HASH_MODE = "{key_type}" in src/dsp.py')
+
+
+def json_hash_keys(inv, where="inverted_index.json"):
+    """inverted_index.json dict -> keyed like hashes_from_peaks under HASH_MODE.
+
+    JSON object keys are always strings. sha1 keys are 20 hex chars and packed
+    uint32 keys at most 10 digits, so the key length tells the index's mode;
+    an all-digit hex key must not be mistaken for an int.
+    """
+    first = next(iter(inv), None)
+    if first is not None:
+        check_key_type("sha1" if len(first) == 20 else "int", where)
+    return {int(h): v for h, v in inv.items()} if HASH_MODE == "int" else inv
+
+
+# ---- Vectorized voting ----
+def bucket_sizes(inv, hashes):
+    """Postings per query hash (0 where absent) -> int64 array."""
+    if hasattr(inv, "bucket_sizes"):
+        return inv.bucket_sizes(hashes)
+    return np.array([len(inv.get(h, ())) for h in hashes], dtype=np.int64)
+
+def lookup_postings(inv, hashes, budget=None):
+    """-> (postings [N, 2] float64, query index per posting).
+
+    Uses inv.lookup() when the index has one (FlatIndex, SegmentedIndex);
+    a plain dict index (values: [N, 2] arrays or lists) is walked bucket by bucket.
+    budget caps the postings read, rarest hashes first (None: POSTINGS_BUDGET, 0: no cap).
+    """
+    budget = POSTINGS_BUDGET if budget is None else budget
+    if hasattr(inv, "lookup"):
+        return inv.lookup(hashes, budget=budget)
+    if budget and len(hashes):
+        sizes = bucket_sizes(inv, hashes)
+        if sizes.sum() > budget:
+            sel = np.flatnonzero(budget_mask(sizes, budget))
+            post, qi = lookup_postings(inv, [hashes[i] for i in sel], budget=0)
+            return post, sel[qi]
+    arrs, qi = [], []
+    for i, h in enumerate(hashes):
+        a = inv.get(h)
+        if a is None or len(a) == 0:
+            continue
+        arrs.append(np.asarray(a, dtype=np.float64).reshape(-1, 2))
+        qi.append(i)
+    if not arrs:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    return np.concatenate(arrs), np.repeat(qi, [len(a) for a in arrs])
+
+def _to_votes(post, qt):
+    sids = post[:, 0].astype(np.int64)
+    offs = np.rint((post[:, 1] - qt) * (SR / HOP)).astype(np.int64)
+    return sids, offs
+
+def _lookup_votes(inv, hashes, qt, budget):
+    """-> (song_ids, offset_frames, query index per posting).
+
+    Indexes that store integer frames (FlatIndex, SegmentedIndex) give exact
+    offsets: db_frame - query_frame, no float times involved.
+    """
+    if hasattr(inv, "lookup_frames"):
+        sids, frames, qi = inv.lookup_frames(hashes, budget=POSTINGS_BUDGET if budget is None else budget)
+        return sids, frames - np.rint(qt * (SR / HOP)).astype(np.int64)[qi], qi
+    post, qi = lookup_postings(inv, hashes, budget)
+    return (*_to_votes(post, qt[qi]), qi)
+
+def gather_postings(inv, qhashes, budget=None):
+    """Concatenate every posting hit by the query (within the postings budget, see lookup_postings).
+
+    Returns (song_ids, offset_frames) as int64 arrays, where the offset is
+    (db_time - query_time) quantized to STFT frames.
+    """
+    if not qhashes:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    qt = np.fromiter((t for _, t in qhashes), dtype=np.float64, count=len(qhashes))
+    sids, offs, _ = _lookup_votes(inv, [h for h, _ in qhashes], qt, budget)
+    return sids, offs
+
+def gather_postings_batch(inv, qhash_lists, budget=None):
+    """gather_postings for many clips with a single index lookup -> [(song_ids, offset_frames), ...].
+
+    The postings budget applies per clip.
+    """
+    budget = POSTINGS_BUDGET if budget is None else budget
+    n_per_clip = [len(q) for q in qhash_lists]
+    flat = [x for q in qhash_lists for x in q]
+    hashes = [h for h, _ in flat]
+    qt = np.fromiter((t for _, t in flat), dtype=np.float64, count=len(flat))
+    sel = np.arange(len(flat))
+    if budget and flat:
+        sizes = bucket_sizes(inv, hashes)
+        bounds = np.cumsum([0] + n_per_clip)
+        sel = np.flatnonzero(np.concatenate([budget_mask(sizes[a:b], budget) for a, b in zip(bounds[:-1], bounds[1:])]))
+        hashes = [hashes[i] for i in sel]
+    sids, offs, qi = _lookup_votes(inv, hashes, qt[sel], budget=0)
+    qi = sel[qi]
+    # postings come back grouped by query index, which is grouped by clip
+    cuts = np.searchsorted(qi, np.cumsum(n_per_clip)[:-1]) if len(n_per_clip) > 1 else []
+    return list(zip(np.split(sids, cuts), np.split(offs, cuts)))
+
+def offset_histogram(sids, offs):
+    """Collapse votes into unique (song, offset) pairs -> (sids, offs, counts)."""
+    if len(sids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    base = offs.min()
+    span = int(offs.max() - base) + 1
+    keys, counts = np.unique(sids * span + (offs - base), return_counts=True)
+    return keys // span, keys % span + base, counts
+
+def song_alignments(sids, offs, counts=None):
+    """Per-song offset histogram peak -> (songs, align, total), songs ascending.
+
+    counts weights each (song, offset) vote, so partial histograms (e.g. from
+    index shards) can be concatenated and merged exactly.
+    """
+    if len(sids) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    offs = offs - offs.min()
+    span = int(offs.max()) + 1
+    if counts is None:
+        keys, counts = np.unique(sids * span + offs, return_counts=True)
+    else:
+        keys, idx = np.unique(sids * span + offs, return_inverse=True)
+        counts = np.bincount(idx, weights=counts).astype(np.int64)
+    song = keys // span
+    starts = np.flatnonzero(np.r_[True, song[1:] != song[:-1]])
+    return song[starts], np.maximum.reduceat(counts, starts), np.add.reduceat(counts, starts)
+
+def candidate_alignments(sids, offs, counts=None, top_n=None, early_exit=None):
+    """Two-stage song_alignments: rank songs by raw hash hits, then align only the leaders.
+
+    Stage 1 is one bincount over the votes (song IDs are dense). Stage 2 builds
+    offset histograms for the top_n songs by hits, best first in rounds of
+    1, 2, 4, ... songs, and stops once the leader's alignment exceeds early_exit x
+    the hits of the next song in line. A song never aligns more votes than it
+    has, so early_exit=1 with no top_n gives the same best song as
+    song_alignments. -> (songs, align, total) of the aligned songs, songs ascending.
+    """
+    top_n = CANDIDATES if top_n is None else top_n
+    early_exit = EARLY_EXIT if early_exit is None else early_exit
+    if len(sids) == 0:
+        return song_alignments(sids, offs, counts)
+    hits = np.bincount(sids, weights=counts).astype(np.int64) if counts is not None else np.bincount(sids)
+    songs = np.flatnonzero(hits)
+    order = np.lexsort((songs, -hits[songs]))        # most hits first, ties to the smaller ID
+    ranked, ranked_hits = songs[order][:top_n or None], hits[songs[order]][:top_n or None]
+    rank = np.full(len(hits), len(ranked), dtype=np.int64)
+    rank[ranked] = np.arange(len(ranked))
+    vote_rank = rank[sids]
+
+    parts, best_align, done, step = [], 0, 0, 1
+    while done < len(ranked):
+        end = min(len(ranked), done + step)
+        sel = (vote_rank >= done) & (vote_rank < end)
+        part = song_alignments(sids[sel], offs[sel], None if counts is None else counts[sel])
+        parts.append(part)
+        best_align = max(best_align, int(part[1].max()))
+        done, step = end, step * 2
+        if early_exit and done < len(ranked) and best_align > early_exit * ranked_hits[done]:
+            break
+    songs, align, total = (np.concatenate(x) for x in zip(*parts))
+    order = np.argsort(songs)
+    return songs[order], align[order], total[order]
+
+def best_alignment(sids, offs, counts=None):
+    """-> (best_sid, best_align, best_total); ties on align go to the larger total.
+
+    Only the songs candidate_alignments picks are aligned (CANDIDATES, EARLY_EXIT).
+    """
+    return pick_best(*candidate_alignments(sids, offs, counts))
+
+def pick_best(songs, align, total):
+    """song_alignments() output -> (best_sid, best_align, best_total)."""
+    if len(songs) == 0:
+        return None, 0, 0
+    best = np.lexsort((-total, -align))[0]
+    return int(songs[best]), int(align[best]), int(total[best])
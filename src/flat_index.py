@@ -0,0 +1,585 @@
+# src/flat_index.py
+"""
+Flat (CSR) inverted index stored as plain .npy files:
+
+    keys.npy         sorted hash keys               [H]    uint32 (uint64 for legacy SHA-1 keys)
+    offsets.npy      bucket boundaries              [H+1]  uint32 (int64 past 4G postings)
+    packed.npy       bit-packed postings            [bytes] uint8
+    block_width.npy  bits per posting, per block    [B]    uint8
+    block_start.npy  byte offset of every block     [B]    int64
+    songs_meta.json
+    header.json
+
+A posting is (song_id, frame), both integers, held as v = song_id << frame_bits | frame.
+Within a bucket postings are sorted by v and stored as deltas (the first one
+raw); every block of BLOCK postings is packed with the bit width of its largest
+delta, so long lists of one song cost a few bits per posting. Any posting can be
+decoded without touching its neighbours: its block gives the width and offset.
+
+Version 1 indexes (postings.npy [N, 2] float32 (song_id, t_sec)) are still read.
+
+Opened with np.memmap (np.load(mmap_mode="r")) it costs a few syscalls instead of
+unpickling millions of small arrays; buckets are found with np.searchsorted.
+"""
+import os, json, gzip, time, shutil, pickle
+import numpy as np
+try:
+    import fcntl
+except ImportError:                 # Windows
+    fcntl = None
+    import msvcrt
+
+FLAT_VERSION = 2
+BLOCK = 64                  # postings per bit-packing block (a multiple of 8 keeps blocks byte-aligned)
+MAX_VALUE_BITS = 56         # song_id + frame bits; with a 7-bit shift still fits one uint64 read
+
+
+def _hex_key(h):
+    # legacy SHA-1 hashes are 20 hex chars (80 bits); the first 64 bits are plenty for a key
+    return int(h[:16], 16)
+
+
+def budget_mask(sizes, budget):
+    """Query hashes to visit under a postings budget: rarest buckets first, stop when the next doesn't fit.
+
+    Common landmarks (bass notes, hum) hit thousands of songs and carry
+    little evidence, so they are the ones skipped.
+    """
+    order = np.argsort(sizes, kind="stable")
+    keep = np.zeros(len(sizes), dtype=bool)
+    keep[order[np.cumsum(sizes[order]) <= budget]] = True
+    return keep
+
+
+def _frame_rate():
+    from src.dsp import SR, HOP          # lazy: src.dsp imports this module
+    return SR / HOP
+
+
+# ---- posting compression ----
+def _bit_length(x):
+    """Bits needed for each uint64 value (0 for 0)."""
+    n = np.zeros(len(x), dtype=np.uint8)
+    for s in range(64):
+        n += (x >> np.uint64(s)) > 0
+    return n
+
+
+def pack_postings(song_ids, frames, first, frame_bits=None, prev=None):
+    """Compress postings sorted by (song, frame) within each bucket.
+
+    first: bool [N], True at the first posting of every bucket.
+    frame_bits: fixed width of the frame field (default: just enough for these frames).
+    prev: packed value of the posting before song_ids[0], when a bucket continues
+    from an earlier call (FlatWriter packs a stream of postings block by block).
+    -> (packed uint8, block_width uint8, block_start int64, frame_bits)
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    song_ids = np.asarray(song_ids, dtype=np.int64)
+    if len(frames) and (frames.min() < 0 or song_ids.min() < 0):
+        raise ValueError("song ids and frames must be non-negative")
+    if frame_bits is None:
+        frame_bits = max(1, int(frames.max()).bit_length()) if len(frames) else 1
+    elif len(frames) and int(frames.max()).bit_length() > frame_bits:
+        raise ValueError(f"frames need more than {frame_bits} bits")
+    if len(song_ids) and int(song_ids.max()).bit_length() + frame_bits > MAX_VALUE_BITS:
+        raise ValueError(f"song id / frame range needs more than {MAX_VALUE_BITS} bits")
+    v = (song_ids.astype(np.uint64) << np.uint64(frame_bits)) | frames.astype(np.uint64)
+    d = v.copy()
+    # uint64 deltas wrap where a new bucket starts below the previous value; those
+    # slots are overwritten by d[first] below. Array arithmetic wraps silently,
+    # a scalar d[0] -= prev would warn about the (intended) overflow.
+    d[1:] -= v[:-1]
+    if prev is not None and len(d):
+        d[:1] -= np.uint64(prev)
+    d[first] = v[first]
+
+    n_blocks = -(-len(d) // BLOCK)
+    D = np.zeros(n_blocks * BLOCK, dtype=np.uint64)
+    D[:len(d)] = d
+    D = D.reshape(n_blocks, BLOCK)
+    width = _bit_length(D.max(axis=1)) if n_blocks else np.zeros(0, dtype=np.uint8)
+    nbytes = width.astype(np.int64) * (BLOCK // 8)
+    start = np.zeros(n_blocks, dtype=np.int64)
+    np.cumsum(nbytes[:-1], out=start[1:])
+
+    packed = np.zeros(int(nbytes.sum()) + 8, dtype=np.uint8)     # +8: every read is one 8-byte load
+    for w in np.unique(width):
+        if w == 0:
+            continue
+        rows = np.flatnonzero(width == w)
+        for a in range(0, len(rows), 16384):                     # bounds the [rows, BLOCK, w] bit array
+            r = rows[a:a + 16384]
+            bits = ((D[r, :, None] >> np.arange(w, dtype=np.uint64)) & np.uint64(1)).astype(np.uint8)
+            packed[start[r, None] + np.arange(int(w) * BLOCK // 8)] = \
+                np.packbits(bits.reshape(len(r), -1), axis=1, bitorder="little")
+    return packed, width, start, frame_bits
+
+
+def unpack_postings(packed, block_width, block_start, frame_bits, pos, lens):
+    """Decode the postings at flat positions pos, which cover whole buckets of sizes lens in order.
+
+    -> (song_ids, frames) int64
+    """
+    if len(pos) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    b = pos // BLOCK
+    w = np.asarray(block_width[b], dtype=np.uint64)
+    bit = (pos % BLOCK).astype(np.uint64) * w
+    byte = np.asarray(block_start[b], dtype=np.int64) + (bit >> np.uint64(3)).astype(np.int64)
+    # every byte offset seen as the start of an 8-byte row (a view, nothing copied)
+    windows = np.lib.stride_tricks.as_strided(packed, shape=(len(packed) - 7, 8), strides=(1, 1), writeable=False)
+    raw = np.ascontiguousarray(windows[byte]).view("<u8")[:, 0]
+    d = (raw >> (bit & np.uint64(7))) & ((np.uint64(1) << w) - np.uint64(1))
+    # undo the deltas bucket by bucket (uint64 wrap-around cancels out)
+    cs = np.cumsum(d)
+    first = np.cumsum(lens) - lens
+    v = cs - np.repeat(cs[first] - d[first], lens)
+    return (v >> np.uint64(frame_bits)).astype(np.int64), (v & np.uint64((1 << frame_bits) - 1)).astype(np.int64)
+
+
+class FileLock:
+    """Exclusive lock on a lock file (flock, or msvcrt on Windows).
+
+    The OS drops the lock when the holder exits, however it dies, so a converter
+    killed mid-way (SIGKILL, OOM) never leaves later workers waiting. The file
+    itself stays behind and is reused.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.fd = None
+
+    def _try_lock(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        self.fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        while True:
+            try:
+                self._try_lock()
+                return self
+            except OSError:             # held by another process
+                if time.time() > deadline:
+                    os.close(self.fd)
+                    raise TimeoutError(f"❌ Still locked after {self.timeout:.0f}s: {self.path}")
+                time.sleep(0.1)
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+
+
+class FlatIndex:
+    """Read-only, dict-like view over a flat index directory."""
+
+    def __init__(self, path, mmap=True):
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        self.path = path
+        self.version = self.header.get("version", 1)
+        self.keys = np.load(os.path.join(path, "keys.npy"), mmap_mode=mode)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode=mode)
+        if self.version >= 2:
+            self.postings = None
+            self.packed = np.load(os.path.join(path, "packed.npy"), mmap_mode=mode)
+            self.block_width = np.load(os.path.join(path, "block_width.npy"), mmap_mode=mode)
+            self.block_start = np.load(os.path.join(path, "block_start.npy"), mmap_mode=mode)
+            self.frame_bits = int(self.header["frame_bits"])
+            self.frame_rate = float(self.header["frame_rate"])
+        else:
+            self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode=mode)
+            self.frame_rate = _frame_rate()
+        self.n_postings = int(self.offsets[-1]) if len(self.offsets) else 0
+        self.hex_keys = self.header.get("key_type") == "sha1"
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _key(self, h):
+        return _hex_key(h) if isinstance(h, str) else int(h)
+
+    def _find(self, h):
+        k = self._key(h)
+        i = int(np.searchsorted(self.keys, k))
+        if i < len(self.keys) and int(self.keys[i]) == k:
+            return i
+        return -1
+
+    def __contains__(self, h):
+        return self._find(h) >= 0
+
+    def _read(self, starts, lens):
+        """Postings of whole buckets (start, length) -> (song_ids, frames) int64."""
+        n = int(lens.sum())
+        # flat positions of every posting in every bucket
+        pos = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(n)
+        if self.version >= 2:
+            return unpack_postings(self.packed, self.block_width, self.block_start, self.frame_bits, pos, lens)
+        post = np.asarray(self.postings[pos], dtype=np.float64)
+        return post[:, 0].astype(np.int64), np.rint(post[:, 1] * self.frame_rate).astype(np.int64)
+
+    def _as_seconds(self, sids, frames):
+        return np.column_stack((sids, frames / self.frame_rate)).astype(np.float64).reshape(-1, 2)
+
+    def get(self, h, default=None):
+        i = self._find(h)
+        if i < 0:
+            return default
+        if self.version < 2:
+            return self.postings[self.offsets[i]:self.offsets[i + 1]]
+        return self._as_seconds(*self.bucket_postings(i, i + 1).T)
+
+    def bucket_ids(self, hashes):
+        """Vectorized lookup: bucket index per query hash, -1 where absent."""
+        if self.hex_keys:
+            q = np.array([self._key(h) for h in hashes], dtype=np.uint64)
+        else:
+            q = np.asarray(hashes, dtype=self.keys.dtype)
+        if len(self.keys) == 0:
+            return np.full(len(q), -1, dtype=np.int64)
+        idx = np.minimum(np.searchsorted(self.keys, q), len(self.keys) - 1)
+        return np.where(self.keys[idx] == q, idx, -1)
+
+    def bucket_sizes(self, hashes):
+        """Postings per query hash, 0 where absent."""
+        b = self.bucket_ids(hashes)
+        hit = b >= 0
+        sizes = np.zeros(len(b), dtype=np.int64)
+        sizes[hit] = np.asarray(self.offsets[b[hit] + 1], dtype=np.int64) - np.asarray(self.offsets[b[hit]], dtype=np.int64)
+        return sizes
+
+    def _hits(self, hashes, budget):
+        """-> (query index, bucket start, bucket length) of every hit bucket, within the budget."""
+        b = self.bucket_ids(hashes)
+        qi = np.flatnonzero(b >= 0)
+        b = b[qi]
+        starts = np.asarray(self.offsets[b], dtype=np.int64)
+        lens = np.asarray(self.offsets[b + 1], dtype=np.int64) - starts
+        if budget and lens.sum() > budget:
+            keep = budget_mask(lens, budget)
+            qi, starts, lens = qi[keep], starts[keep], lens[keep]
+        return qi, starts, lens
+
+    def lookup_frames(self, hashes, budget=0):
+        """All postings hit by `hashes` -> (song_ids, frames, query index per posting), all int64.
+
+        budget > 0 reads at most that many postings, rarest buckets first.
+        """
+        qi, starts, lens = self._hits(hashes, budget)
+        sids, frames = self._read(starts, lens)
+        return sids, frames, np.repeat(qi, lens)
+
+    def lookup(self, hashes, budget=0):
+        """All postings hit by `hashes` -> (postings [N, 2] float64 (song_id, t_sec), query index per posting).
+
+        budget > 0 reads at most that many postings, rarest buckets first.
+        """
+        qi, starts, lens = self._hits(hashes, budget)
+        if lens.sum() == 0:
+            return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        if self.version < 2:
+            pos = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(int(lens.sum()))
+            return np.asarray(self.postings[pos], dtype=np.float64), np.repeat(qi, lens)
+        return self._as_seconds(*self._read(starts, lens)), np.repeat(qi, lens)
+
+    def bucket_postings(self, a, b):
+        """Postings of buckets a..b-1 -> [n, 2] int64 (song_id, frame) (used when merging / splitting)."""
+        offsets = np.asarray(self.offsets[a:b + 1], dtype=np.int64)
+        sids, frames = self._read(offsets[:-1], np.diff(offsets))
+        return np.column_stack((sids, frames))
+
+    def posting_keys(self):
+        """Key of every posting, aligned with bucket_postings(0, len(self))."""
+        return np.repeat(np.asarray(self.keys), np.diff(np.asarray(self.offsets, dtype=np.int64)))
+
+
+# ---- bucket statistics / stop-hash pruning ----
+def bucket_stats(sizes, counts=None):
+    """Distribution of postings per bucket -> dict (percentiles, max, share held by the largest buckets).
+
+    counts: number of buckets of each size, when sizes is a histogram's distinct
+    values (streaming builds never hold every bucket size at once).
+    """
+    if counts is None:
+        sizes, counts = np.unique(np.asarray(sizes, dtype=np.int64), return_counts=True)
+    else:
+        sizes, counts = np.asarray(sizes, dtype=np.int64), np.asarray(counts, dtype=np.int64)
+        order = np.argsort(sizes)
+        sizes, counts = sizes[order], counts[order]
+    n = int(counts.sum())
+    if n == 0:
+        return {"buckets": 0, "postings": 0}
+    total = int((sizes * counts).sum())
+    cum = np.cumsum(counts)
+
+    def nth(k):                 # k-th smallest bucket size (0-based)
+        return int(sizes[np.searchsorted(cum, k, side="right")])
+
+    def smallest_sum(k):        # postings in the k smallest buckets
+        j = int(np.searchsorted(cum, k, side="right"))
+        full = int(cum[j - 1]) if j else 0
+        return int((sizes[:j] * counts[:j]).sum()) + (k - full) * (int(sizes[j]) if k > full else 0)
+
+    def pct(q):                 # np.percentile's linear interpolation, truncated
+        x = q / 100 * (n - 1)
+        lo = int(x)
+        a, b = nth(lo), nth(min(lo + 1, n - 1))
+        return int(a + (b - a) * (x - lo))
+
+    top = lambda frac: round(float(total - smallest_sum(n - max(1, int(n * frac)))) / total, 4)
+    return {
+        "buckets": n, "postings": total, "mean": round(total / n, 2),
+        "p50": pct(50), "p90": pct(90), "p99": pct(99), "p99.9": pct(99.9), "max": int(sizes[-1]),
+        "top_0.1%_share": top(0.001), "top_1%_share": top(0.01),
+    }
+
+
+def print_bucket_stats(stats):
+    if not stats["buckets"]:
+        print("📊 Buckets: none")
+        return
+    print(f"📊 {stats['buckets']:,} buckets, {stats['postings']:,} postings; postings per bucket: "
+          f"mean {stats['mean']}, p50 {stats['p50']}, p90 {stats['p90']}, p99 {stats['p99']}, "
+          f"p99.9 {stats['p99.9']}, max {stats['max']}")
+    print(f"   largest 0.1% of buckets hold {stats['top_0.1%_share']:.1%} of postings, largest 1% {stats['top_1%_share']:.1%}")
+
+
+def cap_positions(n, max_bucket):
+    """Positions of the max_bucket evenly spaced postings kept when a bucket of n is capped."""
+    return np.linspace(0, n - 1, max_bucket).round().astype(np.int64)
+
+
+def prune_buckets(inv, max_bucket, mode="drop", verbose=True):
+    """Stop-hash pruning of {hash: postings} in place -> summary dict.
+
+    Buckets with more than max_bucket postings are dropped ("drop") or thinned
+    to max_bucket evenly spaced postings ("cap"; buckets stay sorted by song).
+    Such landmarks occur in a large share of the catalog and barely help tell
+    songs apart, while every query that hits them pays for the whole bucket.
+    """
+    if mode not in ("drop", "cap"):
+        raise ValueError(f"unknown stop-hash mode {mode!r}")
+    heavy = [h for h, entries in inv.items() if len(entries) > max_bucket]
+    removed = 0
+    for h in heavy:
+        entries = inv[h]
+        if mode == "drop":
+            removed += len(entries)
+            del inv[h]
+        else:
+            idx = cap_positions(len(entries), max_bucket)
+            removed += len(entries) - max_bucket
+            inv[h] = entries[idx] if isinstance(entries, np.ndarray) else [entries[i] for i in idx]
+    if verbose:
+        print(f"✂️ Stop hashes: {len(heavy):,} buckets over {max_bucket} postings ({mode}), {removed:,} postings removed")
+    return {"max_bucket": int(max_bucket), "mode": mode, "buckets": len(heavy), "postings_removed": removed}
+
+
+def write_flat_arrays(out_dir, keys, offsets, postings, meta_list, key_type="int", header_extra=None):
+    """Write sorted CSR arrays plus song metadata as a flat index directory.
+
+    postings: [N, 2] integer (song_id, frame); each bucket is sorted by song here if it isn't already.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    postings = np.asarray(postings, dtype=np.int64).reshape(-1, 2)
+    sizes = np.diff(offsets)
+    first = np.zeros(len(postings), dtype=bool)
+    first[offsets[:-1][sizes > 0]] = True
+    v = postings[:, 0] * (1 << 32) + postings[:, 1]
+    if len(v) and np.any((v[1:] < v[:-1]) & ~first[1:]):
+        order = np.lexsort((v, np.repeat(np.arange(len(sizes)), sizes)))
+        postings = postings[order]
+    packed, width, start, frame_bits = pack_postings(postings[:, 0], postings[:, 1], first)
+
+    np.save(os.path.join(out_dir, "keys.npy"), keys)
+    np.save(os.path.join(out_dir, "offsets.npy"), offsets.astype(np.uint32 if offsets[-1] < 2 ** 32 else np.int64))
+    np.save(os.path.join(out_dir, "packed.npy"), packed)
+    np.save(os.path.join(out_dir, "block_width.npy"), width)
+    np.save(os.path.join(out_dir, "block_start.npy"), start)
+    _write_meta_and_header(out_dir, meta_list, key_type, len(keys), len(postings), frame_bits, header_extra)
+    return len(keys), len(postings)
+
+
+def _write_meta_and_header(out_dir, meta_list, key_type, n_keys, n_postings, frame_bits, header_extra=None):
+    with open(os.path.join(out_dir, "songs_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(list(meta_list), f, ensure_ascii=False, indent=2)
+    # header last: its presence marks the directory as complete
+    with open(os.path.join(out_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": FLAT_VERSION,
+            "key_type": key_type,
+            "buckets": int(n_keys),
+            "postings": int(n_postings),
+            "frame_bits": frame_bits,
+            "frame_rate": _frame_rate(),
+            "block": BLOCK,
+            **(header_extra or {}),
+        }, f, indent=2)
+
+
+class _NpyStream:
+    """Append-only 1-D .npy file: data goes to <path>.part, the header is added once the length is known."""
+
+    def __init__(self, path, dtype):
+        self.path, self.dtype, self.n = path, np.dtype(dtype), 0
+        self.f = open(path + ".part", "wb")
+
+    def write(self, a):
+        a = np.ascontiguousarray(a, dtype=self.dtype)
+        a.tofile(self.f)
+        self.n += len(a)
+
+    def close(self):
+        self.f.close()
+        with open(self.path, "wb") as out, open(self.path + ".part", "rb") as src:
+            np.lib.format.write_array_header_1_0(out, {
+                "descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.n,)})
+            shutil.copyfileobj(src, out, 1 << 20)
+        os.remove(self.path + ".part")
+
+
+class FlatWriter:
+    """Writes a flat index bucket by bucket, holding at most one batch of postings in memory.
+
+    Buckets must arrive in ascending key order, each one whole and sorted by
+    (song, frame). frame_bits is fixed up front, so it must cover every frame;
+    max_postings (an upper bound on the total) picks the offsets dtype.
+    """
+
+    def __init__(self, out_dir, frame_bits, key_type="int", max_postings=0):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir, self.frame_bits, self.key_type = out_dir, frame_bits, key_type
+        self.keys = _NpyStream(os.path.join(out_dir, "keys.npy"), np.uint64 if key_type == "sha1" else np.uint32)
+        self.offsets = _NpyStream(os.path.join(out_dir, "offsets.npy"), np.uint32 if max_postings < 2 ** 32 else np.int64)
+        self.packed = _NpyStream(os.path.join(out_dir, "packed.npy"), np.uint8)
+        self.block_width = _NpyStream(os.path.join(out_dir, "block_width.npy"), np.uint8)
+        self.block_start = _NpyStream(os.path.join(out_dir, "block_start.npy"), np.int64)
+        self.offsets.write([0])
+        self.n_keys, self.n_postings, self.n_bytes = 0, 0, 0
+        self.prev = None                # packed value of the last posting written
+        empty = np.empty(0, dtype=np.int64)
+        self.pending = (empty, empty, np.empty(0, dtype=bool))     # postings short of a full block
+
+    def add(self, keys, sizes, song_ids, frames):
+        """Append buckets keys[i] holding sizes[i] postings each; song_ids / frames are their postings in order."""
+        sizes = np.asarray(sizes, dtype=np.int64)
+        first = np.zeros(int(sizes.sum()), dtype=bool)
+        first[(np.cumsum(sizes) - sizes)[sizes > 0]] = True
+        self.keys.write(keys)
+        self.offsets.write(self.n_postings + np.cumsum(sizes))
+        self.n_keys += len(keys)
+        self.n_postings += len(first)
+        s, f, b = self.pending
+        self.pending = (np.r_[s, song_ids].astype(np.int64), np.r_[f, frames].astype(np.int64), np.r_[b, first])
+        self._pack(len(self.pending[0]) // BLOCK * BLOCK)
+
+    def _pack(self, n):
+        if n == 0:
+            return
+        s, f, b = self.pending
+        packed, width, start, _ = pack_postings(s[:n], f[:n], b[:n], frame_bits=self.frame_bits, prev=self.prev)
+        nbytes = int(width.astype(np.int64).sum()) * (BLOCK // 8)
+        self.packed.write(packed[:nbytes])              # the 8 padding bytes go on once, at the end
+        self.block_width.write(width)
+        self.block_start.write(start + self.n_bytes)
+        self.n_bytes += nbytes
+        self.prev = (int(s[n - 1]) << self.frame_bits) | int(f[n - 1])
+        self.pending = (s[n:], f[n:], b[n:])
+
+    def close(self, meta_list, header_extra=None):
+        """Flush the last partial block and write metadata + header -> (n_keys, n_postings)."""
+        self._pack(len(self.pending[0]))
+        self.packed.write(np.zeros(8, dtype=np.uint8))
+        for stream in (self.keys, self.offsets, self.packed, self.block_width, self.block_start):
+            stream.close()
+        _write_meta_and_header(self.out_dir, meta_list, self.key_type, self.n_keys, self.n_postings,
+                               self.frame_bits, header_extra)
+        return self.n_keys, self.n_postings
+
+
+def csr_from_sorted(posting_keys, postings):
+    """Group postings already sorted by key -> (keys, offsets, postings)."""
+    if len(posting_keys) == 0:
+        return posting_keys[:0], np.zeros(1, dtype=np.int64), postings
+    starts = np.flatnonzero(np.r_[True, posting_keys[1:] != posting_keys[:-1]])
+    offsets = np.append(starts, len(posting_keys)).astype(np.int64)
+    return posting_keys[starts], offsets, postings
+
+
+def write_flat_index(out_dir, inv, meta_by_id, header_extra=None):
+    """Write {hash: [[song_id, t_sec], ...]} (lists or arrays) as a flat index; times become STFT frames."""
+    items = list(inv.items())
+    hex_keys = bool(items) and isinstance(items[0][0], str)
+    if hex_keys:
+        keys = np.array([_hex_key(h) for h, _ in items], dtype=np.uint64)
+    else:
+        keys = np.array([int(h) for h, _ in items], dtype=np.uint32)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    buckets = [np.asarray(items[i][1], dtype=np.float64).reshape(-1, 2) for i in order]
+    sizes = np.array([len(b) for b in buckets], dtype=np.int64)
+    offsets = np.zeros(len(buckets) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    post = np.concatenate(buckets) if buckets else np.empty((0, 2))
+    postings = np.column_stack((post[:, 0], np.rint(post[:, 1] * _frame_rate()))).astype(np.int64)
+
+    return write_flat_arrays(out_dir, keys, offsets, postings, meta_by_id.values(),
+                             key_type="sha1" if hex_keys else "int", header_extra=header_extra)
+
+
+def load_flat_index(path, mmap=True):
+    """Open a flat index directory -> (FlatIndex, meta_by_id); refuses one built under another HASH_MODE."""
+    from src.dsp import check_key_type        # src.dsp imports this module
+    inv = FlatIndex(path, mmap=mmap)
+    check_key_type(inv.header.get("key_type", "int"), path)
+    with open(os.path.join(path, "songs_meta.json"), "r", encoding="utf-8") as f:
+        meta_by_id = {int(m["id"]): m for m in json.load(f)}
+    return inv, meta_by_id
+
+
+def load_pickle_cache(path):
+    """Legacy gzip-aware pickle cache -> (inv, meta_by_id)."""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    opener = gzip.open if magic == b"\x1f\x8b" else open
+    with opener(path, "rb") as f:
+        obj = pickle.load(f)
+    return obj["inv"], obj["meta_by_id"]
+
+
+def ensure_flat_index(cache_file, out_dir, timeout=1800.0):
+    """Convert a pickle cache to a flat index once, however many processes ask at the same time.
+
+    The first caller converts under a file lock; the others wait and then simply
+    map the result, so N server workers share one copy of the index through
+    the OS page cache instead of each unpickling its own. Returns True if this
+    call did the conversion.
+    """
+    header = os.path.join(out_dir, "header.json")
+    if os.path.exists(header):
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(out_dir)), exist_ok=True)
+    with FileLock(out_dir.rstrip("/\\") + ".lock", timeout=timeout):
+        if os.path.exists(header):          # another process finished it while we waited
+            return False
+        print(f"🔧 Converting {cache_file} → {out_dir} (one-time)...", flush=True)
+        inv, meta_by_id = load_pickle_cache(cache_file)
+        write_flat_index(out_dir, inv, meta_by_id)
+        return True
@@ -1,102 +1,185 @@
-import os, json, hashlib
-import numpy as np
-import torch, torchaudio
-
-# ================== CONFIG (must match recognizer) ==================
-SR = 22050
-N_FFT = 2048
-HOP = 512
-PEAK_NEIGHBORHOOD = 20      # local-max window (freq x time)
-AMP_DB_MIN = -35            # ignore quiet pixels (raise to -30/-25 to be stricter)
-FAN_VALUE = 15              # pairs per peak
-MIN_TDELTA = 1              # min time delta (frames)
-MAX_TDELTA = 200            # max time delta (frames)
-DATASET_DIR = "dataset"
-OUT_DIR = "constellation_index"
-# ====================================================================
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🚀 Using device: {device}")
+import os, sys, json, time, shutil, tempfile, argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing as mp
+sys.path.append(os.path.abspath("."))
 
-# ---- warm up CUDA once to reduce first-call latency ----
-if device.type == "cuda":
-    _ = torch.randn(1, device=device)
+# DSP config + helpers are shared with the recognizer (src/dsp.py), so indexer and matcher can't drift apart
+import src.dsp as dsp
+from src.dsp import warm_up, load_audio, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks, hash_arrays_from_peaks
+from src.flat_index import bucket_stats, print_bucket_stats, prune_buckets
+from src.runs import RunWriter, write_flat_from_runs, RUN_SIZE
 
-# ---- Prebuild reusable GPU transforms ----
-spec_tf = torchaudio.transforms.Spectrogram(n_fft=N_FFT, hop_length=HOP, power=None).to(device)
-amp2db_tf = torchaudio.transforms.AmplitudeToDB(top_db=80).to(device)
+# ================== CONFIG ==================
+DATASET_DIR = "dataset"
+FORMAT = "flat"             # "flat" = streamed straight to a flat index, "json" = legacy inverted_index.json
+OUT_DIR = "constellation_index"         # --format json
+FLAT_OUT_DIR = "src/server/flat_index"  # --format flat
+SHARD_SIZE = 8              # songs per work unit when building with --workers
+MAX_BUCKET = None           # stop hashes: buckets with more postings are dropped/capped (None = keep all)
+STOP_MODE = "drop"          # "drop" | "cap"
+# ============================================
 
 def spectrogram_db(path):
-    wav, sr = torchaudio.load(path)  # [C, T] on CPU
-    if sr != SR:
-        wav = torchaudio.functional.resample(wav, sr, SR)
-    wav = torch.mean(wav, dim=0, keepdim=True).to(device)   # mono [1,T] on GPU
-    spec = spec_tf(wav)                                     # complex spec
-    mag = torch.abs(spec).squeeze(0)                        # [F,T]
-    db  = amp2db_tf(mag)
-    return db.detach().cpu().numpy()                        # numpy [F,T]
-
-def peak_coords(S_db, neighborhood=PEAK_NEIGHBORHOOD, amp_min=AMP_DB_MIN):
-    from scipy.ndimage import maximum_filter
-    local_max = maximum_filter(S_db, size=neighborhood) == S_db
-    mask = S_db > amp_min
-    peaks = np.argwhere(local_max & mask)
-    # sort by time index for stable pairing
-    if len(peaks):
-        peaks = peaks[np.argsort(peaks[:, 1])]
-    return peaks  # columns: [freq_idx, time_idx]
-
-def hashes_from_peaks(peaks):
-    H = []
-    L = len(peaks)
-    hop_sec = HOP / SR
-    for i in range(L):
-        f1, t1 = peaks[i]
-        for j in range(1, FAN_VALUE):
-            if i + j >= L: break
-            f2, t2 = peaks[i + j]
-            dt = t2 - t1
-            if MIN_TDELTA <= dt <= MAX_TDELTA:
-                raw = f"{int(f1)}|{int(f2)}|{int(dt)}"
-                h = hashlib.sha1(raw.encode()).hexdigest()[:20]
-                H.append((h, t1 * hop_sec))  # store time in seconds
-    return H
-
-def build_index(dataset_dir=DATASET_DIR, out_dir=OUT_DIR):
-    os.makedirs(out_dir, exist_ok=True)
-    inv = {}   # inverted index: hash -> list of [song_id, t_sec]
-    meta = []  # [{id, artist, title}...]
-    sid = 0
+    wav, sr = load_audio(path)  # [C, T] on CPU
+    return spectrogram_db_from_tensor(wav, sr, keep_on_device=True)   # peak_coords copies back only the peaks
 
-    for artist in os.listdir(dataset_dir):
+def list_songs(dataset_dir=DATASET_DIR):
+    """Deterministic song list: [(song_id, artist, title, path)], artists and files sorted by name."""
+    songs = []
+    for artist in sorted(os.listdir(dataset_dir)):
         adir = os.path.join(dataset_dir, artist)
         if not os.path.isdir(adir): continue
-        for fname in os.listdir(adir):
+        for fname in sorted(os.listdir(adir)):
             if not fname.lower().endswith(".wav"): continue
-            fpath = os.path.join(adir, fname)
             title = os.path.splitext(fname)[0]
-            song_id = sid; sid += 1
-            print(f"🎵 Indexing: {artist} - {title}")
+            songs.append((len(songs), artist, title, os.path.join(adir, fname)))
+    return songs
+
+def song_peaks(artist, title, fpath):
+    """Peaks of one song, or None (reported) when it has none."""
+    print(f"🎵 Indexing: {artist} - {title}", flush=True)
+    peaks = peak_coords(spectrogram_db(fpath))
+    if peaks.size == 0:
+        print(f"… skipped (no peaks): {artist} - {title}", flush=True)
+        return None
+    return peaks
+
+def index_shard(shard):
+    """Index a list of songs -> partial (inv, meta) with the songs' global IDs."""
+    inv, meta = {}, []
+    for song_id, artist, title, fpath in shard:
+        peaks = song_peaks(artist, title, fpath)
+        if peaks is None:
+            continue
+        H = hashes_from_peaks(peaks)
+
+        for h, t in H:
+            inv.setdefault(h, []).append([song_id, t])
+
+        meta.append({"id": song_id, "artist": artist, "title": title})
+    return inv, meta
+
+def fingerprint_shard(shard):
+    """Fingerprint a list of songs -> ([(song_id, hashes uint32, frames int64)], meta) for the streaming build."""
+    fps, meta = [], []
+    for song_id, artist, title, fpath in shard:
+        peaks = song_peaks(artist, title, fpath)
+        if peaks is None:
+            continue
+        fps.append((song_id, *hash_arrays_from_peaks(peaks)))
+        meta.append({"id": song_id, "artist": artist, "title": title})
+    return fps, meta
+
+def merge_shards(parts):
+    """Merge partial indexes given in shard order; buckets stay sorted by song ID."""
+    inv, meta = {}, []
+    for part_inv, part_meta in parts:
+        for h, entries in part_inv.items():
+            inv.setdefault(h, []).extend(entries)
+        meta.extend(part_meta)
+    return inv, meta
+
+def _init_worker():
+    if dsp.DSP_BACKEND == "torch":
+        import torch
+        torch.set_num_threads(1)   # one process per core; avoid oversubscribing intra-op threads
+
+def map_shards(fn, shards, workers):
+    """Yield (k, fn(shards[k])) as shards finish, reporting songs/sec."""
+    n_songs, done, t0 = sum(len(sh) for sh in shards), 0, time.time()
+
+    def progress(n):
+        nonlocal done
+        done += n
+        rate = done / max(time.time() - t0, 1e-9)
+        print(f"⏱️ {done}/{n_songs} songs ({rate:.2f} songs/sec)", flush=True)
+
+    if workers <= 1:
+        for k, shard in enumerate(shards):
+            res = fn(shard)
+            progress(len(shard))
+            yield k, res
+    else:
+        # spawn: CUDA and torch thread pools are not fork-safe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker) as pool:
+            futures = {pool.submit(fn, shard): k for k, shard in enumerate(shards)}
+            for fut in as_completed(futures):
+                k = futures.pop(fut)      # drop the finished future so its result can be freed
+                progress(len(shards[k]))
+                yield k, fut.result()
+
+def build_index(dataset_dir=DATASET_DIR, out_dir=None, workers=1, shard_size=SHARD_SIZE,
+                max_bucket=MAX_BUCKET, stop_mode=STOP_MODE, fmt=FORMAT, tmp_dir=None, run_size=RUN_SIZE):
+    """Index dataset_dir into out_dir.
+
+    fmt="flat" streams every song's (hash, song, frame) triples into sorted run
+    files under tmp_dir (default: next to out_dir) and merges them into a flat
+    index (src/runs.py), so memory stays bounded however large the catalog.
+    fmt="json" builds the whole index in memory and writes inverted_index.json.
+    """
+    if fmt not in ("flat", "json"):
+        raise ValueError(f"unknown index format {fmt!r}")
+    if fmt == "flat" and dsp.HASH_MODE != "int":
+        raise ValueError('the flat build needs HASH_MODE = "int" (use fmt="json" for sha1 hashes)')
+    out_dir = out_dir or (FLAT_OUT_DIR if fmt == "flat" else OUT_DIR)
+    device = warm_up()
+    print(f"🚀 Using device: {device}")
+    os.makedirs(out_dir, exist_ok=True)
+    songs = list_songs(dataset_dir)
+    shards = [songs[i:i + shard_size] for i in range(0, len(songs), shard_size)]
+    t0 = time.time()
 
-            S_db = spectrogram_db(fpath)
-            peaks = peak_coords(S_db)
-            if peaks.size == 0:
-                print(f"… skipped (no peaks): {artist} - {title}")
-                continue
-            H = hashes_from_peaks(peaks)
+    if fmt == "flat":
+        run_dir = tempfile.mkdtemp(prefix="runs_", dir=tmp_dir or os.path.dirname(os.path.abspath(out_dir)))
+        try:
+            runs, parts = RunWriter(run_dir, run_size), [None] * len(shards)
+            for k, (fps, meta) in map_shards(fingerprint_shard, shards, workers):
+                for song_id, hashes, frames in fps:
+                    runs.add(song_id, hashes, frames)
+                parts[k] = meta
+            runs.flush()
+            meta = [m for part in parts for m in part]
+            print(f"🔀 Merging {len(runs.paths)} run(s), {runs.total:,} postings...", flush=True)
+            n_keys, n_post, _ = write_flat_from_runs(runs.paths, out_dir, meta, runs.max_frame,
+                                                     max_bucket=max_bucket, stop_mode=stop_mode)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        print(f"\n✅ Indexed {len(meta)} songs in {time.time() - t0:.1f}s ({len(songs) / max(time.time() - t0, 1e-9):.2f} songs/sec)")
+        print(f"✅ Saved flat index → {out_dir} ({n_keys:,} hashes, {n_post:,} postings)")
+        return
 
-            for h, t in H:
-                inv.setdefault(h, []).append([song_id, t])
+    parts = [None] * len(shards)
+    for k, part in map_shards(index_shard, shards, workers):
+        parts[k] = part
 
-            meta.append({"id": song_id, "artist": artist, "title": title})
+    inv, meta = merge_shards(parts)
+    print_bucket_stats(bucket_stats([len(v) for v in inv.values()]))
+    if max_bucket:
+        prune_buckets(inv, max_bucket, stop_mode)
 
     with open(os.path.join(out_dir, "inverted_index.json"), "w", encoding="utf-8") as f:
         json.dump(inv, f)
     with open(os.path.join(out_dir, "songs_meta.json"), "w", encoding="utf-8") as f:
         json.dump(meta, f, ensure_ascii=False, indent=2)
 
-    print(f"\n✅ Saved index → {out_dir}/inverted_index.json")
+    print(f"\n✅ Indexed {len(meta)} songs in {time.time() - t0:.1f}s ({len(songs) / max(time.time() - t0, 1e-9):.2f} songs/sec)")
+    print(f"✅ Saved index → {out_dir}/inverted_index.json")
     print(f"✅ Saved meta  → {out_dir}/songs_meta.json")
 
 if __name__ == "__main__":
-    build_index()
+    ap = argparse.ArgumentParser(description="Build the constellation inverted index")
+    ap.add_argument("--dataset", default=DATASET_DIR)
+    ap.add_argument("--format", choices=["flat", "json"], default=FORMAT,
+                    help="flat: stream to a flat index via sorted runs (bounded memory); json: legacy inverted_index.json")
+    ap.add_argument("--out", help=f"output dir (default: {FLAT_OUT_DIR} for flat, {OUT_DIR} for json)")
+    ap.add_argument("--tmp", help="directory for the sorted run files (default: next to --out)")
+    ap.add_argument("--run-size", type=int, default=RUN_SIZE, help="postings per sorted run (bounds build memory)")
+    ap.add_argument("--workers", type=int, default=1, help="worker processes (1 = serial)")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="songs per work unit")
+    ap.add_argument("--max-bucket", type=int, default=MAX_BUCKET, help="drop/cap buckets with more postings than this")
+    ap.add_argument("--stop-mode", choices=["drop", "cap"], default=STOP_MODE)
+    args = ap.parse_args()
+    build_index(args.dataset, args.out, workers=args.workers, shard_size=args.shard_size,
+                max_bucket=args.max_bucket, stop_mode=args.stop_mode, fmt=args.format, tmp_dir=args.tmp,
+                run_size=args.run_size)
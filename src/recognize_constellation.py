@@ -1,84 +1,43 @@
-import os, json, hashlib, time
-import numpy as np
-import torch, torchaudio
-import sounddevice as sd
+import os, sys, json, time
+sys.path.append(os.path.abspath("."))
+
 from scipy.io.wavfile import write
-from collections import defaultdict, Counter
+
+# DSP + matching live in src/dsp.py (no import-time side effects); re-exported here for old imports
+from src.dsp import (
+    SR, N_FFT, HOP, PEAK_NEIGHBORHOOD, AMP_DB_MIN, FAN_VALUE, MIN_TDELTA, MAX_TDELTA,
+    MIN_MATCHES, HASH_MODE, F_BITS, DT_BITS,
+    transforms, warm_up, load_audio, spectrogram_db_from_tensor, spectrogram_db_batch, peak_coords,
+    hash_arrays_from_peaks, hashes_from_peaks, lookup_postings, gather_postings,
+    gather_postings_batch, offset_histogram, song_alignments, best_alignment, json_hash_keys,
+)
 
 # ================== CONFIG ==================
-SR = 22050
-N_FFT = 2048
-HOP = 512
-PEAK_NEIGHBORHOOD = 20
-AMP_DB_MIN = -35
-FAN_VALUE = 15
-MIN_TDELTA = 1
-MAX_TDELTA = 200
 INDEX_DIR = "constellation_index"
+FLAT_INDEX_DIR = "src/server/flat_index"    # preferred when present (src/index_constellation.py default output)
 RECORD_SECONDS = 7
-MIN_MATCHES = 20
 # ============================================
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🚀 Using device: {device}", flush=True)
-
-# Prebuild GPU transforms
-spec_tf = torchaudio.transforms.Spectrogram(n_fft=N_FFT, hop_length=HOP, power=None).to(device)
-amp2db_tf = torchaudio.transforms.AmplitudeToDB(top_db=80).to(device)
 
 # -------- FULL WARM-UP INIT (GPU + audio) --------
-print("⚙️ Warming up DSP + Mic...", flush=True)
-if device.type == "cuda":
-    _dummy = torch.randn(1, SR, device=device)
-    _ = spec_tf(_dummy.unsqueeze(0))
-    _ = amp2db_tf(torch.abs(spec_tf(_dummy.unsqueeze(0))))
-
-sd.query_devices()
-sd.default.samplerate = 44100
-try:
-    sd.Stream(samplerate=44100, channels=1).close()
-except:
-    pass
-print("✅ Ready.\n", flush=True)
-
-
-# ---- DSP helpers ----
-def spectrogram_db_from_tensor(wav, sr):
-    if sr != SR:
-        wav = torchaudio.functional.resample(wav, sr, SR)
-    wav = torch.mean(wav, dim=0, keepdim=True).to(device)
-    spec = spec_tf(wav)
-    mag  = torch.abs(spec).squeeze(0)
-    db   = amp2db_tf(mag)
-    return db.detach().cpu().numpy()
-
-def peak_coords(S_db):
-    from scipy.ndimage import maximum_filter
-    local_max = maximum_filter(S_db, size=PEAK_NEIGHBORHOOD) == S_db
-    mask = S_db > AMP_DB_MIN
-    peaks = np.argwhere(local_max & mask)
-    if len(peaks): peaks = peaks[np.argsort(peaks[:, 1])]
-    return peaks
-
-def hashes_from_peaks(peaks):
-    H = []
-    L = len(peaks)
-    hop_sec = HOP / SR
-    for i in range(L):
-        f1, t1 = peaks[i]
-        for j in range(1, FAN_VALUE):
-            if i+j >= L: break
-            f2, t2 = peaks[i+j]
-            dt = t2 - t1
-            if MIN_TDELTA <= dt <= MAX_TDELTA:
-                raw = f"{int(f1)}|{int(f2)}|{int(dt)}"
-                h = hashlib.sha1(raw.encode()).hexdigest()[:20]
-                H.append((h, t1 * hop_sec))
-    return H
+def warm_up_mic():
+    import sounddevice as sd
+    print("⚙️ Warming up DSP + Mic...", flush=True)
+    device = warm_up()
+    print(f"🚀 Using device: {device}", flush=True)
+
+    sd.query_devices()
+    sd.default.samplerate = 44100
+    try:
+        sd.Stream(samplerate=44100, channels=1).close()
+    except:
+        pass
+    print("✅ Ready.\n", flush=True)
 
 
 # ---- Audio record ----
 def record_audio():
+    import sounddevice as sd
     try:
         import winsound
         print("🎤 Mic prepping...", flush=True)
@@ -99,8 +58,12 @@ def record_audio():
 
 # ---- Load inverted index ----
 def load_index():
+    if os.path.exists(os.path.join(FLAT_INDEX_DIR, "header.json")):
+        from src.flat_index import load_flat_index
+        return load_flat_index(FLAT_INDEX_DIR)
     with open(os.path.join(INDEX_DIR, "inverted_index.json"), "r") as f:
         inv = json.load(f)
+    inv = json_hash_keys(inv)
     with open(os.path.join(INDEX_DIR, "songs_meta.json"), "r") as f:
         meta = {m["id"]: m for m in json.load(f)}
     return inv, meta
@@ -108,24 +71,14 @@ def load_index():
 
 # ---- Matching ----
 def recognize(file, inv, meta_by_id):
-    wav, sr = torchaudio.load(file)
-    S_db = spectrogram_db_from_tensor(wav, sr)
+    wav, sr = load_audio(file)
+    S_db = spectrogram_db_from_tensor(wav, sr, keep_on_device=True)
     peaks = peak_coords(S_db)
     qhashes = hashes_from_peaks(peaks)
 
-    votes = defaultdict(list)
-    for h, qt in qhashes:
-        for sid, dbt in inv.get(h, []):
-            votes[sid].append(round(dbt - qt, 2))
-
-    if not votes: return None, 0, 0
-
-    best_sid, best_align, best_total = None, 0, 0
-    for sid, deltas in votes.items():
-        total = len(deltas)
-        align = Counter(deltas).most_common(1)[0][1]
-        if align > best_align or (align == best_align and total > best_total):
-            best_sid, best_align, best_total = sid, align, total
+    sids, offs = gather_postings(inv, qhashes)
+    best_sid, best_align, best_total = best_alignment(sids, offs)
+    if best_sid is None: return None, 0, 0
 
     if best_align < MIN_MATCHES: return None, best_align, 0.0
 
@@ -136,6 +89,7 @@ def recognize(file, inv, meta_by_id):
 
 # ---- Main loop ----
 if __name__ == "__main__":
+    warm_up_mic()
     inv, meta = load_index()
 
     while True:
@@ -148,7 +102,7 @@ if __name__ == "__main__":
         match, align, conf = recognize(q, inv, meta)
 
         if match:
-            print(f"\n✅ Song Recognized!")
+            print("\n✅ Song Recognized!")
             print(f"🎤 Artist: {match['artist']}")
             print(f"🎵 Title : {match['title']}")
             print(f"📊 Align : {align}")
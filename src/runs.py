@@ -0,0 +1,142 @@
+# src/runs.py
+"""
+Out-of-core index build: sorted binary run files merged into a flat index.
+
+    <tmp>/run_000000.bin    (hash, song, frame) uint32 triples, sorted    [<= RUN_SIZE]
+    <tmp>/run_000001.bin    ...
+
+RunWriter collects each song's triples and spills a sorted run whenever
+RUN_SIZE of them are buffered. merge_runs() reads every run a window at a
+time and yields whole buckets in key order, which FlatWriter packs straight
+into the flat index (src/flat_index.py). Peak memory is about one run buffer
+plus MERGE_RECORDS merge windows, however large the catalog; nothing goes
+through JSON or a Python dict.
+"""
+import os
+import numpy as np
+
+from src.flat_index import FlatWriter, bucket_stats, print_bucket_stats, cap_positions
+
+RUN_DTYPE = np.dtype([("hash", "<u4"), ("song", "<u4"), ("frame", "<u4")])
+RUN_SIZE = 1 << 23          # triples per run file (96 MiB buffered)
+MERGE_RECORDS = 1 << 23     # triples held by all merge windows together
+MIN_WINDOW = 4096           # smallest read per run, however many runs there are
+
+
+class RunWriter:
+    """Buffers (hash, song, frame) triples and writes them out as sorted runs of run_size."""
+
+    def __init__(self, run_dir, run_size=RUN_SIZE):
+        os.makedirs(run_dir, exist_ok=True)
+        self.run_dir = run_dir
+        self.buf = np.empty(run_size, dtype=RUN_DTYPE)
+        self.n = 0                  # triples in buf
+        self.paths = []
+        self.total = 0
+        self.max_frame = 0
+
+    def add(self, song_id, hashes, frames):
+        """Queue one song's fingerprints (uint32 hashes, anchor frames)."""
+        hashes, frames = np.asarray(hashes, dtype=np.uint32), np.asarray(frames, dtype=np.int64)
+        if len(frames):
+            if frames.min() < 0 or frames.max() >= 2 ** 32:
+                raise ValueError("frames must fit in uint32")
+            self.max_frame = max(self.max_frame, int(frames.max()))
+        self.total += len(hashes)
+        a = 0
+        while a < len(hashes):
+            b = a + min(len(hashes) - a, len(self.buf) - self.n)
+            rows = self.buf[self.n:self.n + b - a]
+            rows["hash"], rows["song"], rows["frame"] = hashes[a:b], song_id, frames[a:b]
+            self.n += b - a
+            a = b
+            if self.n == len(self.buf):
+                self.flush()
+
+    def flush(self):
+        """Sort and write the buffered triples as a new run (no-op when empty)."""
+        if self.n == 0:
+            return
+        rows = self.buf[:self.n]
+        rows = rows[np.lexsort((rows["frame"], rows["song"], rows["hash"]))]
+        path = os.path.join(self.run_dir, f"run_{len(self.paths):06d}.bin")
+        rows.tofile(path)
+        self.paths.append(path)
+        self.n = 0
+
+
+def merge_runs(paths, budget=MERGE_RECORDS):
+    """K-way merge of sorted runs -> yields triple arrays sorted by (hash, song, frame).
+
+    Every yielded array holds whole buckets: a bucket never spans two yields.
+    Each run is read through a window of budget / len(paths) triples (at least
+    MIN_WINDOW), grown only while it covers a single hash.
+    """
+    window = max(MIN_WINDOW, budget // max(1, len(paths)))
+    sizes = [os.path.getsize(p) // RUN_DTYPE.itemsize for p in paths]
+    pos = [0] * len(paths)
+    bufs = [np.empty(0, dtype=RUN_DTYPE) for _ in paths]
+    while True:
+        for i, path in enumerate(paths):
+            # a window ending inside its first hash can't bound the merge: read on
+            while pos[i] < sizes[i] and (len(bufs[i]) < window or bufs[i]["hash"][0] == bufs[i]["hash"][-1]):
+                n = min(window, sizes[i] - pos[i])
+                more = np.fromfile(path, dtype=RUN_DTYPE, count=n, offset=pos[i] * RUN_DTYPE.itemsize)
+                bufs[i] = np.concatenate((bufs[i], more))
+                pos[i] += n
+        if not any(len(b) for b in bufs):
+            return
+        # every hash below the smallest window end is complete in every run
+        open_ends = [int(b["hash"][-1]) for b, p, n in zip(bufs, pos, sizes) if p < n]
+        bound = min(open_ends) if open_ends else None
+        parts = []
+        for i, b in enumerate(bufs):
+            cut = len(b) if bound is None else int(np.searchsorted(b["hash"], bound))
+            parts.append(b[:cut])
+            bufs[i] = b[cut:]
+        out = np.concatenate(parts)
+        yield out[np.lexsort((out["frame"], out["song"], out["hash"]))]
+
+
+def write_flat_from_runs(paths, out_dir, meta_list, max_frame, max_bucket=None, stop_mode="drop", budget=MERGE_RECORDS):
+    """Merge runs into a flat index at out_dir, pruning stop hashes on the way -> (n_keys, n_postings, pruned).
+
+    Bucket-size statistics (before pruning) are printed as in the in-memory build;
+    pruned is the stop-hash summary of prune_buckets (None without max_bucket).
+    """
+    if stop_mode not in ("drop", "cap"):
+        raise ValueError(f"unknown stop-hash mode {stop_mode!r}")
+    total = sum(os.path.getsize(p) for p in paths) // RUN_DTYPE.itemsize
+    writer = FlatWriter(out_dir, frame_bits=max(1, max_frame.bit_length()), max_postings=total)
+    hist = np.zeros(1, dtype=np.int64)          # buckets per size
+    heavy_buckets = removed = 0
+    for rows in merge_runs(paths, budget):
+        h = rows["hash"]
+        starts = np.flatnonzero(np.r_[True, h[1:] != h[:-1]])
+        sizes = np.diff(np.r_[starts, len(h)])
+        if sizes.max() >= len(hist):
+            hist = np.r_[hist, np.zeros(int(sizes.max()) + 1 - len(hist), dtype=np.int64)]
+        hist += np.bincount(sizes, minlength=len(hist))
+        if max_bucket and sizes.max() > max_bucket:
+            keep = np.ones(len(rows), dtype=bool)
+            for a, n in zip(starts[sizes > max_bucket], sizes[sizes > max_bucket]):
+                keep[a:a + n] = False
+                if stop_mode == "cap":
+                    keep[a + cap_positions(n, max_bucket)] = True
+            heavy_buckets += int((sizes > max_bucket).sum())
+            removed += int(len(rows) - keep.sum())
+            rows = rows[keep]
+            h = rows["hash"]
+            if len(rows) == 0:
+                continue
+            starts = np.flatnonzero(np.r_[True, h[1:] != h[:-1]])
+            sizes = np.diff(np.r_[starts, len(h)])
+        writer.add(h[starts], sizes, rows["song"], rows["frame"])
+
+    print_bucket_stats(bucket_stats(np.flatnonzero(hist), hist[hist > 0]))
+    pruned = None
+    if max_bucket:
+        print(f"✂️ Stop hashes: {heavy_buckets:,} buckets over {max_bucket} postings ({stop_mode}), {removed:,} postings removed")
+        pruned = {"max_bucket": int(max_bucket), "mode": stop_mode, "buckets": heavy_buckets, "postings_removed": removed}
+    n_keys, n_postings = writer.close(meta_list, header_extra=pruned and {"stop_hashes": pruned})
+    return n_keys, n_postings, pruned
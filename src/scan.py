@@ -0,0 +1,167 @@
+# src/scan.py
+"""
+Timeline identification over long recordings (broadcast logs, DJ sets, radio captures).
+
+The recording goes through the spectrogram -> peak_coords -> hashing pipeline
+once, block by block (StreamingFingerprinter), so every hash is computed once
+however much the scan windows overlap:
+
+  * hashes are grouped by anchor time into slots of SCAN_HOP seconds, and each
+    slot is looked up in the index once, as soon as it is complete;
+  * a window of SCAN_WINDOW seconds is the union of its slots' votes, and is
+    voted on like a single clip (candidate_alignments / pick_best);
+  * windows with the same best song are merged into timeline segments.
+
+Only one window's slots and one decoded block are held at any time, so memory
+does not grow with the length of the recording.
+"""
+import subprocess
+from collections import deque
+import numpy as np
+
+from src.dsp import SR, MIN_MATCHES, gather_postings, offset_histogram, candidate_alignments, pick_best
+from src.streaming import StreamingFingerprinter
+
+SCAN_WINDOW = 10.0          # seconds voted on together
+SCAN_HOP = 5.0              # seconds between window starts (SCAN_WINDOW must be a multiple)
+SCAN_BLOCK = 30.0           # seconds of audio decoded per read
+
+
+def read_blocks(path, seconds=SCAN_BLOCK):
+    """Yield (mono float32 block, sr) from an audio file without loading it whole.
+
+    Formats libsndfile knows are read natively; anything else is streamed
+    through ffmpeg, which also resamples to SR.
+    """
+    import soundfile as sf
+    from src.server.decode import FFMPEG_BIN, DecodeError
+    try:
+        f = sf.SoundFile(path)
+    except RuntimeError:   # sf.LibsndfileError: not a format libsndfile knows
+        f = None
+    if f is not None:
+        with f:
+            while True:
+                block = f.read(int(seconds * f.samplerate), dtype="float32", always_2d=True)
+                if len(block) == 0:
+                    return
+                yield block.mean(axis=1), f.samplerate
+    try:
+        proc = subprocess.Popen(
+            [FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error",
+             "-i", path, "-f", "f32le", "-ac", "1", "-ar", str(SR), "pipe:1"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    except OSError as e:
+        raise DecodeError(f"ffmpeg failed: {e}") from e
+    with proc:
+        while True:
+            data = proc.stdout.read(int(seconds * SR) * 4)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.float32), SR
+        err = proc.stderr.read()
+    if proc.returncode != 0:
+        raise DecodeError(f"ffmpeg exited with {proc.returncode}: {err.decode(errors='replace').strip()}")
+
+
+class TimelineScanner:
+    """push() PCM blocks of one long recording, get back the timeline segments that just closed.
+
+    A segment is (start_sec, end_sec, song_id, confidence). Each window owns
+    the middle SCAN_HOP seconds of its span (the first and last window reach
+    out to the recording's edges), so segments never overlap; confidence is
+    the mean align / total of the segment's windows, as in /recognize.
+    """
+
+    def __init__(self, inv, sr, window=SCAN_WINDOW, hop=SCAN_HOP, min_matches=MIN_MATCHES):
+        k = window / hop
+        if hop <= 0 or k < 1 or abs(k - round(k)) > 1e-9:
+            raise ValueError("window must be a positive multiple of hop")
+        self.inv, self.window, self.hop, self.k = inv, window, hop, int(round(k))
+        self.min_matches = min_matches
+        self.fp = StreamingFingerprinter(sr)
+        self.slots = deque(maxlen=self.k)      # (sids, offs, counts) of the latest complete slots
+        self.slot = 0                           # index of the slot being filled
+        self.pending = []                       # (hash, t_sec) of that slot
+        self.windows = 0                        # windows voted on so far
+        self.open = None                        # [start, end, song, [confidences]] of the running segment
+        self.hashes = self.postings = 0
+
+    def push(self, chunk):
+        return self._add(self.fp.push(chunk))
+
+    def flush(self):
+        """End of recording: vote on what is left and close the last segment."""
+        out = self._add(self.fp.flush())
+        out += self._close_slot(final=True)
+        if self.open is not None:
+            self.open[1] = max(self.open[1], self.fp.seconds)
+            out.append(self._segment(self.open))
+            self.open = None
+        return out
+
+    def _add(self, qhashes):
+        out = []
+        self.hashes += len(qhashes)
+        for h, t in qhashes:            # anchors come out in time order
+            while t >= (self.slot + 1) * self.hop:
+                out += self._close_slot()
+            self.pending.append((h, t))
+        return out
+
+    def _close_slot(self, final=False):
+        if hasattr(self.inv, "votes"):
+            sids, offs, counts = self.inv.votes(self.pending)       # sharded: merged partial histograms
+        else:
+            sids, offs, counts = offset_histogram(*gather_postings(self.inv, self.pending))
+        self.postings += int(counts.sum())
+        self.slots.append((sids, offs, counts))
+        self.pending = []
+        self.slot += 1
+        if len(self.slots) < self.k and not (final and self.windows == 0):
+            return []               # the first full window is not in yet (or the tail is covered already)
+        return self._vote(self.slot - len(self.slots), final)
+
+    def _vote(self, first_slot, final):
+        """Best song of the window starting at first_slot -> closed segments."""
+        sids, offs, counts = (np.concatenate(x) for x in zip(*self.slots))
+        best_sid, best_align, best_total = pick_best(*candidate_alignments(sids, offs, counts))
+        song = best_sid if best_align >= self.min_matches else None
+        start = first_slot * self.hop
+        # the window owns the middle hop of its span; the first one reaches back to 0
+        lo = 0.0 if self.windows == 0 else start + (self.window - self.hop) / 2
+        hi = start + (self.window + self.hop) / 2
+        self.windows += 1
+
+        out = []
+        if self.open is not None and self.open[2] != song:
+            out.append(self._segment(self.open))
+            self.open = None
+        if song is not None:
+            if self.open is None:
+                self.open = [lo, hi, song, []]
+            self.open[1] = hi
+            self.open[3].append(best_align / max(1, best_total))
+        return out
+
+    @staticmethod
+    def _segment(seg):
+        start, end, song, confs = seg
+        return round(start, 3), round(end, 3), int(song), round(float(np.mean(confs)), 4)
+
+
+def scan_blocks(inv, blocks, window=SCAN_WINDOW, hop=SCAN_HOP, min_matches=MIN_MATCHES):
+    """Yield timeline segments from (mono block, sr) pairs as soon as they close."""
+    scanner = None
+    for block, sr in blocks:
+        if scanner is None:
+            scanner = TimelineScanner(inv, sr, window, hop, min_matches)
+        yield from scanner.push(block)
+    if scanner is not None:
+        yield from scanner.flush()
+
+
+def scan_file(path, inv, window=SCAN_WINDOW, hop=SCAN_HOP, block_seconds=SCAN_BLOCK, min_matches=MIN_MATCHES):
+    """Long recording -> [(start_sec, end_sec, song_id, confidence)], in time order."""
+    return list(scan_blocks(inv, read_blocks(path, block_seconds), window, hop, min_matches))
@@ -0,0 +1,223 @@
+# src/segments.py
+"""
+Append-only segmented index.
+
+    <root>/manifest.json    {"generation", "segments": [dir, ...], "tombstones": [song_id, ...], "next_song_id"}
+    <root>/seg_000002/      flat index (see src/flat_index.py)
+    <root>/seg_000003/      ...
+
+New songs land in a small delta segment that is searched alongside the others;
+removed songs are tombstoned and filtered out of the postings before voting.
+compact() merges every segment into one and drops tombstoned postings. Readers
+only ever see a fully written manifest (written to a temp file, then os.replace),
+so a running server can refresh() onto new segments without a restart.
+"""
+import os, json, time
+import numpy as np
+
+from src.dsp import check_key_type
+from src.flat_index import FileLock, FlatIndex, budget_mask, write_flat_index, write_flat_arrays, csr_from_sorted
+
+SEGMENTS_DIR = "src/server/segments"
+REFRESH_INTERVAL = 1.0      # seconds between manifest checks in refresh()
+
+
+# ---- manifest ----
+def manifest_path(root):
+    return os.path.join(root, "manifest.json")
+
+def read_manifest(root):
+    with open(manifest_path(root), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_manifest(root, manifest):
+    tmp = manifest_path(root) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(root))
+
+def segment_path(root, seg):
+    return seg if os.path.isabs(seg) else os.path.join(root, seg)
+
+
+def ManifestLock(root, timeout=30.0):
+    """Exclusive writer lock for a segment set."""
+    return FileLock(os.path.join(root, ".lock"), timeout=timeout)
+
+
+# ---- reader ----
+class SegmentedIndex:
+    """Searches every live segment and hides tombstoned songs."""
+
+    def __init__(self, root=SEGMENTS_DIR):
+        self.root = root
+        self.generation = None
+        self.segments = {}          # name -> FlatIndex (kept open across refreshes)
+        # (segments in manifest order, tombstones) swapped as one object so readers on
+        # other threads never see a half-applied refresh
+        self.view = ([], np.empty(0, dtype=np.int64))
+        self.meta_by_id = {}
+        self._checked = 0.0
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """Pick up a new manifest if one was published; returns True when it changed."""
+        now = time.time()
+        if not force and now - self._checked < REFRESH_INTERVAL:
+            return False
+        self._checked = now
+        manifest = read_manifest(self.root)
+        if manifest["generation"] == self.generation:
+            return False
+
+        segments = {}
+        for seg in manifest["segments"]:
+            if seg not in self.segments:
+                self.segments[seg] = FlatIndex(segment_path(self.root, seg))
+                check_key_type(self.segments[seg].header.get("key_type", "int"), segment_path(self.root, seg))
+            segments[seg] = self.segments[seg]
+            with open(os.path.join(segment_path(self.root, seg), "songs_meta.json"), "r", encoding="utf-8") as f:
+                for m in json.load(f):
+                    self.meta_by_id[int(m["id"])] = m   # in place: callers hold this dict
+        tombstones = np.array(sorted(manifest.get("tombstones", [])), dtype=np.int64)
+        self.segments = segments
+        self.view = ([segments[seg] for seg in manifest["segments"]], tombstones)
+        self.generation = manifest["generation"]
+        print(f"🔄 Index generation {self.generation}: {len(segments)} segment(s), "
+              f"{len(tombstones)} tombstone(s)", flush=True)
+        return True
+
+    def __len__(self):
+        return sum(len(s) for s in self.view[0])
+
+    def get(self, h, default=None):
+        segments, tombstones = self.view
+        parts = [p for p in (s.get(h) for s in segments) if p is not None]
+        if not parts:
+            return default
+        post = np.concatenate(parts)
+        if len(tombstones):
+            post = post[~np.isin(post[:, 0].astype(np.int64), tombstones)]
+        return post
+
+    def bucket_sizes(self, hashes):
+        """Postings per query hash summed over segments (tombstoned postings included)."""
+        sizes = np.zeros(len(hashes), dtype=np.int64)
+        for seg in self.view[0]:
+            sizes += seg.bucket_sizes(hashes)
+        return sizes
+
+    def lookup(self, hashes, budget=0):
+        """Same contract as FlatIndex.lookup, across all segments, tombstones removed."""
+        if budget and len(hashes):
+            sizes = self.bucket_sizes(hashes)
+            if sizes.sum() > budget:
+                sel = np.flatnonzero(budget_mask(sizes, budget))
+                post, qi = self.lookup([hashes[i] for i in sel])
+                return post, sel[qi]
+        segments, tombstones = self.view
+        posts, qis = [], []
+        for seg in segments:
+            post, qi = seg.lookup(hashes)
+            posts.append(post)
+            qis.append(qi)
+        if not posts:
+            return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        post, qi = np.concatenate(posts), np.concatenate(qis)
+        if len(tombstones):
+            keep = ~np.isin(post[:, 0].astype(np.int64), tombstones)
+            post, qi = post[keep], qi[keep]
+        return post, qi
+
+    def lookup_frames(self, hashes, budget=0):
+        """Same contract as FlatIndex.lookup_frames, across all segments, tombstones removed."""
+        if budget and len(hashes):
+            sizes = self.bucket_sizes(hashes)
+            if sizes.sum() > budget:
+                sel = np.flatnonzero(budget_mask(sizes, budget))
+                sids, frames, qi = self.lookup_frames([hashes[i] for i in sel])
+                return sids, frames, sel[qi]
+        segments, tombstones = self.view
+        parts = [seg.lookup_frames(hashes) for seg in segments]
+        if not parts:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        sids, frames, qi = (np.concatenate(p) for p in zip(*parts))
+        if len(tombstones):
+            keep = ~np.isin(sids, tombstones)
+            sids, frames, qi = sids[keep], frames[keep], qi[keep]
+        return sids, frames, qi
+
+
+def load_segmented_index(root=SEGMENTS_DIR):
+    """-> (SegmentedIndex, meta_by_id); meta_by_id grows in place on refresh()."""
+    inv = SegmentedIndex(root)
+    return inv, inv.meta_by_id
+
+
+# ---- writers ----
+def init_segments(root, base_dir):
+    """Start a segment set whose first segment is an existing flat index."""
+    os.makedirs(root, exist_ok=True)
+    if os.path.exists(manifest_path(root)):
+        raise FileExistsError(f"❌ Segments already initialised: {manifest_path(root)}")
+    with open(os.path.join(base_dir, "songs_meta.json"), "r", encoding="utf-8") as f:
+        ids = [int(m["id"]) for m in json.load(f)]
+    write_manifest(root, {
+        "generation": 1,
+        "segments": [os.path.abspath(base_dir)],
+        "tombstones": [],
+        "next_song_id": max(ids, default=-1) + 1,
+    })
+
+def _new_segment_name(manifest):
+    return f"seg_{manifest['generation'] + 1:06d}"
+
+def add_segment(root, inv, meta):
+    """Publish {hash: [[song_id, t_sec], ...]} + meta as a new delta segment."""
+    with ManifestLock(root):
+        manifest = read_manifest(root)
+        name = _new_segment_name(manifest)
+        write_flat_index(segment_path(root, name), inv, {m["id"]: m for m in meta})
+        manifest["segments"].append(name)
+        manifest["next_song_id"] = max([manifest["next_song_id"]] + [m["id"] + 1 for m in meta])
+        manifest["generation"] += 1
+        write_manifest(root, manifest)
+    return name
+
+def remove_songs(root, song_ids):
+    with ManifestLock(root):
+        manifest = read_manifest(root)
+        manifest["tombstones"] = sorted(set(manifest.get("tombstones", [])) | {int(s) for s in song_ids})
+        manifest["generation"] += 1
+        write_manifest(root, manifest)
+
+def compact(root):
+    """Merge all segments into one, dropping tombstoned songs; old segment dirs are left for cleanup."""
+    with ManifestLock(root):
+        manifest = read_manifest(root)
+        dead_ids = {int(s) for s in manifest.get("tombstones", [])}
+        dead = np.array(sorted(dead_ids), dtype=np.int64)
+        keys, posts, meta = [], [], []
+        key_type = "int"
+        for seg in manifest["segments"]:
+            fi = FlatIndex(segment_path(root, seg))
+            key_type = fi.header.get("key_type", "int")
+            k, p = fi.posting_keys(), fi.bucket_postings(0, len(fi))
+            keep = ~np.isin(p[:, 0], dead)
+            keys.append(k[keep])
+            posts.append(p[keep])
+            with open(os.path.join(segment_path(root, seg), "songs_meta.json"), "r", encoding="utf-8") as f:
+                meta += [m for m in json.load(f) if int(m["id"]) not in dead_ids]
+
+        keys, posts = np.concatenate(keys), np.concatenate(posts)
+        # stable: within a bucket, older segments (smaller song IDs) stay first
+        order = np.argsort(keys, kind="stable")
+        name = _new_segment_name(manifest)
+        write_flat_arrays(segment_path(root, name), *csr_from_sorted(keys[order], posts[order]),
+                          sorted(meta, key=lambda m: int(m["id"])), key_type=key_type)
+
+        old = manifest["segments"]
+        manifest.update(segments=[name], tombstones=[], generation=manifest["generation"] + 1)
+        write_manifest(root, manifest)
+    return name, old
@@ -1,188 +1,230 @@
-import sys, os, json, gzip, pickle, base64, requests
+import sys, os, json, time, itertools, threading
+from contextlib import asynccontextmanager
 import numpy as np
-from collections import defaultdict, Counter
-import torch, torchaudio
-from datetime import datetime, timedelta
 from dotenv import load_dotenv
 # Add project root
 sys.path.append(os.path.abspath("."))
 
-from src.recognize_constellation import (
-    HOP, SR, MIN_MATCHES,
-    spectrogram_db_from_tensor, peak_coords, hashes_from_peaks
+from src.dsp import (
+    SR, MIN_MATCHES,
+    warm_up, load_audio, spectrogram_db_from_tensor, spectrogram_db_batch, peak_coords, hashes_from_peaks,
+    gather_postings, gather_postings_batch, candidate_alignments, pick_best
 )
+from src.flat_index import load_flat_index, load_pickle_cache, ensure_flat_index
+from src.segments import load_segmented_index
+from src.shards import load_sharded_index
+from src.streaming import StreamSession, STREAM_MAX_SECONDS
+from src.wire import decode_qhashes, WireError
+from src.server.meta_cache import MetadataCache, clean_title
+from src.server.result_cache import ResultCache
+from src.server.metrics import Trace, observe_trace, render as render_metrics, gauge_lines, REQUESTS, REQUEST_SECONDS
 load_dotenv()
 
-SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
-SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 # ====================== CONFIG ======================
-INDEX_DIR = "constellation_index"
-CACHE_FILE = "src/server/constellation_cache.pkl.gz"   # gz for deployment
-USE_SPOTIFY_META = True
+# index locations can be overridden with SONAR_* environment variables (e.g. for benchmarks)
+CACHE_FILE = os.getenv("SONAR_CACHE_FILE", "src/server/constellation_cache.pkl.gz")   # gz for deployment
+FLAT_INDEX_DIR = os.getenv("SONAR_FLAT_INDEX", "src/server/flat_index")   # preferred: mmap'd CSR index (src/utils/build_flat_index.py)
+SEGMENTS_DIR = os.getenv("SONAR_SEGMENTS", "src/server/segments")         # incremental segments (src/utils/update_index.py), if initialised
+SHARDS_DIR = os.getenv("SONAR_SHARDS", "src/server/shards")               # hash-range shards served by src/shards.py, if split
+SHARE_INDEX = True          # convert a pickle-only cache to FLAT_INDEX_DIR once so all workers mmap one copy
+USE_SPOTIFY_META = os.getenv("SONAR_SPOTIFY_META", "1") != "0"    # enrich matches via the metadata cache (src/server/meta_cache.py)
+BATCH_SIZE = 16             # clips per STFT call in recognize_batch
+DEBUG_TIMING = os.getenv("SONAR_DEBUG_TIMING", "0") == "1"        # Server-Timing header on every /recognize
+MAX_FINGERPRINT_BYTES = 1 << 20     # /recognize/fingerprint request body limit
+USE_RESULT_CACHE = os.getenv("SONAR_RESULT_CACHE", "0") == "1"   # repeated-upload cache (src/server/result_cache.py)
 
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🚀 Using device: {device}", flush=True)
-
 # =====================================================
-# FAST INDEX LOADER (gzip-aware)
+# FAST INDEX LOADER (segments / flat mmap, else gzip-aware pickle)
 # =====================================================
 def load_index_fast():
+    if os.path.exists(os.path.join(SHARDS_DIR, "shards.json")):
+        print("🔧 Connecting to fingerprint index shards...", flush=True)
+        inv, meta_by_id = load_sharded_index(SHARDS_DIR)
+        print(f"✅ Loaded {len(meta_by_id)} songs, {len(inv):,} hash buckets over {len(inv.addresses)} shards")
+        return inv, meta_by_id
+
+    if os.path.exists(os.path.join(SEGMENTS_DIR, "manifest.json")):
+        print("🔧 Mapping segmented fingerprint index...", flush=True)
+        inv, meta_by_id = load_segmented_index(SEGMENTS_DIR)
+        print(f"✅ Loaded {len(meta_by_id)} songs, {len(inv):,} hash buckets")
+        return inv, meta_by_id
+
+    if not os.path.exists(os.path.join(FLAT_INDEX_DIR, "header.json")) and SHARE_INDEX \
+            and os.path.exists(CACHE_FILE):
+        ensure_flat_index(CACHE_FILE, FLAT_INDEX_DIR)
+
+    if os.path.exists(os.path.join(FLAT_INDEX_DIR, "header.json")):
+        # read-only mmap: every worker process shares the same page-cache pages
+        print("🔧 Mapping flat fingerprint index...", flush=True)
+        inv, meta_by_id = load_flat_index(FLAT_INDEX_DIR)
+        print(f"✅ Loaded {len(meta_by_id)} songs, {len(inv):,} hash buckets")
+        return inv, meta_by_id
+
     if not os.path.exists(CACHE_FILE):
         raise FileNotFoundError(f"❌ Cache file not found: {CACHE_FILE}")
 
     print("🔧 Loading fingerprint cache...", flush=True)
-    with open(CACHE_FILE, "rb") as f:
-        magic = f.read(2)
-    opener = gzip.open if magic == b"\x1f\x8b" else open
-
-    with opener(CACHE_FILE, "rb") as f:
-        obj = pickle.load(f)
-
-    inv = obj["inv"]
-    meta_by_id = obj["meta_by_id"]
+    inv, meta_by_id = load_pickle_cache(CACHE_FILE)
     print(f"✅ Loaded {len(meta_by_id)} songs, {len(inv):,} hash buckets")
     return inv, meta_by_id
 
 
-print("🔧 Loading fingerprint DB into memory...")
-inv, meta_by_id = load_index_fast()
-print("✅ Index ready\n")
+# Loaded on first use, not at import: the lifespan hook below does it at server
+# startup, scripts importing this module (e.g. src/utils/recognize_batch.py) on first call.
+inv, meta_by_id = None, {}
+_index_lock = threading.Lock()
+# in the server process, in front of the worker pool (one per uvicorn worker)
+result_cache = ResultCache() if USE_RESULT_CACHE else None
 
 
-# =====================================================
-# SPOTIFY TOKEN CACHE
-# =====================================================
-_spotify_token = None
-_token_expiry = None
-
-def get_spotify_token():
-    """Get and cache a Spotify app-only token for 1 hour."""
-    global _spotify_token, _token_expiry
-
-    if _spotify_token and _token_expiry and datetime.utcnow() < _token_expiry:
-        return _spotify_token  # still valid
-
-    auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    b64_auth = base64.b64encode(auth_str.encode()).decode()
-    headers = {"Authorization": f"Basic {b64_auth}"}
-    data = {"grant_type": "client_credentials"}
-
-    res = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data, timeout=5)
-    res.raise_for_status()
-    token_data = res.json()
-    _spotify_token = token_data["access_token"]
-    _token_expiry = datetime.utcnow() + timedelta(seconds=token_data.get("expires_in", 3600))
-    print("🔑 New Spotify token fetched.")
-    return _spotify_token
-
-
-# =====================================================
-# SMART SPOTIFY METADATA FETCHER
-# =====================================================
-def get_spotify_metadata(artist, title):
-    """Fetch accurate metadata (album, cover, preview, popularity) via Spotify API."""
-    try:
-        token = get_spotify_token()
-        headers = {"Authorization": f"Bearer {token}"}
-
-        # Clean and prepare query
-        clean_title = title.replace(".wav", "").replace(".mp3", "").strip()
-        query = f"track:{clean_title} artist:{artist}"
-
-        res = requests.get(
-            f"https://api.spotify.com/v1/search?q={query}&type=track&limit=5",
-            headers=headers,
-            timeout=5
-        ).json()
-
-        tracks = res.get("tracks", {}).get("items", [])
-        if not tracks:
-            print(f"⚠️ No Spotify match found for: {artist} - {clean_title}")
-            return None
-
-        # Try best match: exact title and artist match
-        best_track = None
-        for t in tracks:
-            title_match = clean_title.lower() in t["name"].lower()
-            artist_match = any(artist.lower() in a["name"].lower() for a in t["artists"])
-            if title_match and artist_match:
-                best_track = t
-                break
-        if not best_track:
-            best_track = tracks[0]
-
-        album = best_track["album"]
-        return {
-            "album": album.get("name"),
-            "cover": album["images"][0]["url"] if album.get("images") else None,
-            "release": album.get("release_date", "")[:10],
-            "preview": best_track.get("preview_url"),
-            "spotify_url": best_track["external_urls"]["spotify"],
-            "popularity": best_track.get("popularity", 0),
-        }
-
-    except Exception as e:
-        print(f"⚠️ Spotify metadata fetch failed: {e}")
-        return None
+def get_index():
+    global inv, meta_by_id
+    if inv is None:
+        with _index_lock:
+            if inv is None:
+                print("🔧 Loading fingerprint DB...", flush=True)
+                loaded, meta_by_id = load_index_fast()
+                inv = loaded
+                print("✅ Index ready\n", flush=True)
+    if hasattr(inv, "refresh"):
+        inv.refresh()   # cheap; picks up newly published segments / tombstones
+    return inv
 
 
 # =====================================================
 # MATCHING ENGINE
 # =====================================================
-def recognize_file(path):
-    wav, sr = torchaudio.load(path)
-    S_db = spectrogram_db_from_tensor(wav, sr)
-    peaks = peak_coords(S_db)
-    qhashes = hashes_from_peaks(peaks)
-
-    votes = defaultdict(list)
-    for h, qt in qhashes:
-        arr = inv.get(h)
-        if arr is None or arr.size == 0:
-            continue
-        sids = arr[:, 0].astype(np.int32)
-        dbts = arr[:, 1]
-        deltas = np.round(dbts - qt, 2)
-        for sid, dt in zip(sids, deltas):
-            votes[int(sid)].append(dt)
-
-    if not votes:
+def finish_match(sids, offs, counts=None, trace=None):
+    """Votes -> (info, align, confidence); info is a fresh dict, meta_by_id is never mutated."""
+    songs, align, total = candidate_alignments(sids, offs, counts)
+    best_sid, best_align, best_total = pick_best(songs, align, total)
+    if trace is not None:
+        trace.lap("voting")
+        trace.count("candidates", len(songs))
+    if best_sid is None:
         return None, 0, 0.0
 
-    best_sid, best_align, best_total = None, 0, 0
-    for sid, deltas in votes.items():
-        total = len(deltas)
-        align = Counter(deltas).most_common(1)[0][1]
-        if align > best_align or (align == best_align and total > best_total):
-            best_sid, best_align, best_total = sid, align, total
-
     if best_align < MIN_MATCHES:
         return None, best_align, 0.0
 
-    info = meta_by_id[int(best_sid)]
-    confidence = best_align / max(1, best_total)
+    return song_info(best_sid), best_align, best_align / max(1, best_total)
 
-    # Clean up title (remove .wav/.mp3)
-    info["title"] = info["title"].replace(".wav", "").replace(".mp3", "").strip()
 
-    # Add Spotify metadata
-    if USE_SPOTIFY_META:
-        meta = get_spotify_metadata(info["artist"], info["title"])
-        if meta:
-            info.update(meta)
+def song_info(sid):
+    """Fresh metadata dict for a song, title cleaned up (remove .wav/.mp3)."""
+    info = dict(meta_by_id[int(sid)])
+    info["title"] = clean_title(info["title"])
+    return info
 
-    return info, best_align, confidence
+
+def recognize_samples(wav, sr, trace=None):
+    """-> (info, align, confidence); per-stage timings and counts go to trace if given."""
+    trace = Trace() if trace is None else trace
+    inv = get_index()
+    trace.lap("index")
+    S_db = spectrogram_db_from_tensor(wav, sr, keep_on_device=True)
+    trace.lap("stft")
+    peaks = peak_coords(S_db)
+    trace.lap("peaks")
+    qhashes = hashes_from_peaks(peaks)
+    trace.lap("hashing")
+    trace.count("peaks", len(peaks))
+    return match_hashes(inv, qhashes, trace)
+
+
+def match_hashes(inv, qhashes, trace):
+    """Query (hash, t_sec) pairs -> (info, align, confidence): lookup + voting only."""
+    trace.count("hashes", len(qhashes))
+    if hasattr(inv, "votes"):
+        sids, offs, counts = inv.votes(qhashes)     # sharded: merged partial histograms
+        trace.lap("lookup")
+        trace.count("postings", counts.sum())
+        return finish_match(sids, offs, counts, trace=trace)
+    sids, offs = gather_postings(inv, qhashes)
+    trace.lap("lookup")
+    trace.count("postings", len(sids))
+    return finish_match(sids, offs, trace=trace)
+
+
+def recognize_fingerprint(data, trace=None):
+    """Client-computed fingerprint (src/wire.py format) -> (info, align, confidence); no DSP on the server."""
+    trace = Trace() if trace is None else trace
+    inv = get_index()
+    trace.lap("index")
+    qhashes = decode_qhashes(data)
+    trace.lap("decode")
+    return match_hashes(inv, qhashes, trace)
+
+
+def recognize_file(path, trace=None):
+    trace = Trace() if trace is None else trace
+    wav, sr = load_audio(path)
+    trace.lap("load")
+    return recognize_samples(wav, sr, trace)
+
+
+def recognize_batch(sources, loader=load_audio, batch_size=BATCH_SIZE):
+    """Recognize many clips, batch_size at a time.
+
+    sources are whatever loader() turns into (wav, sr): file paths by default,
+    upload bytes with decode_bytes. One padded STFT and one index lookup per
+    batch. Yields (index, info, align, confidence, error) per clip, in input
+    order, as each batch finishes; clips that fail to load yield
+    error="decode_failed".
+    """
+    inv = get_index()
+    it = enumerate(sources)
+    while True:
+        chunk = list(itertools.islice(it, batch_size))
+        if not chunk:
+            return
+        clips, ok, failed = [], [], []
+        for i, src in chunk:
+            try:
+                clips.append(loader(src))
+                ok.append(i)
+            except Exception as e:
+                print(f"⚠️ Could not load clip #{i}: {e}")
+                failed.append(i)
+
+        results = {i: (None, 0, 0.0, "decode_failed") for i in failed}
+        if clips:
+            specs = spectrogram_db_batch(clips)
+            qhash_lists = [hashes_from_peaks(peak_coords(S_db)) for S_db in specs]
+            for i, (sids, offs) in zip(ok, gather_postings_batch(inv, qhash_lists)):
+                results[i] = (*finish_match(sids, offs), None)
+        for i, _ in chunk:
+            yield (i, *results[i])
 
 
 # =====================================================
 # FASTAPI APP
 # =====================================================
-from fastapi import FastAPI, UploadFile, File
+from typing import List
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, Header, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-import shutil, uuid, subprocess
-
-app = FastAPI()
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from src.server.decode import decode_bytes, DecodeError
+from src.server.workers import RecognitionPool, Overloaded, DeadlineExceeded
+
+@asynccontextmanager
+async def lifespan(app):
+    """Startup: load the index and build the DSP transforms before taking traffic."""
+    global meta_cache
+    await run_in_threadpool(get_index)
+    device = await run_in_threadpool(warm_up)
+    print(f"🚀 Using device: {device}", flush=True)
+    meta_cache = MetadataCache()
+    yield
+    pool.shutdown()
+    await meta_cache.close()
+    meta_cache = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -192,41 +234,146 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "tmp_uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Recognition runs here, never on the event loop (SONAR_EXECUTOR / SONAR_WORKERS /
+# SONAR_MAX_PENDING / SONAR_DEADLINE, see src/server/workers.py)
+pool = RecognitionPool()
+meta_cache = None       # MetadataCache, opened by lifespan()
 
 
-def convert_to_wav(src_path, dst_path):
-    """Convert uploaded file to WAV using ffmpeg."""
-    try:
-        subprocess.run(
-            ["ffmpeg", "-y", "-i", src_path, "-ar", "44100", "-ac", "1", dst_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return True
-    except Exception:
-        return False
+async def enrich(match):
+    """Merge cached Spotify metadata into a match (a new dict; cache entries stay immutable)."""
+    if not match or not USE_SPOTIFY_META or meta_cache is None:
+        return match
+    meta = await meta_cache.get(match)
+    return {**match, **meta} if meta else match
 
 
-@app.post("/recognize")
-async def recognize(audio: UploadFile = File(...)):
-    """Handle uploaded clip and return recognition + Spotify metadata."""
-    ext = audio.filename.split(".")[-1]
-    temp_raw = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.{ext}")
-    temp_wav = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.wav")
+def recognize_bytes(data):
+    """-> (info, align, confidence, trace); the Trace travels back from process workers too."""
+    trace = Trace()
+    wav, sr = decode_bytes(data, trace)     # in memory: no temp files
+    return (*recognize_samples(wav, sr, trace), trace)
+
 
-    with open(temp_raw, "wb") as buffer:
-        shutil.copyfileobj(audio.file, buffer)
+def fingerprint_bytes(data):
+    """recognize_bytes for a client-computed fingerprint (src/wire.py)."""
+    trace = Trace()
+    return (*recognize_fingerprint(data, trace), trace)
 
-    convert_to_wav(temp_raw, temp_wav)
 
+def index_generation():
+    """Segmented index generation (None for other index types); part of the result cache key."""
+    return getattr(get_index(), "generation", None)
+
+
+async def respond(endpoint, fn, data, response, debug_timing, label):
+    """Run fn(data) in the worker pool and build the /recognize-shaped reply (metrics, metadata, timing)."""
+    t0 = time.perf_counter()
+    outcome = "error"
     try:
-        match, align, conf = recognize_file(temp_wav)
+        key, hit = result_cache.lookup(endpoint, data, index_generation()) if result_cache else (None, None)
+        try:
+            if hit is not None:
+                match, align, conf = hit
+                trace = Trace()
+                trace.lap("result_cache")
+                trace.count("cache_hits", 1)
+            else:
+                match, align, conf, trace = await pool.run(fn, data)
+                if key is not None:
+                    result_cache.put(key, (match, align, conf), sum(trace.stages.values()))
+        except DecodeError as e:
+            print(f"⚠️ Could not decode upload {label}: {e}")
+            outcome = "decode_failed"
+            return {"success": False, "message": "decode_failed"}
+        except WireError as e:
+            print(f"⚠️ Bad fingerprint {label}: {e}")
+            outcome = "bad_fingerprint"
+            return JSONResponse({"success": False, "message": "bad_fingerprint", "detail": str(e)}, status_code=400)
+        except Overloaded:
+            outcome = "overloaded"
+            return JSONResponse({"success": False, "message": "overloaded"}, status_code=503,
+                                headers={"Retry-After": "1"})
+        except DeadlineExceeded:
+            outcome = "timeout"
+            return JSONResponse({"success": False, "message": "timeout"}, status_code=503,
+                                headers={"Retry-After": "1"})
+
+        trace.restart()
+        match = await enrich(match)
+        trace.lap("metadata")
+        observe_trace(trace)
+        if DEBUG_TIMING or debug_timing == "1":
+            response.headers["Server-Timing"] = trace.server_timing()
+        outcome = "match" if match else "no_match"
+        return match_response(match, align, conf)
     finally:
-        if os.path.exists(temp_raw): os.remove(temp_raw)
-        if os.path.exists(temp_wav): os.remove(temp_wav)
+        REQUESTS.inc(endpoint, outcome)
+        REQUEST_SECONDS.observe(time.perf_counter() - t0, endpoint)
+
 
+@app.post("/recognize")
+async def recognize(response: Response, audio: UploadFile = File(...),
+                    x_debug_timing: Optional[str] = Header(None)):
+    """Handle uploaded clip and return recognition + Spotify metadata.
+
+    Send "X-Debug-Timing: 1" (or run with SONAR_DEBUG_TIMING=1) to get the
+    per-stage timings back in a Server-Timing header.
+    """
+    data = await audio.read()
+    return await respond("recognize", recognize_bytes, data, response, x_debug_timing, audio.filename)
+
+
+@app.post("/recognize/fingerprint")
+async def recognize_fingerprint_upload(request: Request, response: Response,
+                                       x_debug_timing: Optional[str] = Header(None)):
+    """Match a precomputed fingerprint (application/octet-stream body, src/wire.py format).
+
+    Skips decoding, resampling and the whole DSP pipeline; the reply has the
+    /recognize shape. Malformed fingerprints, or ones computed with other DSP
+    parameters than the server's, get a 400 "bad_fingerprint".
+    """
+    data = await request.body()
+    if len(data) > MAX_FINGERPRINT_BYTES:
+        REQUESTS.inc("fingerprint", "bad_fingerprint")
+        return JSONResponse({"success": False, "message": "bad_fingerprint", "detail": "too large"}, status_code=413)
+    return await respond("fingerprint", fingerprint_bytes, data, response, x_debug_timing, f"({len(data)} bytes)")
+
+
+@app.get("/stats")
+def stats():
+    """Worker pool queue depth, admission counters, queue wait times, metadata and result cache hits.
+
+    Counters are per server process: with uvicorn --workers N each worker reports its own.
+    """
+    return {**pool.stats(), "meta_cache": meta_cache.stats() if meta_cache else None,
+            "result_cache": result_cache.stats() if result_cache else None}
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: stage latency / work histograms, request counters, pool and cache state.
+
+    Like /stats, this describes one server process; scrape every uvicorn worker.
+    """
+    s = pool.stats()
+    extra = gauge_lines("sonar_pool_pending", "Requests queued or running in the worker pool.", s["pending"])
+    for key in ("admitted", "completed", "failed", "shed", "expired"):
+        extra += gauge_lines(f"sonar_pool_{key}_total", f"Worker pool requests {key}.", s[key], kind="counter")
+    if meta_cache is not None:
+        for key, v in meta_cache.stats().items():
+            kind = "counter" if key.endswith(("hits", "joins", "fetches", "errors")) else "gauge"
+            name = f"sonar_meta_cache_{key}" + ("_total" if kind == "counter" else "")
+            extra += gauge_lines(name, f"Metadata cache {key.replace('_', ' ')}.", v, kind=kind)
+    if result_cache is not None:
+        for key, v in result_cache.stats().items():
+            kind = "gauge" if key in ("entries", "hit_rate", "saved_ms") else "counter"   # net saving can drop
+            name = f"sonar_result_cache_{key}" + ("_total" if kind == "counter" else "")
+            extra += gauge_lines(name, f"Result cache {key.replace('_', ' ')}.", v, kind=kind)
+    return PlainTextResponse(render_metrics(extra), media_type="text/plain; version=0.0.4")
+
+
+def match_response(match, align, conf):
     if not match:
         return {"success": False, "message": "no_match"}
 
@@ -243,3 +390,135 @@ async def recognize(audio: UploadFile = File(...)):
         "align": align,
         "confidence": conf,
     }
+
+
+def recognize_chunk(blobs):
+    """One batch of upload bytes -> [(match, align, confidence, error)], in order; a worker-pool task."""
+    return [row[1:] for row in recognize_batch(blobs, loader=decode_bytes, batch_size=len(blobs))]
+
+
+async def pooled_chunk(blobs):
+    """recognize_chunk through the worker pool; shed or expired chunks come back as error rows."""
+    try:
+        return await pool.run(recognize_chunk, blobs)
+    except Overloaded:
+        return [(None, 0, 0.0, "overloaded")] * len(blobs)
+    except DeadlineExceeded:
+        return [(None, 0, 0.0, "timeout")] * len(blobs)
+
+
+@app.post("/recognize/batch")
+async def recognize_many(files: List[UploadFile] = File(...)):
+    """Recognize many clips at once; streams one NDJSON line per clip, then a summary line.
+
+    Every BATCH_SIZE clips go through the worker pool as one task (one STFT, one
+    index lookup). If the pool sheds the first one the reply is a plain 503;
+    later chunks that are shed or expire get "overloaded" / "timeout" rows.
+    """
+    blobs = [await upload.read() for upload in files]
+    chunks = [blobs[a:a + BATCH_SIZE] for a in range(0, len(blobs), BATCH_SIZE)]
+    t0 = time.time()
+    first = await pooled_chunk(chunks[0]) if chunks else []
+    if chunks and first[0][3] == "overloaded":
+        REQUESTS.inc("batch", "overloaded", n=len(blobs))
+        return JSONResponse({"success": False, "message": "overloaded"}, status_code=503,
+                            headers={"Retry-After": "1"})
+
+    async def stream():
+        i = 0
+        for c, chunk in enumerate(chunks):
+            rows = first if c == 0 else await pooled_chunk(chunk)
+            for match, align, conf, err in rows:
+                REQUESTS.inc("batch", err or ("match" if match else "no_match"))
+                row = {"success": False, "message": err} if err else match_response(await enrich(match), align, conf)
+                yield json.dumps({"index": i, "filename": files[i].filename, **row}) + "\n"
+                i += 1
+        elapsed = time.time() - t0
+        yield json.dumps({"done": True, "clips": len(blobs), "seconds": round(elapsed, 3),
+                          "clips_per_sec": round(len(blobs) / max(elapsed, 1e-9), 2)}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.websocket("/recognize/stream")
+async def recognize_stream(ws: WebSocket):
+    """Live recognition while the clip is still being recorded.
+
+    Protocol: the client sends {"sample_rate": 44100, "format": "f32le" | "s16le"}
+    as text, then mono PCM chunks as binary frames, and {"type": "end"} when it
+    stops recording. After every chunk the server answers with a progress
+    message; it sends the final result (same shape as /recognize) and closes
+    as soon as the match is decisive, or at "end" / STREAM_MAX_SECONDS.
+    """
+    await ws.accept()
+    try:
+        await stream_session(ws)
+    except WebSocketDisconnect:
+        return
+    except (Overloaded, DeadlineExceeded) as e:
+        message = "overloaded" if isinstance(e, Overloaded) else "timeout"
+        REQUESTS.inc("stream", message)
+        await ws.send_json({"type": "error", "message": message})
+        await ws.close(code=1013)       # try again later
+
+
+STREAM_STOP = ("end", "stop")
+
+
+def stream_control(text):
+    """Text frame -> its "type" ("end", "stop", ...), or None if it is not a JSON object."""
+    try:
+        msg = json.loads(text)
+    except ValueError:
+        return None
+    return msg.get("type") if isinstance(msg, dict) else None
+
+
+async def stream_session(ws):
+    """recognize_stream's loop; every push / flush / final vote is a pool.run_local task."""
+    try:
+        cfg = json.loads(await ws.receive_text())
+        dtype = np.dtype(np.int16 if cfg.get("format") == "s16le" else np.float32)
+        sr = int(cfg.get("sample_rate", SR))
+        if sr <= 0:
+            raise ValueError(sr)
+    except (ValueError, TypeError, AttributeError, KeyError):
+        REQUESTS.inc("stream", "bad_config")
+        await ws.send_json({"type": "error", "message": "bad_config"})
+        await ws.close(code=1003)       # unsupported data
+        return
+    session = StreamSession(get_index(), sr)
+
+    while True:
+        msg = await ws.receive()
+        if msg["type"] == "websocket.disconnect":
+            return
+        data = msg.get("bytes")
+        if data is not None:
+            # a frame must hold whole samples; reject it and keep the session
+            if not data or len(data) % dtype.itemsize:
+                await ws.send_json({"type": "error", "message": "bad_frame"})
+                continue
+            chunk = np.frombuffer(data, dtype=dtype).astype(np.float32)
+            if dtype == np.int16:
+                chunk /= 32768.0
+            await pool.run_local(session.push, chunk)
+            finished = session.decisive() or session.fp.seconds >= STREAM_MAX_SECONDS
+        elif stream_control(msg.get("text") or "") in STREAM_STOP:
+            await pool.run_local(session.flush)
+            finished = True
+        else:
+            await ws.send_json({"type": "error", "message": "bad_control"})
+            continue
+
+        if finished:
+            match, align, conf = await pool.run_local(finish_match, session.sids, session.offs)
+            REQUESTS.inc("stream", "match" if match else "no_match")
+            await ws.send_json({"type": "result", "seconds": round(session.fp.seconds, 2),
+                                **match_response(await enrich(match), align, conf)})
+            await ws.close()
+            return
+
+        _, best, runner = session.leader()
+        await ws.send_json({"type": "progress", "seconds": round(session.fp.seconds, 2),
+                            "align": best, "runner_up": runner})
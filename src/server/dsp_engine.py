@@ -1,52 +1,63 @@
 import sys, os
 sys.path.append(os.path.abspath("."))
 
-import json, hashlib
-from collections import defaultdict, Counter
-import torch, torchaudio
-from src.recognize_constellation import (
-    HOP, SR, MIN_MATCHES,
-    spectrogram_db_from_tensor, peak_coords, hashes_from_peaks
+import json, threading
+from src.dsp import (
+    MIN_MATCHES,
+    load_audio, spectrogram_db_from_tensor, peak_coords, hashes_from_peaks,
+    gather_postings, best_alignment, json_hash_keys,
 )
+from src.flat_index import load_flat_index
+from src.segments import load_segmented_index
 
 
 INDEX_DIR = "constellation_index"
-
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+FLAT_INDEX_DIR = "src/server/flat_index"
+SEGMENTS_DIR = "src/server/segments"
 
 def load_index():
+    if os.path.exists(os.path.join(SEGMENTS_DIR, "manifest.json")):
+        return load_segmented_index(SEGMENTS_DIR)
+    if os.path.exists(os.path.join(FLAT_INDEX_DIR, "header.json")):
+        return load_flat_index(FLAT_INDEX_DIR)
     with open(os.path.join(INDEX_DIR, "inverted_index.json")) as f:
         inv = json.load(f)
+    inv = json_hash_keys(inv)
     with open(os.path.join(INDEX_DIR, "songs_meta.json")) as f:
         meta = json.load(f)
     return inv, {m["id"]: m for m in meta}
 
-print("🔧 Loading fingerprint DB in memory...")
-inv, meta_by_id = load_index()
-print(f"✅ Loaded {len(meta_by_id)} songs")
+# loaded on the first recognize_file() call, not at import
+inv, meta_by_id = None, {}
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global inv, meta_by_id
+    if inv is None:
+        with _index_lock:
+            if inv is None:
+                print("🔧 Loading fingerprint DB in memory...")
+                loaded, meta_by_id = load_index()
+                inv = loaded
+                print(f"✅ Loaded {len(meta_by_id)} songs")
+    if hasattr(inv, "refresh"):
+        inv.refresh()
+    return inv
 
 
 def recognize_file(path):
-    wav, sr = torchaudio.load(path)
-    S_db = spectrogram_db_from_tensor(wav, sr)
+    inv = get_index()
+    wav, sr = load_audio(path)
+    S_db = spectrogram_db_from_tensor(wav, sr, keep_on_device=True)
     peaks = peak_coords(S_db)
     qhashes = hashes_from_peaks(peaks)
 
-    votes = defaultdict(list)
-    for h, qt in qhashes:
-        for sid, dbt in inv.get(h, []):
-            votes[sid].append(round(dbt - qt, 2))
-
-    if not votes:
+    sids, offs = gather_postings(inv, qhashes)
+    best_sid, best_align, best_total = best_alignment(sids, offs)
+    if best_sid is None:
         return None, 0, 0
 
-    best_sid, best_align, best_total = None, 0, 0
-    for sid, deltas in votes.items():
-        total = len(deltas)
-        align = Counter(deltas).most_common(1)[0][1]
-        if align > best_align or (align == best_align and total > best_total):
-            best_sid, best_align, best_total = sid, align, total
-
     if best_align < MIN_MATCHES:
         return None, best_align, 0
 
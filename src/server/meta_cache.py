@@ -0,0 +1,235 @@
+# src/server/meta_cache.py
+"""
+Spotify metadata cache, keyed by song ID.
+
+    memory LRU (TTL)  ->  SQLite on disk (survives restarts)  ->  Spotify (pooled async client)
+
+Concurrent lookups of the same song share one SQLite read and one HTTP
+request; "not found" is cached too (with a shorter TTL). SQLite calls run on
+a worker thread, never on the event loop. Cached entries are read-only mappings, so
+callers cannot mutate what other requests see.
+
+Pre-warm the cache for the whole catalog:
+
+    python src/server/meta_cache.py prewarm constellation_index/songs_meta.json
+"""
+import os, json, time, base64, sqlite3, asyncio, threading, argparse
+from collections import OrderedDict
+from types import MappingProxyType
+
+import httpx
+from dotenv import load_dotenv
+load_dotenv()
+
+SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
+SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
+# overridable so tests / load runs can point at a local stub server
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com/api/token")
+
+META_DB = os.getenv("SONAR_META_DB", "src/server/meta_cache.sqlite")
+MEM_ENTRIES = 2048          # in-memory LRU size
+TTL = 7 * 24 * 3600         # seconds a found entry stays fresh
+NEG_TTL = 3600              # seconds a "not found" entry stays fresh
+HTTP_TIMEOUT = 5.0
+MAX_CONNECTIONS = 20
+
+
+def clean_title(title):
+    return title.replace(".wav", "").replace(".mp3", "").strip()
+
+
+def _freeze(meta):
+    return None if meta is None else MappingProxyType(dict(meta))
+
+
+class MetadataCache:
+    def __init__(self, db_path=META_DB, mem_entries=MEM_ENTRIES, ttl=TTL, neg_ttl=NEG_TTL, transport=None):
+        self.ttl, self.neg_ttl, self.mem_entries = ttl, neg_ttl, mem_entries
+        self.mem = OrderedDict()            # song_id -> (expires_at, frozen meta or None)
+        self.inflight = {}                  # song_id -> asyncio.Future
+        self.counts = {"mem_hits": 0, "db_hits": 0, "inflight_joins": 0, "fetches": 0, "fetch_errors": 0}
+        self.client = None
+        self.transport = transport          # httpx transport override (tests: httpx.MockTransport)
+        self._token, self._token_expiry = None, 0.0
+        self._token_lock = None
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta ("
+                        "song_id INTEGER PRIMARY KEY, payload TEXT, expires_at REAL)")
+        self.db.commit()
+
+    # ---- storage tiers ----
+    def _mem_get(self, sid):
+        hit = self.mem.get(sid)
+        if hit is None or hit[0] < time.time():
+            return False, None
+        self.mem.move_to_end(sid)
+        return True, hit[1]
+
+    def _mem_put(self, sid, frozen, expires_at):
+        self.mem[sid] = (expires_at, frozen)
+        self.mem.move_to_end(sid)
+        while len(self.mem) > self.mem_entries:
+            self.mem.popitem(last=False)
+
+    def _db_get(self, sid):
+        with self.db_lock:
+            row = self.db.execute("SELECT payload, expires_at FROM meta WHERE song_id = ?", (sid,)).fetchone()
+        if row is None or row[1] < time.time():
+            return False, None, 0.0
+        return True, _freeze(json.loads(row[0])), row[1]
+
+    def _db_put(self, sid, meta, expires_at):
+        with self.db_lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, ?)", (sid, json.dumps(meta), expires_at))
+            self.db.commit()
+
+    # ---- lookup ----
+    async def get(self, song):
+        """song: {"id", "artist", "title"} -> read-only metadata mapping, or None."""
+        sid = int(song["id"])
+        found, meta = self._mem_get(sid)
+        if found:
+            self.counts["mem_hits"] += 1
+            return meta
+
+        if sid in self.inflight:                    # someone is already reading / fetching it
+            self.counts["inflight_joins"] += 1
+            return await asyncio.shield(self.inflight[sid])
+        fut = asyncio.get_running_loop().create_future()
+        self.inflight[sid] = fut
+        try:
+            found, meta, expires_at = await asyncio.to_thread(self._db_get, sid)
+            if found:
+                self.counts["db_hits"] += 1
+                self._mem_put(sid, meta, expires_at)
+                fut.set_result(meta)
+                return meta
+
+            meta = await self._fetch(song["artist"], clean_title(song["title"]))
+            expires_at = time.time() + (self.ttl if meta is not None else self.neg_ttl)
+            frozen = _freeze(meta)
+            self._mem_put(sid, frozen, expires_at)
+            fut.set_result(frozen)
+            try:
+                await asyncio.to_thread(self._db_put, sid, meta, expires_at)
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not persist metadata for song {sid}: {e}")
+            return frozen
+        except Exception as e:
+            # transient failure: don't cache, don't fail the recognition
+            self.counts["fetch_errors"] += 1
+            print(f"⚠️ Spotify metadata fetch failed: {e}")
+            if not fut.done():
+                fut.set_result(None)
+            return None
+        finally:
+            if not fut.done():          # cancelled: release anyone waiting on us
+                fut.set_result(None)
+            del self.inflight[sid]
+
+    async def prewarm(self, songs, concurrency=8):
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(song):
+            async with sem:
+                return await self.get(song)
+
+        results = await asyncio.gather(*(one(s) for s in songs))
+        return sum(r is not None for r in results)
+
+    def stats(self):
+        return {**self.counts, "mem_entries": len(self.mem), "inflight": len(self.inflight)}
+
+    # ---- Spotify ----
+    def _http(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=HTTP_TIMEOUT, transport=self.transport,
+                limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            )
+        return self.client
+
+    async def _spotify_token(self):
+        """Get and cache a Spotify app-only token until shortly before it expires."""
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._token and time.time() < self._token_expiry:
+                return self._token
+            auth = base64.b64encode(f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()).decode()
+            res = await self._http().post(SPOTIFY_ACCOUNTS_URL, headers={"Authorization": f"Basic {auth}"},
+                                          data={"grant_type": "client_credentials"})
+            res.raise_for_status()
+            token_data = res.json()
+            self._token = token_data["access_token"]
+            self._token_expiry = time.time() + token_data.get("expires_in", 3600) - 60
+            print("🔑 New Spotify token fetched.")
+            return self._token
+
+    async def _fetch(self, artist, title):
+        """Fetch album, cover, preview and popularity for the best-matching track."""
+        self.counts["fetches"] += 1
+        token = await self._spotify_token()
+        res = await self._http().get(
+            f"{SPOTIFY_API_URL}/search",
+            params={"q": f"track:{title} artist:{artist}", "type": "track", "limit": 5},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        res.raise_for_status()
+        tracks = res.json().get("tracks", {}).get("items", [])
+        if not tracks:
+            print(f"⚠️ No Spotify match found for: {artist} - {title}")
+            return None
+
+        # Try best match: exact title and artist match
+        best_track = tracks[0]
+        for t in tracks:
+            title_match = title.lower() in t["name"].lower()
+            artist_match = any(artist.lower() in a["name"].lower() for a in t["artists"])
+            if title_match and artist_match:
+                best_track = t
+                break
+
+        album = best_track["album"]
+        return {
+            "album": album.get("name"),
+            "cover": album["images"][0]["url"] if album.get("images") else None,
+            "release": album.get("release_date", "")[:10],
+            "preview": best_track.get("preview_url"),
+            "spotify_url": best_track["external_urls"]["spotify"],
+            "popularity": best_track.get("popularity", 0),
+        }
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        with self.db_lock:
+            self.db.close()
+
+
+async def _prewarm_main(meta_path, concurrency):
+    with open(meta_path, "r", encoding="utf-8") as f:
+        songs = json.load(f)
+    cache = MetadataCache()
+    t0 = time.time()
+    try:
+        found = await cache.prewarm(songs, concurrency)
+    finally:
+        await cache.close()
+    print(f"✅ Pre-warmed {len(songs)} songs ({found} with metadata) in {time.time() - t0:.1f}s → {META_DB}")
+    print(f"   {cache.stats()}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Spotify metadata cache")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("prewarm", help="fetch metadata for every song in a songs_meta.json")
+    p.add_argument("meta", nargs="?", default="constellation_index/songs_meta.json")
+    p.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+    asyncio.run(_prewarm_main(args.meta, args.concurrency))
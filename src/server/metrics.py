@@ -0,0 +1,148 @@
+# src/server/metrics.py
+"""
+Per-stage latency + work-count metrics in Prometheus text format (no client library).
+
+A Trace is filled in while one request is processed, possibly in a worker
+process, and returned with the result. The endpoint then records it with
+observe_trace() in the server process. Stage timing costs one perf_counter()
+per stage and observing is a handful of bisects under a lock, so this stays
+on under full load.
+
+    decode / ffmpeg / load   audio bytes or file -> samples (fingerprint uploads: wire bytes -> hashes)
+    stft, peaks, hashing     fingerprinting
+    lookup, voting           index postings -> best (song, offset)
+    result_cache             repeated-upload hit (result_cache.py); replaces every stage above
+    metadata                 Spotify enrichment (cache or HTTP)
+"""
+import time, threading
+from bisect import bisect_left
+
+STAGE_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNT_BUCKETS = (10, 30, 100, 300, 1000, 3000, 10000, 30000, 100000, 300000, 1000000)
+REQUEST_BUCKETS_S = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Trace:
+    """Stage timings (ms) and work counts for one request; picklable, so it can come back from a worker."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        self._t = time.perf_counter()
+
+    def lap(self, stage):
+        """Charge the time since the previous lap (or creation) to stage."""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._t) * 1000
+        self._t = now
+
+    def restart(self):
+        """Start the next lap now (skips time spent outside the pipeline, e.g. waiting in a queue)."""
+        self._t = time.perf_counter()
+
+    def add(self, stage, ms):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def count(self, kind, n):
+        self.counts[kind] = self.counts.get(kind, 0) + int(n)
+
+    def __getstate__(self):
+        return {"stages": self.stages, "counts": self.counts}
+
+    def __setstate__(self, state):
+        self.stages, self.counts = state["stages"], state["counts"]
+        self._t = time.perf_counter()
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'stft;dur=3.71, peaks;dur=7.52, n_peaks;desc="412"'."""
+        parts = [f"{k};dur={v:.2f}" for k, v in self.stages.items()]
+        parts += [f'n_{k};desc="{v}"' for k, v in self.counts.items()]
+        return ", ".join(parts)
+
+
+# ---- metric types ----
+def _fmt_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, n=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, v in sorted(self.values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}            # labels -> [per-bucket counts (+Inf last), sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in sorted(self.series.items()):
+                cum = 0
+                for le, c in zip(list(self.buckets) + ["+Inf"], counts):
+                    cum += c
+                    lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, [('le', le)])} {cum}")
+                lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labels)} {total:.6g}")
+                lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labels)} {cum}")
+        return lines
+
+
+def gauge_lines(name, help, value, kind="gauge"):
+    """Exposition lines for a value read at scrape time (pool depth, cache hits, ...)."""
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+# ---- the server's metrics ----
+STAGE_MS = Histogram("sonar_stage_milliseconds", "Time spent per recognition stage.",
+                     STAGE_BUCKETS_MS, ["stage"])
+ITEMS = Histogram("sonar_query_items", "Work per query: peaks, hashes, postings touched, candidate songs.",
+                  COUNT_BUCKETS, ["kind"])
+REQUEST_SECONDS = Histogram("sonar_request_seconds", "End-to-end request latency, queueing included.",
+                            REQUEST_BUCKETS_S, ["endpoint"])
+REQUESTS = Counter("sonar_requests_total", "Requests by endpoint and outcome.", ["endpoint", "outcome"])
+
+REGISTRY = [STAGE_MS, ITEMS, REQUEST_SECONDS, REQUESTS]
+
+
+def observe_trace(trace):
+    for stage, ms in trace.stages.items():
+        STAGE_MS.observe(ms, stage)
+    for kind, n in trace.counts.items():
+        ITEMS.observe(n, kind)
+
+
+def render(extra=()):
+    """Whole exposition text; extra: more lines (e.g. from gauge_lines) appended at the end."""
+    lines = []
+    for m in REGISTRY:
+        lines += m.render()
+    lines += list(extra)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,124 @@
+# src/server/workers.py
+"""
+Recognition worker pool with bounded admission.
+
+CPU work (decode, STFT, peak picking, hashing, voting, Spotify lookup) runs in a
+thread or process pool instead of on the asyncio event loop. At most
+max_pending requests are admitted (queued + running); beyond that run() fails
+fast with Overloaded so the endpoint can answer 503 straight away. Each request
+also has a deadline: work still queued when its deadline passes is skipped, and
+a caller that waits past it gets DeadlineExceeded. A slot is released when
+the work itself ends, not when its caller gives up, so timed-out work that is
+still running keeps counting against max_pending.
+
+run_local() applies the same admission and deadline to work that must stay in
+this process (stateful streaming sessions): it always uses threads.
+"""
+import os, time, asyncio, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing as mp
+
+import numpy as np
+
+EXECUTOR = os.getenv("SONAR_EXECUTOR", "thread")                    # "thread" | "process"
+WORKERS = int(os.getenv("SONAR_WORKERS", os.cpu_count() or 4))
+MAX_PENDING = int(os.getenv("SONAR_MAX_PENDING", WORKERS * 4))      # queued + running
+DEADLINE = float(os.getenv("SONAR_DEADLINE", 10.0))                 # seconds per request
+
+
+class Overloaded(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _call_before(deadline, fn, args):
+    # runs in the worker; wall clock so the check also works across processes
+    started = time.time()
+    if started > deadline:
+        raise DeadlineExceeded("expired while queued")
+    return started, fn(*args)
+
+
+class RecognitionPool:
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, deadline=DEADLINE, kind=EXECUTOR):
+        self.workers, self.max_pending, self.deadline, self.kind = workers, max_pending, deadline, kind
+        if kind == "process":
+            # spawn: each worker imports the server module and maps the index itself
+            self.executor = ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"))
+            self.local_executor = ThreadPoolExecutor(workers, thread_name_prefix="recognize-local")
+        else:
+            self.executor = ThreadPoolExecutor(workers, thread_name_prefix="recognize")
+            self.local_executor = self.executor
+        self.pending = 0
+        self.counts = {"admitted": 0, "completed": 0, "failed": 0, "shed": 0, "expired": 0}
+        self.waits = deque(maxlen=2048)     # recent queue wait times (s)
+        self.lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool, with admission control and the pool deadline."""
+        return await self._run(self.executor, fn, args)
+
+    async def run_local(self, fn, *args):
+        """run() on a thread of this process, for fn that reads or mutates in-process state."""
+        return await self._run(self.local_executor, fn, args)
+
+    async def _run(self, executor, fn, args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.counts["shed"] += 1
+                raise Overloaded(f"{self.pending} requests pending")
+            self.pending += 1
+            self.counts["admitted"] += 1
+
+        enqueued = time.time()
+        try:
+            fut = executor.submit(_call_before, enqueued + self.deadline, fn, args)
+        except BaseException:
+            self._release(None)
+            raise
+        # the slot is freed when the work ends (or is cancelled before it started)
+        fut.add_done_callback(self._release)
+        try:
+            started, result = await asyncio.wait_for(asyncio.wrap_future(fut), timeout=self.deadline)
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            fut.cancel()                    # no-op if already running
+            self._count("expired")
+            raise DeadlineExceeded(f"no result within {self.deadline:.1f}s")
+        except Exception:
+            self._count("failed")
+            raise
+
+        self.waits.append(started - enqueued)
+        self._count("completed")
+        return result
+
+    def _release(self, _fut):
+        with self.lock:
+            self.pending -= 1
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        waits = np.array(self.waits) * 1000 if self.waits else np.zeros(1)
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "deadline_s": self.deadline,
+            "pending": self.pending,
+            **self.counts,
+            "wait_ms_p50": round(float(np.percentile(waits, 50)), 2),
+            "wait_ms_p95": round(float(np.percentile(waits, 95)), 2),
+            "wait_ms_max": round(float(waits.max()), 2),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.local_executor is not self.executor:
+            self.local_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,342 @@
+# src/shards.py
+"""
+Hash-range sharded index with scatter-gather matching.
+
+One flat index is split into N contiguous hash-key ranges, balanced by posting
+count. Each range is served by its own process over a small RPC interface
+(multiprocessing.connection, authenticated). The coordinator (ShardedIndex)
+sends each shard only the query hashes in its range. Each shard answers with
+a partial (song, offset) histogram, and the coordinator merges them. Every
+posting lives in exactly one shard, so the merged histogram equals the
+single-index one.
+
+    python src/shards.py split --src src/server/flat_index --out src/server/shards --n 4
+    python src/shards.py serve-all src/server/shards          # all shards on this box
+    python src/shards.py serve src/server/shards 2            # or one shard per process / host
+
+api.py uses the shard set when src/server/shards/shards.json exists.
+
+Messages are pickled, so whoever knows the authkey can run code on a shard.
+The key comes from SONAR_SHARD_KEY and is never written to disk, unless
+`split --store-key` asks for a random one in shards.json (mode 0600, loopback
+shards only). Without SONAR_SHARD_KEY, shards only listen on loopback.
+"""
+import os, sys, json, time, signal, socket, secrets, argparse, ipaddress, threading, subprocess
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Listener, Client
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import check_key_type
+from src.flat_index import FlatIndex, _hex_key, budget_mask, write_flat_arrays
+
+SHARDS_DIR = "src/server/shards"
+SHARD_HOST = "127.0.0.1"
+SHARD_BASE_PORT = 7101                                          # shard i listens on base + i
+SHARD_KEY = os.getenv("SONAR_SHARD_KEY")                        # shared secret (split --store-key: per-set key in shards.json)
+SHARD_TIMEOUT = 5.0                                             # seconds per shard call
+KEY_MAX = 2 ** 64 - 1
+
+
+class ShardUnavailable(ConnectionError):
+    pass
+
+
+def is_loopback(host):
+    """True if every address host resolves to is a loopback address."""
+    try:
+        addrs = {info[4][0] for info in socket.getaddrinfo(host, None)}
+        return bool(addrs) and all(ipaddress.ip_address(a.split("%")[0]).is_loopback for a in addrs)
+    except (OSError, ValueError):
+        return False
+
+
+def shard_authkey(manifest):
+    """-> (authkey bytes, set explicitly via SONAR_SHARD_KEY?); RuntimeError if there is none."""
+    if SHARD_KEY:
+        return SHARD_KEY.encode(), True
+    if manifest.get("authkey"):
+        return manifest["authkey"].encode(), False
+    raise RuntimeError("no shard authkey: set SONAR_SHARD_KEY (or re-run `shards.py split --store-key`)")
+
+
+# =====================================================
+# SPLIT
+# =====================================================
+def split_index(src_dir, out_root, n, host=SHARD_HOST, base_port=SHARD_BASE_PORT, store_key=False):
+    """Split a flat index into n key ranges with roughly equal posting counts.
+
+    store_key writes a random authkey into shards.json for a local shard set
+    run without SONAR_SHARD_KEY; by default no key is persisted.
+    """
+    if not SHARD_KEY and not is_loopback(host):
+        raise RuntimeError(f"refusing non-loopback shard host {host!r} without SONAR_SHARD_KEY")
+    if not SHARD_KEY and not store_key:
+        raise RuntimeError("set SONAR_SHARD_KEY for the shards and the API (or pass --store-key "
+                           "to keep a random key in shards.json)")
+    src = FlatIndex(src_dir, mmap=True)
+    keys, offsets = np.asarray(src.keys), np.asarray(src.offsets)
+    total = int(offsets[-1])
+    # first bucket of each shard: where the running posting count crosses i/n of the total
+    cuts = [0] + [int(np.searchsorted(offsets, total * i / n, side="left")) for i in range(1, n)] + [len(keys)]
+    cuts = np.maximum.accumulate(np.minimum(cuts, len(keys)))
+
+    os.makedirs(out_root, exist_ok=True)
+    shards, bounds = [], [0]
+    for i in range(n):
+        a, b = int(cuts[i]), int(cuts[i + 1])
+        name = f"shard_{i:02d}"
+        write_flat_arrays(os.path.join(out_root, name), keys[a:b], offsets[a:b + 1] - offsets[a],
+                          src.bucket_postings(a, b), [], key_type=src.header["key_type"])
+        if i:
+            bounds.append(int(keys[a]) if a < len(keys) else KEY_MAX)
+        shards.append({"dir": name, "address": f"{host}:{base_port + i}",
+                       "buckets": b - a, "postings": int(offsets[b] - offsets[a])})
+        print(f"  {name}: {b - a:,} buckets, {int(offsets[b] - offsets[a]):,} postings")
+    bounds.append(KEY_MAX)
+
+    with open(os.path.join(src_dir, "songs_meta.json"), "r", encoding="utf-8") as f:
+        meta = f.read()
+    with open(os.path.join(out_root, "songs_meta.json"), "w", encoding="utf-8") as f:
+        f.write(meta)
+    manifest = {"key_type": src.header["key_type"], "bounds": bounds, "shards": shards}
+    if store_key and not SHARD_KEY:
+        manifest["authkey"] = secrets.token_hex(32)
+    # manifest last: its presence marks the shard set as complete; 0600 since it may hold the key
+    path = os.path.join(out_root, "shards.json")
+    if os.path.exists(path):
+        os.remove(path)
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return shards
+
+
+def load_manifest(root):
+    with open(os.path.join(root, "shards.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _address(s):
+    host, port = s.rsplit(":", 1)
+    return host, int(port)
+
+
+# =====================================================
+# SHARD SERVER
+# =====================================================
+def _handle(conn, inv, name):
+    from src.dsp import gather_postings, lookup_postings, offset_histogram
+    try:
+        while True:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                return
+            try:
+                op = msg[0]
+                # the coordinator applies the postings budget across shards: budget=0 here
+                if op == "votes":            # -> partial (song, offset) histogram
+                    _, hashes, qt = msg
+                    sids, offs = gather_postings(inv, list(zip(hashes.tolist(), qt.tolist())), budget=0)
+                    conn.send(("ok", offset_histogram(sids, offs)))
+                elif op == "lookup":         # -> raw postings, for callers that need them
+                    conn.send(("ok", lookup_postings(inv, msg[1], budget=0)))
+                elif op == "sizes":          # -> postings per hash, for the coordinator's budget
+                    conn.send(("ok", inv.bucket_sizes(msg[1])))
+                elif op == "info":
+                    conn.send(("ok", {"shard": name, "buckets": len(inv), "postings": inv.n_postings}))
+                else:
+                    conn.send(("error", f"unknown op {op!r}"))
+            except Exception as e:
+                conn.send(("error", repr(e)))
+    finally:
+        conn.close()
+
+
+def serve_shard(root, i):
+    """Serve shard i of the shard set at root until killed (one thread per coordinator connection)."""
+    manifest = load_manifest(root)
+    spec = manifest["shards"][i]
+    authkey, explicit = shard_authkey(manifest)
+    host, port = _address(spec["address"])
+    if not explicit and not is_loopback(host):
+        raise RuntimeError(f"refusing to listen on non-loopback {host!r} without SONAR_SHARD_KEY")
+    inv = FlatIndex(os.path.join(root, spec["dir"]), mmap=True)
+    listener = Listener((host, port), authkey=authkey)
+    print(f"✅ {spec['dir']} serving {len(inv):,} buckets on {spec['address']}", flush=True)
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:         # bad authkey, client hung up during handshake, ...
+            print(f"⚠️ {spec['dir']}: rejected connection: {e}", flush=True)
+            continue
+        threading.Thread(target=_handle, args=(conn, inv, spec["dir"]), daemon=True).start()
+
+
+def serve_all(root):
+    """Start every shard of root as a local subprocess and wait for them."""
+    n = len(load_manifest(root)["shards"])
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", root, str(i)]) for i in range(n)]
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))      # so the children are stopped too
+    try:
+        for p in procs:
+            p.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+
+
+# =====================================================
+# COORDINATOR
+# =====================================================
+class ShardedIndex:
+    """Scatter-gather client over a running shard set (thread-safe)."""
+
+    def __init__(self, root, authkey=None, timeout=SHARD_TIMEOUT):
+        self.manifest = load_manifest(root)
+        check_key_type(self.manifest["key_type"], os.path.join(root, "shards.json"))
+        authkey = authkey or shard_authkey(self.manifest)[0]
+        self.hex_keys = self.manifest["key_type"] == "sha1"
+        self.bounds = np.array(self.manifest["bounds"][1:-1], dtype=np.uint64)
+        self.addresses = [_address(s["address"]) for s in self.manifest["shards"]]
+        self.authkey, self.timeout = authkey, timeout
+        self.local = threading.local()          # one connection per (thread, shard)
+        self.executor = ThreadPoolExecutor(len(self.addresses), thread_name_prefix="shard")
+        self.infos = [self._call(i, ("info",)) for i in range(len(self.addresses))]   # fail fast if one is down
+
+    def __len__(self):
+        return sum(info["buckets"] for info in self.infos)
+
+    def _call(self, i, msg):
+        conns = self.local.__dict__.setdefault("conns", {})
+        try:
+            conn = conns.get(i)
+            if conn is None:
+                conn = conns[i] = Client(self.addresses[i], authkey=self.authkey)
+            conn.send(msg)
+            if not conn.poll(self.timeout):
+                raise TimeoutError(f"no reply within {self.timeout:.1f}s")
+            status, payload = conn.recv()
+        except (OSError, EOFError, TimeoutError) as e:
+            bad = conns.pop(i, None)
+            if bad is not None:
+                bad.close()
+            raise ShardUnavailable(f"shard {i} at {self.addresses[i]}: {e}") from e
+        if status != "ok":
+            raise RuntimeError(f"shard {i}: {payload}")
+        return payload
+
+    def route(self, hashes):
+        """Shard index per hash."""
+        if self.hex_keys:
+            keys = np.array([_hex_key(h) for h in hashes], dtype=np.uint64)
+        else:
+            keys = np.asarray(hashes, dtype=np.uint64)
+        return np.searchsorted(self.bounds, keys, side="right")
+
+    def _scatter(self, hashes, make_msg):
+        """-> [(query positions, shard reply)] for every shard that owns some of hashes."""
+        owner = self.route(hashes)
+        parts = [(i, np.flatnonzero(owner == i)) for i in range(len(self.addresses))]
+        parts = [(i, pos) for i, pos in parts if len(pos)]
+        futs = [self.executor.submit(self._call, i, make_msg(pos)) for i, pos in parts]
+        return [(pos, f.result()) for (_, pos), f in zip(parts, futs)]
+
+    def bucket_sizes(self, hashes):
+        """Postings per hash, asked from the owning shards."""
+        hashes = list(hashes)
+        sizes = np.zeros(len(hashes), dtype=np.int64)
+        for pos, part in self._scatter(hashes, lambda pos: ("sizes", [hashes[j] for j in pos])):
+            sizes[pos] = part
+        return sizes
+
+    def votes(self, qhashes, budget=None):
+        """Query (hash, t_sec) pairs -> merged (sids, offs, counts) histogram.
+
+        budget (None: dsp.POSTINGS_BUDGET, 0: no cap) is applied over all
+        shards at once, rarest hashes first, at the cost of one extra round trip.
+        """
+        import src.dsp as dsp
+        budget = dsp.POSTINGS_BUDGET if budget is None else budget
+        if budget and qhashes:
+            sizes = self.bucket_sizes([h for h, _ in qhashes])
+            if sizes.sum() > budget:
+                keep = budget_mask(sizes, budget)
+                qhashes = [q for q, k in zip(qhashes, keep) if k]
+        if not qhashes:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        hashes = [h for h, _ in qhashes]
+        harr = np.array(hashes, dtype=object if self.hex_keys else np.uint32)
+        qt = np.fromiter((t for _, t in qhashes), dtype=np.float64, count=len(qhashes))
+        replies = self._scatter(hashes, lambda pos: ("votes", harr[pos], qt[pos]))
+        if not replies:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return tuple(np.concatenate(parts) for parts in zip(*(r for _, r in replies)))
+
+    def lookup(self, hashes, budget=0):
+        """Same contract as FlatIndex.lookup, gathered from the shards (ships raw postings)."""
+        hashes = list(hashes)
+        if budget and hashes:
+            sizes = self.bucket_sizes(hashes)
+            if sizes.sum() > budget:
+                sel = np.flatnonzero(budget_mask(sizes, budget))
+                post, qi = self.lookup([hashes[i] for i in sel])
+                return post, sel[qi]
+        replies = self._scatter(hashes, lambda pos: ("lookup", [hashes[j] for j in pos]))
+        posts = [p for _, (p, _) in replies]
+        qis = [pos[qi] for pos, (_, qi) in replies]
+        if not posts:
+            return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+        post, qi = np.concatenate(posts), np.concatenate(qis)
+        order = np.argsort(qi, kind="stable")       # keep FlatIndex's query-order grouping
+        return post[order], qi[order]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def load_sharded_index(root, **kw):
+    """Connect to a running shard set -> (ShardedIndex, meta_by_id)."""
+    inv = ShardedIndex(root, **kw)
+    with open(os.path.join(root, "songs_meta.json"), "r", encoding="utf-8") as f:
+        meta_by_id = {int(m["id"]): m for m in json.load(f)}
+    return inv, meta_by_id
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Hash-range sharded fingerprint index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("split", help="split a flat index into N key-range shards")
+    p.add_argument("--src", default="src/server/flat_index")
+    p.add_argument("--out", default=SHARDS_DIR)
+    p.add_argument("--n", type=int, default=4)
+    p.add_argument("--host", default=SHARD_HOST)
+    p.add_argument("--base-port", type=int, default=SHARD_BASE_PORT)
+    p.add_argument("--store-key", action="store_true",
+                   help="without SONAR_SHARD_KEY: keep a random authkey in shards.json (loopback only)")
+    p = sub.add_parser("serve", help="serve one shard")
+    p.add_argument("root")
+    p.add_argument("index", type=int)
+    p = sub.add_parser("serve-all", help="serve every shard as a local subprocess")
+    p.add_argument("root", nargs="?", default=SHARDS_DIR)
+    args = ap.parse_args()
+
+    if args.cmd == "split":
+        t0 = time.time()
+        try:
+            split_index(args.src, args.out, args.n, args.host, args.base_port, args.store_key)
+        except RuntimeError as e:
+            sys.exit(f"❌ {e}")
+        print(f"✅ Split into {args.n} shards → {args.out} in {time.time() - t0:.1f}s")
+    elif args.cmd == "serve":
+        try:
+            serve_shard(args.root, args.index)
+        except RuntimeError as e:
+            sys.exit(f"❌ {e}")
+    else:
+        serve_all(args.root)
@@ -0,0 +1,187 @@
+# src/streaming.py
+"""
+Incremental fingerprinting for audio that arrives in chunks.
+
+StreamingFingerprinter keeps a short rolling window of audio, recomputes the
+spectrogram only over that window and emits each peak and each hash exactly
+once, as soon as it can no longer change:
+
+  * a spectrogram frame is final once its whole N_FFT window has arrived;
+  * a peak is final once the PEAK_NEIGHBORHOOD frames around it are final;
+  * an anchor's hashes are final once its FAN_VALUE-1 partners are known or
+    MAX_TDELTA frames have passed without them.
+
+Input at another rate goes through StreamResampler, which carries filter
+context across chunk boundaries and yields the same samples as resampling the
+whole recording at once. Away from the very end of the stream this reproduces
+the offline resample -> spectrogram -> peak_coords -> hashes_from_peaks pipeline.
+"""
+from math import ceil
+import numpy as np
+
+from src.dsp import (
+    SR, N_FFT, HOP, PEAK_NEIGHBORHOOD, FAN_VALUE, MAX_TDELTA, MIN_MATCHES, HASH_MODE,
+    sinc_kernel, spectrogram_db_from_tensor, peak_coords, hash_arrays_from_peaks,
+    gather_postings, song_alignments,
+)
+
+STREAM_MARGIN = 2.0         # leader must have >= 2x the runner-up's aligned hashes
+STREAM_MAX_SECONDS = 15     # give a final answer after this much audio
+
+EDGE = N_FFT // (2 * HOP)             # frames touched by STFT centre padding
+HALF_NB = PEAK_NEIGHBORHOOD // 2      # maximum_filter reach before the centre frame
+
+
+class StreamResampler:
+    """Chunked polyphase resampling with the FIR of dsp.resample (numpy port).
+
+    Output block b (`new` samples) is one matmul over input samples
+    [b*orig - width, b*orig + width + orig), so a block is emitted as soon as
+    that window has arrived; the tail of the input is kept for the next chunk.
+    """
+
+    def __init__(self, sr, sr_out=SR):
+        self.kernel, self.width, self.orig, self.new = sinc_kernel(int(sr), int(sr_out))
+        self.buf = np.zeros(self.width, dtype=np.float32)   # the offline left zero padding
+        self.buf_start = -self.width        # input index of buf[0]
+        self.block = 0                      # next output block
+        self.n_in = 0                       # input samples seen
+
+    def push(self, x, final=False):
+        """Mono float32 input chunk -> the output samples it completes (all of them when final)."""
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        self.n_in += len(x)
+        parts = [self.buf, x] + ([np.zeros(self.width + self.orig, dtype=np.float32)] if final else [])
+        self.buf = np.concatenate(parts)
+        k = self.kernel.shape[1]
+        last = (self.buf_start + len(self.buf) + self.width - k) // self.orig + 1   # blocks with their whole window
+        if final:
+            last = min(last, -(-ceil(self.new * self.n_in / self.orig) // self.new))
+        if last <= self.block:
+            return np.empty(0, dtype=np.float32)
+        off = self.block * self.orig - self.width - self.buf_start
+        seg = self.buf[off:off + (last - self.block - 1) * self.orig + k]
+        y = (np.lib.stride_tricks.sliding_window_view(seg, k)[::self.orig] @ self.kernel.T).reshape(-1)
+        if final:
+            y = y[:ceil(self.new * self.n_in / self.orig) - self.block * self.new]
+        self.block = last
+        drop = self.block * self.orig - self.width - self.buf_start
+        self.buf, self.buf_start = self.buf[drop:], self.buf_start + drop
+        return y
+
+
+class StreamingFingerprinter:
+    """push() mono float PCM chunks, get back the newly final (hash, t_sec) pairs."""
+
+    def __init__(self, sr):
+        if HASH_MODE != "int":
+            raise ValueError("Streaming fingerprints require HASH_MODE = 'int'")
+        self.in_sr = sr
+        self.resampler = StreamResampler(sr) if sr != SR else None
+        self.buf = np.empty(0, dtype=np.float32)    # mono audio at SR
+        self.buf_start = 0                  # global sample index of buf[0] (multiple of HOP)
+        self.done_frame = 0                 # peaks with frame < done_frame are final
+        self.pending = np.empty((0, 2), dtype=np.int64)   # final peaks whose hashes are not yet emitted
+        self.samples = 0                    # total samples seen (at SR)
+
+    @property
+    def seconds(self):
+        return self.samples / SR
+
+    def push(self, chunk):
+        self._append(chunk, final=False)
+        return self._advance(final=False)
+
+    def flush(self):
+        """End of stream: everything left becomes final."""
+        if self.resampler is not None:
+            self._append(np.empty(0, dtype=np.float32), final=True)
+        return self._advance(final=True)
+
+    def _append(self, chunk, final):
+        wav = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        if self.resampler is not None:
+            wav = self.resampler.push(wav, final=final)
+        self.buf = np.concatenate([self.buf, wav])
+        self.samples += len(wav)
+
+    def _advance(self, final):
+        seg_start = self.buf_start
+        seg = self.buf
+        if seg.shape[-1] < N_FFT:
+            return self._emit(final)
+
+        S_db = spectrogram_db_from_tensor(seg[None, :], SR)
+        g0 = seg_start // HOP                                   # global frame of S_db[:, 0]
+        # frames computed exactly as offline: skip centre-padded ones except at the true edges
+        lo = 0 if seg_start == 0 else EDGE
+        hi = S_db.shape[1] if final else (seg.shape[-1] - N_FFT // 2) // HOP + 1
+        if hi - lo <= 0:
+            return self._emit(final)
+
+        peaks = peak_coords(S_db[:, lo:hi])
+        peaks[:, 1] += g0 + lo
+        # the maximum_filter window must lie inside [lo, hi) unless that side is a true edge
+        first_ok = max(self.done_frame, g0 + lo + (0 if seg_start == 0 else HALF_NB))
+        last_ok = g0 + hi if final else g0 + hi - (PEAK_NEIGHBORHOOD - HALF_NB - 1)
+        keep = (peaks[:, 1] >= first_ok) & (peaks[:, 1] < last_ok)
+        self.pending = np.concatenate([self.pending, peaks[keep]])
+        self.done_frame = max(self.done_frame, last_ok)
+
+        # keep only the audio needed to recompute frames around done_frame next time
+        new_start = max(0, (self.done_frame - HALF_NB - EDGE) * HOP)
+        if new_start > self.buf_start:
+            self.buf = self.buf[new_start - self.buf_start:]
+            self.buf_start = new_start
+        return self._emit(final)
+
+    def _emit(self, final):
+        P = self.pending
+        if final:
+            n = len(P)
+        else:
+            # anchors whose partners are all known, or who can no longer get a partner
+            n = max(len(P) - (FAN_VALUE - 1), int(np.searchsorted(P[:, 1], self.done_frame - MAX_TDELTA)))
+        if n <= 0:
+            return []
+        h, t1 = hash_arrays_from_peaks(P, n_anchors=n)
+        self.pending = P[n:]
+        return list(zip(h.tolist(), (t1 * (HOP / SR)).tolist()))
+
+
+class StreamSession:
+    """Streaming fingerprints + a running offset histogram over one index."""
+
+    def __init__(self, inv, sr):
+        self.inv = inv
+        self.fp = StreamingFingerprinter(sr)
+        self.sids = np.empty(0, dtype=np.int64)
+        self.offs = np.empty(0, dtype=np.int64)
+
+    def push(self, chunk):
+        self._vote(self.fp.push(chunk))
+        return self.leader()
+
+    def flush(self):
+        self._vote(self.fp.flush())
+        return self.leader()
+
+    def _vote(self, qhashes):
+        if not qhashes:
+            return
+        sids, offs = gather_postings(self.inv, qhashes)
+        self.sids = np.concatenate([self.sids, sids])
+        self.offs = np.concatenate([self.offs, offs])
+
+    def leader(self):
+        """-> (best_sid, best_align, runner_up_align)."""
+        songs, align, _ = song_alignments(self.sids, self.offs)
+        if len(songs) == 0:
+            return None, 0, 0
+        order = np.argsort(-align, kind="stable")
+        runner = int(align[order[1]]) if len(order) > 1 else 0
+        return int(songs[order[0]]), int(align[order[0]]), runner
+
+    def decisive(self):
+        _, best, runner = self.leader()
+        return best >= MIN_MATCHES and best >= STREAM_MARGIN * runner
@@ -1,10 +1,14 @@
 # src/utils/build_constellation_cache.py
-import os, json, pickle, numpy as np
+import os, sys, json, pickle, argparse, numpy as np
+sys.path.append(os.path.abspath("."))
+
+from src.dsp import json_hash_keys
+from src.flat_index import bucket_stats, print_bucket_stats, prune_buckets
 
 INDEX_DIR = "constellation_index"
 OUT_FILE = "src/server/constellation_cache.pkl"  # uncompressed pickle
 
-def build_cache():
+def build_cache(max_bucket=None, stop_mode="drop"):
     inv_path = os.path.join(INDEX_DIR, "inverted_index.json")
     meta_path = os.path.join(INDEX_DIR, "songs_meta.json")
 
@@ -21,9 +25,13 @@ def build_cache():
     print("Converting to compact numpy arrays...")
     # Convert inverted index values to small numpy arrays
     inv = {}
-    for h, entries in inv_json.items():
+    for key, entries in json_hash_keys(inv_json, inv_path).items():
         # entries are [[song_id, t_sec], [song_id, t_sec], ...]
-        inv[h] = np.array(entries, dtype=np.float32)
+        inv[key] = np.array(entries, dtype=np.float32)
+
+    print_bucket_stats(bucket_stats([len(v) for v in inv.values()]))
+    if max_bucket:
+        prune_buckets(inv, max_bucket, stop_mode)
 
     # meta_by_id as dict for O(1) lookup
     meta_by_id = {int(m["id"]): m for m in meta_list}
@@ -37,4 +45,8 @@ def build_cache():
     print("✅ Cache built successfully!")
 
 if __name__ == "__main__":
-    build_cache()
+    ap = argparse.ArgumentParser(description="Pack inverted_index.json into the server's pickle cache")
+    ap.add_argument("--max-bucket", type=int, help="drop/cap buckets with more postings than this")
+    ap.add_argument("--stop-mode", choices=["drop", "cap"], default="drop")
+    args = ap.parse_args()
+    build_cache(args.max_bucket, args.stop_mode)
@@ -0,0 +1,68 @@
+# src/utils/build_flat_index.py
+"""
+Convert an existing index into the memory-mappable flat (CSR) format.
+
+    python src/utils/build_flat_index.py                                  # from constellation_index/*.json
+    python src/utils/build_flat_index.py --src src/server/constellation_cache.pkl.gz
+    python src/utils/build_flat_index.py --max-bucket 2000                # drop stop hashes
+    python src/utils/build_flat_index.py --stats                          # bucket sizes of --out
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+import numpy as np
+
+from src.dsp import json_hash_keys
+from src.flat_index import (
+    write_flat_index, load_flat_index, load_pickle_cache, bucket_stats, print_bucket_stats, prune_buckets,
+)
+
+INDEX_DIR = "constellation_index"
+OUT_DIR = "src/server/flat_index"
+
+
+def load_json_index(index_dir):
+    with open(os.path.join(index_dir, "inverted_index.json"), "r", encoding="utf-8") as f:
+        inv = json.load(f)
+    inv = json_hash_keys(inv, os.path.join(index_dir, "inverted_index.json"))
+    with open(os.path.join(index_dir, "songs_meta.json"), "r", encoding="utf-8") as f:
+        meta_by_id = {int(m["id"]): m for m in json.load(f)}
+    return inv, meta_by_id
+
+
+def build_flat(src=INDEX_DIR, out_dir=OUT_DIR, max_bucket=None, stop_mode="drop"):
+    t0 = time.time()
+    if os.path.isdir(src):
+        print(f"Loading JSON index from {src} (this may take a moment)...")
+        inv, meta_by_id = load_json_index(src)
+    else:
+        print(f"Loading pickle cache {src} (this may take a moment)...")
+        inv, meta_by_id = load_pickle_cache(src)
+
+    print_bucket_stats(bucket_stats([len(v) for v in inv.values()]))
+    pruned = None
+    if max_bucket:
+        pruned = prune_buckets(inv, max_bucket, stop_mode)
+
+    print(f"Writing flat index → {out_dir}")
+    n_keys, n_post = write_flat_index(out_dir, inv, meta_by_id, header_extra=pruned and {"stop_hashes": pruned})
+    print(f"Packed {n_keys:,} hashes, {n_post:,} postings; {len(meta_by_id)} songs in {time.time() - t0:.1f}s")
+
+    t0 = time.time()
+    load_flat_index(out_dir)
+    print(f"✅ Flat index opens in {(time.time() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Convert inverted_index.json or a pickle cache to a flat index")
+    ap.add_argument("--src", default=INDEX_DIR, help="index dir with inverted_index.json, or a .pkl/.pkl.gz cache")
+    ap.add_argument("--out", default=OUT_DIR)
+    ap.add_argument("--max-bucket", type=int, help="drop/cap buckets with more postings than this")
+    ap.add_argument("--stop-mode", choices=["drop", "cap"], default="drop")
+    ap.add_argument("--stats", action="store_true", help="only print bucket-size statistics of the flat index at --out")
+    args = ap.parse_args()
+    if args.stats:
+        inv, _ = load_flat_index(args.out)
+        print_bucket_stats(bucket_stats(np.diff(np.asarray(inv.offsets))))
+    else:
+        build_flat(args.src, args.out, args.max_bucket, args.stop_mode)
@@ -0,0 +1,58 @@
+# src/utils/recognize_batch.py
+"""
+Identify many archived clips offline, one NDJSON line per clip.
+
+    python src/utils/recognize_batch.py clips/ more_clips/a.wav --batch-size 32 > results.ndjson
+
+Directories are scanned recursively for audio files. Throughput (clips/sec) is
+printed to stderr when the run finishes.
+"""
+import os, sys, json, time, asyncio, argparse
+sys.path.append(os.path.abspath("."))
+
+AUDIO_EXTS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".webm")
+
+
+def collect_paths(inputs):
+    paths = []
+    for p in inputs:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                paths += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(AUDIO_EXTS)]
+        else:
+            paths.append(p)
+    return paths
+
+
+async def run(args):
+    from src.server.api import recognize_batch, match_response   # loads the index
+    from src.server.meta_cache import MetadataCache
+
+    cache = MetadataCache() if args.spotify else None
+    paths = collect_paths(args.inputs)
+    t0 = time.time()
+    try:
+        for i, match, align, conf, err in recognize_batch(paths, batch_size=args.batch_size):
+            if match and cache:
+                meta = await cache.get(match)
+                match = {**match, **meta} if meta else match
+            row = {"success": False, "message": err} if err else match_response(match, align, conf)
+            print(json.dumps({"index": i, "path": paths[i], **row}, ensure_ascii=False), flush=True)
+    finally:
+        if cache:
+            await cache.close()
+    elapsed = time.time() - t0
+    print(f"✅ {len(paths)} clips in {elapsed:.1f}s ({len(paths) / max(elapsed, 1e-9):.2f} clips/sec)",
+          file=sys.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch recognition over audio files")
+    ap.add_argument("inputs", nargs="+", help="audio files or directories")
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--spotify", action="store_true", help="enrich matches with (cached) Spotify metadata")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# src/utils/scan_recording.py
+"""
+Identify every song in a long recording, one NDJSON line per timeline segment.
+
+    python src/utils/scan_recording.py broadcast.mp3 > timeline.ndjson
+    python src/utils/scan_recording.py set.flac --window 12 --hop 4
+
+Segments are printed as soon as they close. Throughput (× real-time), hashes
+and postings touched are printed to stderr when the scan finishes.
+"""
+import os, sys, json, time, argparse
+sys.path.append(os.path.abspath("."))
+
+from src.scan import SCAN_WINDOW, SCAN_HOP, SCAN_BLOCK, TimelineScanner, read_blocks
+from src.server.meta_cache import clean_title
+
+
+def fmt_time(sec):
+    h, rem = divmod(int(sec), 3600)
+    return f"{h:d}:{rem // 60:02d}:{rem % 60:02d}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Timeline identification over a long recording")
+    ap.add_argument("path", help="audio file (anything libsndfile or ffmpeg can read)")
+    ap.add_argument("--window", type=float, default=SCAN_WINDOW, help="seconds voted on together")
+    ap.add_argument("--hop", type=float, default=SCAN_HOP, help="seconds between windows (window must be a multiple)")
+    ap.add_argument("--block", type=float, default=SCAN_BLOCK, help="seconds of audio decoded per read")
+    args = ap.parse_args()
+
+    import src.server.api as api      # loads the index (flat / segments / shards / pickle)
+    inv = api.get_index()
+
+    scanner, t0 = None, time.time()
+
+    def emit(segments):
+        for start, end, sid, conf in segments:
+            meta = api.meta_by_id.get(sid, {})
+            print(json.dumps({"start": start, "end": end, "from": fmt_time(start), "to": fmt_time(end),
+                              "song_id": sid, "artist": meta.get("artist"),
+                              "title": clean_title(meta.get("title", "")), "confidence": conf},
+                             ensure_ascii=False), flush=True)
+
+    for block, sr in read_blocks(args.path, args.block):
+        if scanner is None:
+            scanner = TimelineScanner(inv, sr, args.window, args.hop)
+        emit(scanner.push(block))
+    if scanner is None:
+        print("⚠️ No audio.", file=sys.stderr)
+        return
+    emit(scanner.flush())
+
+    elapsed = time.time() - t0
+    audio = scanner.fp.seconds
+    print(f"✅ {fmt_time(audio)} of audio in {elapsed:.1f}s ({audio / max(elapsed, 1e-9):.1f}× real-time); "
+          f"{scanner.windows} windows, {scanner.hashes:,} hashes, {scanner.postings:,} postings",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# src/utils/update_index.py
+"""
+Incremental index maintenance (no full rebuild):
+
+    python src/utils/update_index.py init --base src/server/flat_index
+    python src/utils/update_index.py add "dataset/Artist/Title.wav" ...
+    python src/utils/update_index.py remove 12 57
+    python src/utils/update_index.py compact
+
+The API server picks up every change on its next request (see src/segments.py).
+`compact` can run at any time, e.g. from cron, while the server keeps serving.
+"""
+import os, sys, shutil, argparse
+sys.path.append(os.path.abspath("."))
+
+from src.segments import (
+    SEGMENTS_DIR, init_segments, read_manifest, add_segment, remove_songs, compact, segment_path
+)
+
+
+def add_songs(root, paths):
+    from src.index_constellation import index_shard   # heavy import (torch), only needed here
+
+    next_id = read_manifest(root)["next_song_id"]
+    songs = []
+    for path in paths:
+        artist = os.path.basename(os.path.dirname(os.path.abspath(path)))   # dataset/<artist>/<title>.wav
+        title = os.path.splitext(os.path.basename(path))[0]
+        songs.append((next_id + len(songs), artist, title, path))
+
+    inv, meta = index_shard(songs)
+    if not meta:
+        print("⚠️ Nothing to add (no peaks found).")
+        return
+    name = add_segment(root, inv, meta)
+    print(f"✅ Added {len(meta)} song(s) as segment {name} (ids {meta[0]['id']}..{meta[-1]['id']})")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Add/remove songs without rebuilding the index")
+    ap.add_argument("--root", default=SEGMENTS_DIR, help="segment directory (holds manifest.json)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("init", help="start a segment set from an existing flat index")
+    p.add_argument("--base", default="src/server/flat_index")
+    p = sub.add_parser("add", help="index WAV files into a new delta segment")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("remove", help="tombstone songs by id")
+    p.add_argument("ids", nargs="+", type=int)
+    sub.add_parser("compact", help="merge all segments and drop tombstoned songs")
+    args = ap.parse_args()
+
+    if args.cmd == "init":
+        init_segments(args.root, args.base)
+        print(f"✅ Segments initialised in {args.root} (base: {args.base})")
+    elif args.cmd == "add":
+        add_songs(args.root, args.paths)
+    elif args.cmd == "remove":
+        remove_songs(args.root, args.ids)
+        print(f"✅ Tombstoned {len(args.ids)} song(s)")
+    elif args.cmd == "compact":
+        name, old = compact(args.root)
+        print(f"✅ Compacted {len(old)} segment(s) → {name}")
+        for seg in old:
+            if not os.path.isabs(seg):   # never delete an external base index
+                # open mmaps in running servers stay valid on POSIX; elsewhere retry later
+                shutil.rmtree(segment_path(args.root, seg), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
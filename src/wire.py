@@ -0,0 +1,107 @@
+# src/wire.py
+"""
+Compact fingerprint wire format: a client sends its clip's (hash, frame) pairs
+instead of the audio, and the server goes straight to lookup + voting.
+
+    header (26 bytes, little-endian)
+        magic "SNFP", version u8, flags u8,
+        SR u32, N_FFT u16, HOP u16, FAN_VALUE u8, MIN_TDELTA u8, MAX_TDELTA u16,
+        PEAK_NEIGHBORHOOD u8, PEAKS_PER_FRAME u16 (0 = no cap), AMP_DB_MIN i8,
+        pair count u32
+    body (zlib-deflated when flags & FLAG_ZLIB)
+        hashes        u32[count]   packed (f1, f2, dt) keys, HASH_MODE = "int"
+        frame deltas  u16[count]   anchor frame minus the previous pair's (first: minus 0)
+
+Pairs are sorted by anchor frame, as hash_arrays_from_peaks emits them, so
+most deltas are 0 and deflate well: a 7 s clip is a few kB instead of the
+tens to hundreds of kB of compressed audio. The DSP parameters in the header
+must equal the server's (src/dsp.py); fingerprints computed with other
+settings would never line up with the index, so they are rejected.
+"""
+import struct, zlib
+import numpy as np
+
+import src.dsp as dsp
+
+MAGIC = b"SNFP"
+WIRE_VERSION = 1
+FLAG_ZLIB = 1
+HEADER = struct.Struct("<4sBBIHHBBHBHbI")
+MAX_PAIRS = 1 << 20         # decoder refuses larger fingerprints (~20 min of audio)
+
+
+class WireError(ValueError):
+    pass
+
+
+def wire_params():
+    """The DSP settings a fingerprint depends on, in header order."""
+    return (dsp.SR, dsp.N_FFT, dsp.HOP, dsp.FAN_VALUE, dsp.MIN_TDELTA, dsp.MAX_TDELTA,
+            dsp.PEAK_NEIGHBORHOOD, dsp.PEAKS_PER_FRAME or 0, int(dsp.AMP_DB_MIN))
+
+
+def encode_pairs(hashes, frames, compress=True):
+    """uint32 hashes + int anchor frames (sorted by frame) -> wire bytes."""
+    hashes = np.asarray(hashes, dtype=np.uint32)
+    frames = np.asarray(frames, dtype=np.int64)
+    if len(hashes) != len(frames):
+        raise ValueError("hashes and frames differ in length")
+    if len(hashes) > MAX_PAIRS:
+        raise ValueError(f"more than {MAX_PAIRS} pairs")
+    deltas = np.diff(frames, prepend=0)
+    if len(deltas) and (deltas.min() < 0 or deltas.max() > 0xFFFF):
+        raise ValueError("frames must be sorted, with gaps below 65536 frames")
+    body = hashes.astype("<u4").tobytes() + deltas.astype("<u2").tobytes()
+    if compress:
+        body = zlib.compress(body, 6)
+    return HEADER.pack(MAGIC, WIRE_VERSION, FLAG_ZLIB if compress else 0, *wire_params(), len(hashes)) + body
+
+
+def encode_audio(wav, sr, compress=True):
+    """Reference client: [C, T] audio -> wire bytes, through the indexer's own DSP path."""
+    if dsp.HASH_MODE != "int":
+        raise ValueError("the wire format carries packed integer hashes (HASH_MODE = 'int')")
+    peaks = dsp.peak_coords(dsp.spectrogram_db_from_tensor(wav, sr, keep_on_device=True))
+    return encode_pairs(*dsp.hash_arrays_from_peaks(peaks), compress=compress)
+
+
+def decode_pairs(data):
+    """Wire bytes -> (hashes uint32, anchor frames int64); WireError on anything malformed."""
+    if len(data) < HEADER.size:
+        raise WireError("truncated header")
+    magic, version, flags, *params, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise WireError("not a SONAR fingerprint")
+    if version != WIRE_VERSION:
+        raise WireError(f"unsupported version {version} (server speaks {WIRE_VERSION})")
+    if tuple(params) != wire_params():
+        raise WireError(f"DSP parameters {tuple(params)} differ from the server's {wire_params()}")
+    if count == 0:
+        raise WireError("empty fingerprint")
+    if count > MAX_PAIRS:
+        raise WireError(f"more than {MAX_PAIRS} pairs")
+    size = count * 6
+    body = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        d = zlib.decompressobj()
+        try:
+            # one byte of slack detects bodies longer than declared; max_length=0 would mean "no limit"
+            body = d.decompress(body, size + 1)
+        except zlib.error as e:
+            raise WireError(f"bad body: {e}") from e
+        if len(body) != size or d.unconsumed_tail or d.unused_data or not d.eof:
+            raise WireError("body does not match the pair count")
+    if len(body) != size:
+        raise WireError("body does not match the pair count")
+    hashes = np.frombuffer(body, dtype="<u4", count=count).astype(np.uint32)
+    frames = np.cumsum(np.frombuffer(body, dtype="<u2", offset=count * 4, count=count), dtype=np.int64)
+    dt = hashes & np.uint32((1 << dsp.DT_BITS) - 1)
+    if len(dt) and (dt.min() < dsp.MIN_TDELTA or dt.max() > dsp.MAX_TDELTA):
+        raise WireError("hash with a time delta outside MIN_TDELTA..MAX_TDELTA")
+    return hashes, frames
+
+
+def decode_qhashes(data):
+    """Wire bytes -> [(hash, t_sec)], the query form gather_postings takes."""
+    hashes, frames = decode_pairs(data)
+    return list(zip(hashes.tolist(), (frames * (dsp.HOP / dsp.SR)).tolist()))
@@ -0,0 +1,40 @@
+# tests/test_decode.py
+"""The in-process PyAV decoder returns the samples the ffmpeg subprocess path would."""
+import os, sys, io, shutil
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("soundfile")
+pytest.importorskip("av")
+
+import soundfile as sf
+
+from src.dsp import SR
+from src.server.decode import DecodeError, _decode_av, _decode_ffmpeg
+
+
+def wav_bytes(x):
+    buf = io.BytesIO()
+    sf.write(buf, x, SR, format="WAV", subtype="FLOAT")
+    return buf.getvalue()
+
+
+def test_av_decodes_mono_wav_exactly():
+    x = np.random.default_rng(0).uniform(-0.5, 0.5, SR).astype(np.float32)
+    wav = _decode_av(wav_bytes(x))
+    assert wav.shape == (1, SR) and wav.dtype == np.float32
+    np.testing.assert_allclose(wav[0], x, atol=1e-6)
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="needs ffmpeg")
+def test_av_matches_ffmpeg_subprocess():
+    # same libswresample downmix and resampling as the ffmpeg CLI path
+    x = np.random.default_rng(1).uniform(-0.5, 0.5, (SR, 2)).astype(np.float32)
+    np.testing.assert_allclose(_decode_av(wav_bytes(x)), _decode_ffmpeg(wav_bytes(x)), atol=1e-6)
+
+
+def test_av_rejects_garbage():
+    with pytest.raises(DecodeError):
+        _decode_av(b"definitely not audio" * 100)
@@ -0,0 +1,65 @@
+# tests/test_flat_index.py
+"""Packed postings round-trip; ensure_flat_index converts the pickle cache exactly once under concurrency."""
+import os, sys, gzip, time, pickle, warnings
+import multiprocessing as mp
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import src.flat_index as flat_index
+
+
+
+def test_pack_postings_wraps_silently_across_buckets():
+    # the second call starts a new bucket below the last packed value: the delta wraps, then is replaced
+    song_ids, frames = np.array([7, 7, 1, 1, 2]), np.array([40, 90, 3, 8, 0])
+    first = np.array([True, False, True, False, False])
+    prev = (9 << 8) | 200
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        packed, width, start, bits = flat_index.pack_postings(song_ids[2:], frames[2:], first[2:], frame_bits=8, prev=prev)
+    s, f = flat_index.unpack_postings(packed, width, start, bits, np.arange(3), np.array([3]))
+    assert s.tolist() == [1, 1, 2] and f.tolist() == [3, 8, 0]
+
+
+def write_cache(path):
+    inv = {k: np.array([[1, 0.5], [2, 1.0 + k]], dtype=np.float32) for k in (3, 5, 9)}
+    meta_by_id = {1: {"id": 1, "title": "a"}, 2: {"id": 2, "title": "b"}}
+    with gzip.open(path, "wb") as f:
+        pickle.dump({"inv": inv, "meta_by_id": meta_by_id}, f)
+
+
+def worker(cache_file, out_dir, barrier, results):
+    barrier.wait()
+    converted = flat_index.ensure_flat_index(cache_file, out_dir, timeout=30)
+    results.put((converted, os.path.exists(os.path.join(out_dir, "header.json")), time.time()))
+
+
+@pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="needs fork to share the slowed-down converter")
+def test_concurrent_ensure_converts_once(tmp_path, monkeypatch):
+    cache_file, out_dir = str(tmp_path / "cache.pkl.gz"), str(tmp_path / "flat_index")
+    write_cache(cache_file)
+    load = flat_index.load_pickle_cache
+
+    def slow_load(path):
+        time.sleep(0.5)                     # hold the lock long enough for the other worker to queue
+        return load(path)
+
+    monkeypatch.setattr(flat_index, "load_pickle_cache", slow_load)
+    ctx = mp.get_context("fork")
+    barrier, results = ctx.Barrier(2), ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(cache_file, out_dir, barrier, results)) for _ in range(2)]
+    for p in procs:
+        p.start()
+    out = sorted(results.get(timeout=30) for _ in procs)
+    for p in procs:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+
+    (waited, waited_saw_index, _), (converted, _, _) = out
+    assert (waited, converted) == (False, True)     # exactly one conversion
+    assert waited_saw_index                         # the other returned only once the index existed
+    inv, meta = flat_index.load_flat_index(out_dir)
+    assert len(inv) == 3 and set(meta) == {1, 2}
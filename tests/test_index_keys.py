@@ -0,0 +1,44 @@
+# tests/test_index_keys.py
+"""Index keys follow dsp.HASH_MODE, and an index built under the other mode is refused."""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+pytest.importorskip("scipy")
+
+import src.dsp as dsp
+
+
+def test_json_keys_follow_hash_mode(monkeypatch):
+    assert dsp.json_hash_keys({"7": 1, "4294967295": 2}) == {7: 1, 4294967295: 2}
+    monkeypatch.setattr(dsp, "HASH_MODE", "sha1")
+    digits = "12345678901234567890"               # a sha1 prefix can be all digits
+    assert dsp.json_hash_keys({digits: 1, "0123456789abcdef0123": 2}) == {digits: 1, "0123456789abcdef0123": 2}
+
+
+def test_json_keys_from_other_mode_fail(monkeypatch):
+    with pytest.raises(ValueError, match="rebuild"):
+        dsp.json_hash_keys({"0123456789abcdef0123": 1})
+    monkeypatch.setattr(dsp, "HASH_MODE", "sha1")
+    with pytest.raises(ValueError, match="rebuild"):
+        dsp.json_hash_keys({"7": 1})
+
+
+def tiny_index(out_dir, hex_keys=False):
+    from src.flat_index import write_flat_index
+    key = (lambda k: f"{k:020x}") if hex_keys else int
+    inv = {key(k): [[1, 0.5], [2, 1.0]] for k in (3, 5, 9)}
+    write_flat_index(str(out_dir), inv, {1: {"id": 1, "title": "a"}, 2: {"id": 2, "title": "b"}})
+    return str(out_dir)
+
+
+def test_flat_index_key_type_checked_on_load(tmp_path, monkeypatch):
+    from src.flat_index import load_flat_index
+    inv, meta = load_flat_index(tiny_index(tmp_path / "int"))
+    assert len(inv) == 3 and set(meta) == {1, 2}
+    with pytest.raises(ValueError, match="rebuild"):
+        load_flat_index(tiny_index(tmp_path / "sha1", hex_keys=True))
+    monkeypatch.setattr(dsp, "HASH_MODE", "sha1")
+    with pytest.raises(ValueError, match="rebuild"):
+        load_flat_index(str(tmp_path / "int"))
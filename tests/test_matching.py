@@ -0,0 +1,86 @@
+# tests/test_matching.py
+"""Batched lookup and two-stage alignment give the same votes / best song as the single-clip paths."""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from src.dsp import (
+    HOP, SR, gather_postings, gather_postings_batch, song_alignments, candidate_alignments, pick_best,
+)
+from src.flat_index import write_flat_index, load_flat_index
+
+
+def random_inv(rng, n_keys=400, n_songs=30):
+    """{hash: [[song_id, t_sec], ...]} with bucket sizes from 1 to ~60; times on the STFT frame grid."""
+    inv = {}
+    for h in rng.choice(2 ** 32 - 1, n_keys, replace=False).tolist():
+        n = int(rng.integers(1, 60))
+        inv[h] = np.column_stack((rng.integers(0, n_songs, n), rng.integers(0, 5000, n) * HOP / SR))
+    return inv
+
+
+def random_clips(rng, inv, n_clips=6):
+    keys = list(inv)
+    clips = []
+    for _ in range(n_clips):
+        hs = [keys[i] for i in rng.integers(0, len(keys), 80)] + [int(k) for k in rng.integers(0, 2 ** 32 - 1, 20)]
+        clips.append([(h, int(rng.integers(0, 400)) * HOP / SR) for h in hs])
+    clips.append([])                                    # an empty clip keeps its slot
+    return clips
+
+
+def sorted_votes(sids, offs):
+    order = np.lexsort((offs, sids))
+    return sids[order].tolist(), offs[order].tolist()
+
+
+@pytest.fixture(params=["dict", "flat"])
+def inv(request, tmp_path):
+    mem = random_inv(np.random.default_rng(1))
+    if request.param == "dict":
+        return mem
+    write_flat_index(str(tmp_path), mem, {i: {"id": i} for i in range(30)})
+    return load_flat_index(str(tmp_path))[0]
+
+
+@pytest.mark.parametrize("budget", [0, 500])
+def test_batch_matches_single_clip(inv, budget):
+    clips = random_clips(np.random.default_rng(2), random_inv(np.random.default_rng(1)))
+    batch = gather_postings_batch(inv, clips, budget=budget)
+    assert len(batch) == len(clips)
+    for q, (sids, offs) in zip(clips, batch):
+        assert sorted_votes(sids, offs) == sorted_votes(*gather_postings(inv, q, budget=budget))
+
+
+def planted_votes(rng, n_songs=200, n_votes=20000, true_song=17, true_hits=400):
+    """Uniform noise votes plus true_hits votes for true_song at one offset (+-1 frame jitter)."""
+    sids = np.r_[rng.integers(0, n_songs, n_votes), np.full(true_hits, true_song)]
+    offs = np.r_[rng.integers(-300, 3000, n_votes), 1234 + rng.integers(-1, 2, true_hits)]
+    return sids.astype(np.int64), offs.astype(np.int64)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("weighted", [False, True])
+def test_candidate_alignments_equivalence(seed, weighted):
+    rng = np.random.default_rng(seed)
+    sids, offs = planted_votes(rng, true_hits=int(rng.integers(5, 400)))
+    counts = rng.integers(1, 4, len(sids)) if weighted else None
+    full = song_alignments(sids, offs, counts)
+
+    # no early exit, no candidate cap: identical per-song alignments
+    exact = candidate_alignments(sids, offs, counts, top_n=0, early_exit=0)
+    for a, b in zip(exact, full):
+        np.testing.assert_array_equal(a, b)
+
+    # early exit at 1x: fewer songs aligned, same winner
+    fast = candidate_alignments(sids, offs, counts, top_n=0, early_exit=1.0)
+    assert set(fast[0].tolist()) <= set(full[0].tolist())
+    assert pick_best(*fast) == pick_best(*full)
+
+
+def test_candidate_alignments_empty():
+    empty = np.empty(0, dtype=np.int64)
+    assert all(len(x) == 0 for x in candidate_alignments(empty, empty))
@@ -0,0 +1,108 @@
+# tests/test_meta_cache.py
+"""MetadataCache against a stub Spotify (httpx.MockTransport): TTL expiry, LRU bound, deduplicated misses."""
+import os, sys, asyncio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("dotenv")
+
+from src.server.meta_cache import MetadataCache
+
+
+class StubSpotify:
+    """Answers the token and search endpoints, counting the searches per title."""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.searches = {}
+        self.tokens = 0
+
+    async def __call__(self, request):
+        await asyncio.sleep(self.delay)         # keep concurrent misses overlapping
+        if request.method == "POST":
+            self.tokens += 1
+            return httpx.Response(200, json={"access_token": "stub-token", "expires_in": 3600})
+        title = request.url.params["q"].split("track:")[1].split(" artist:")[0]
+        self.searches[title] = self.searches.get(title, 0) + 1
+        return httpx.Response(200, json={"tracks": {"items": [{
+            "name": title, "artists": [{"name": "Synthetic"}], "popularity": 42,
+            "preview_url": None, "external_urls": {"spotify": f"https://open.spotify.com/track/{title}"},
+            "album": {"name": f"{title} album", "images": [], "release_date": "2020-01-01"},
+        }]}})
+
+
+def song(sid):
+    return {"id": sid, "artist": "Synthetic", "title": f"song_{sid}.wav"}
+
+
+def make_cache(tmp_path, **kw):
+    stub = StubSpotify()
+    return stub, MetadataCache(db_path=str(tmp_path / "meta.sqlite"), transport=httpx.MockTransport(stub), **kw)
+
+
+def test_concurrent_misses_share_one_fetch(tmp_path):
+    stub, cache = make_cache(tmp_path)
+
+    async def run():
+        try:
+            return await asyncio.gather(*(cache.get(song(1)) for _ in range(20)))
+        finally:
+            await cache.close()
+
+    results = asyncio.run(run())
+    assert stub.searches == {"song_1": 1}
+    assert stub.tokens == 1
+    assert all(r["album"] == "song_1 album" for r in results)
+    assert cache.counts["inflight_joins"] == 19
+
+
+def test_ttl_expiry_refetches(tmp_path):
+    stub, cache = make_cache(tmp_path, ttl=0.2)
+
+    async def run():
+        try:
+            await cache.get(song(1))
+            await cache.get(song(1))                # memory hit
+            await asyncio.sleep(0.3)
+            await cache.get(song(1))                # expired in memory and on disk
+        finally:
+            await cache.close()
+
+    asyncio.run(run())
+    assert stub.searches == {"song_1": 2}
+    assert cache.counts["mem_hits"] == 1
+
+
+def test_lru_bound_falls_back_to_disk(tmp_path):
+    stub, cache = make_cache(tmp_path, mem_entries=2)
+
+    async def run():
+        try:
+            for sid in (1, 2, 3):
+                await cache.get(song(sid))
+            assert list(cache.mem) == [2, 3]        # song 1 evicted from memory
+            meta = await cache.get(song(1))         # served from SQLite, no new fetch
+            assert meta["album"] == "song_1 album"
+            assert list(cache.mem) == [3, 1]
+        finally:
+            await cache.close()
+
+    asyncio.run(run())
+    assert stub.searches == {"song_1": 1, "song_2": 1, "song_3": 1}
+    assert cache.counts["db_hits"] == 1
+
+
+def test_entries_are_read_only(tmp_path):
+    stub, cache = make_cache(tmp_path)
+
+    async def run():
+        try:
+            return await cache.get(song(1))
+        finally:
+            await cache.close()
+
+    meta = asyncio.run(run())
+    with pytest.raises(TypeError):
+        meta["album"] = "changed"